@@ -0,0 +1,282 @@
+"""
+Bulk Ingest - Validate and insert many rows of a table per request
+Rows are checked column by column against the table's Create model and inserted in chunks, with errors reported per row
+"""
+import asyncio
+import io
+import json
+import typing
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+import logging
+
+from app.core.config import settings
+from app.core.database_layer import TABLE_NATURAL_KEYS, UPSERT_KEY_COLUMN, upsert_key
+
+logger = logging.getLogger(__name__)
+
+# Row errors listed in a response; the failed count always covers all of them
+MAX_REPORTED_ERRORS = 1000
+
+BOOL_VALUES = {
+    'true': True, 't': True, 'yes': True, 'y': True, '1': True, '1.0': True,
+    'false': False, 'f': False, 'no': False, 'n': False, '0': False, '0.0': False,
+}
+
+def read_json_rows(body: bytes) -> pd.DataFrame:
+    """Rows from a JSON array of objects, or an object holding one under "rows" """
+    payload = json.loads(body)
+    if isinstance(payload, dict):
+        payload = payload.get('rows')
+    if not isinstance(payload, list) or not all(isinstance(row, dict) for row in payload):
+        raise ValueError('Expected a JSON array of row objects, or {"rows": [...]}')
+    return pd.DataFrame.from_records(payload)
+
+def read_csv_rows(content: bytes) -> pd.DataFrame:
+    """Rows of a CSV with a header line, every cell read as text"""
+    try:
+        return pd.read_csv(io.BytesIO(content), dtype=str, skipinitialspace=True)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+def _kind(annotation) -> type:
+    # Optional[X] -> X
+    args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+    return args[0] if args else annotation
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return value
+
+def _text(values: pd.Series) -> pd.Series:
+    return values.astype(str).str.strip()
+
+def _to_str(values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    return _text(values), np.zeros(len(values), dtype=bool)
+
+def _to_int(values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    numbers = pd.to_numeric(values, errors='coerce')
+    invalid = (numbers.isna() | (numbers != np.floor(numbers))).to_numpy()
+    return numbers.where(~invalid).round().astype('Int64'), invalid
+
+def _to_number(values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    numbers = pd.to_numeric(values, errors='coerce').astype('float64')
+    return numbers, ~np.isfinite(numbers.to_numpy())
+
+def _to_bool(values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    flags = _text(values).str.lower().map(BOOL_VALUES)
+    return flags, flags.isna().to_numpy()
+
+def _to_date(values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    parsed = pd.to_datetime(_text(values), errors='coerce', format='ISO8601')
+    return parsed.dt.strftime('%Y-%m-%d'), parsed.isna().to_numpy()
+
+def _to_time(values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    text = _text(values)
+    parsed = pd.to_datetime(text, errors='coerce', format='%H:%M:%S')
+    parsed = parsed.fillna(pd.to_datetime(text, errors='coerce', format='%H:%M'))
+    return parsed.dt.strftime('%H:%M:%S'), parsed.isna().to_numpy()
+
+def _to_datetime(values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    parsed = pd.to_datetime(_text(values), errors='coerce', format='ISO8601', utc=True)
+    return parsed.map(lambda ts: ts.isoformat() if not pd.isna(ts) else None), parsed.isna().to_numpy()
+
+# Column converter and error message for each field type the Create models use
+CONVERTERS = {
+    str: (_to_str, 'Not text'),
+    int: (_to_int, 'Not a whole number'),
+    Decimal: (_to_number, 'Not a number'),
+    float: (_to_number, 'Not a number'),
+    bool: (_to_bool, 'Not true/false'),
+    date: (_to_date, 'Not a date (YYYY-MM-DD)'),
+    time: (_to_time, 'Not a time (HH:MM[:SS])'),
+    datetime: (_to_datetime, 'Not a date and time (ISO 8601)'),
+}
+
+def validate_rows(df: pd.DataFrame, model: typing.Type[BaseModel]) -> Tuple[pd.DataFrame, np.ndarray, List[Tuple[np.ndarray, str, str]], List[str]]:
+    """Coerce a frame of raw rows to model's fields, one column at a time
+
+    Returns the valid rows as JSON-ready columns, their positions in df, the
+    errors as (row positions, field, message) per failing check, and the
+    columns model has no field for. Blank cells count as missing: required
+    fields then fail, others take the model default. A required column absent
+    altogether is a ValueError for the whole request.
+    """
+    fields = model.model_fields
+    missing_columns = [name for name, field in fields.items() if field.is_required() and name not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+    ignored = [str(column) for column in df.columns if column not in fields]
+
+    n = len(df)
+    invalid = np.zeros(n, dtype=bool)
+    errors = []
+    columns = {}
+
+    for name, field in fields.items():
+        default = None if field.is_required() else _json_value(field.default)
+        if name not in df.columns:
+            if default is not None:
+                columns[name] = pd.Series([default] * n, dtype=object)
+            continue
+
+        raw = df[name].reset_index(drop=True)
+        missing = (raw.isna() | (raw.astype(str).str.strip() == '')).to_numpy()
+        present = np.flatnonzero(~missing)
+
+        convert, message = CONVERTERS[_kind(field.annotation)]
+        values, bad = convert(raw.iloc[present])
+        column = pd.Series(None, index=raw.index, dtype=object)
+        column.iloc[present] = values.astype(object).to_numpy()
+
+        if bad.any():
+            errors.append((present[bad], name, message))
+            invalid[present[bad]] = True
+        if missing.any():
+            if field.is_required():
+                errors.append((np.flatnonzero(missing), name, 'Field required'))
+                invalid |= missing
+            else:
+                column[missing] = default
+        columns[name] = column
+
+    positions = np.flatnonzero(~invalid)
+    clean = pd.DataFrame(columns, index=pd.RangeIndex(n)).iloc[positions]
+    return clean, positions, errors, ignored
+
+async def insert_rows(db, table: str, records: List[Dict[str, Any]], rows: np.ndarray,
+                      upsert: bool = False) -> Tuple[int, List[Tuple[np.ndarray, Optional[str], str]]]:
+    """Insert (or upsert) records in chunks, several requests at a time; returns the written count and failed rows
+
+    A chunk the database rejects is split in halves and retried, down to the
+    single rows it objects to. When both halves of a chunk fail, the fault is
+    more likely the request than any one row, so the whole chunk is reported.
+    Upserted records must have distinct upsert keys, so that concurrent chunks
+    never touch the same row.
+    """
+    semaphore = asyncio.Semaphore(max(settings.bulk_insert_concurrency, 1))
+    write = db.upsert_records if upsert else db.insert_records
+
+    async def attempt(start: int, stop: int) -> Optional[str]:
+        try:
+            async with semaphore:
+                await write(table, records[start:stop])
+            return None
+        except Exception as e:
+            return str(e)
+
+    async def insert(start: int, stop: int, error: Optional[str] = None):
+        if error is None:
+            error = await attempt(start, stop)
+            if error is None:
+                return stop - start, []
+        if stop - start == 1:
+            return 0, [(rows[start:stop], None, error)]
+
+        mid = (start + stop) // 2
+        halves = [(start, mid), (mid, stop)]
+        half_errors = await asyncio.gather(*(attempt(a, b) for a, b in halves))
+        if all(half_error is not None for half_error in half_errors):
+            return 0, [(rows[start:stop], None, error)]
+
+        inserted, failures = 0, []
+        for (a, b), half_error in zip(halves, half_errors):
+            if half_error is None:
+                inserted += b - a
+            else:
+                count, half_failures = await insert(a, b, half_error)
+                inserted += count
+                failures.extend(half_failures)
+        return inserted, failures
+
+    chunk_rows = max(settings.bulk_insert_chunk_rows, 1)
+    results = await asyncio.gather(*(
+        insert(start, min(start + chunk_rows, len(records))) for start in range(0, len(records), chunk_rows)
+    ))
+    return sum(count for count, _ in results), [failure for _, failures in results for failure in failures]
+
+def check_upsert_keys(df: pd.DataFrame, table: str):
+    """Refuse to upsert rows without an external_id into a table that has no natural key
+
+    Such a row matches nothing, so a re-upload would add it again rather than
+    replace it. Raises ValueError for the whole request, before anything is written.
+    """
+    if table in TABLE_NATURAL_KEYS:
+        return
+    if UPSERT_KEY_COLUMN in df.columns:
+        raw = df[UPSERT_KEY_COLUMN]
+        missing = int((raw.isna() | (raw.astype(str).str.strip() == '')).sum())
+    else:
+        missing = len(df)
+    if missing:
+        raise ValueError(
+            f"Rows upserted into {table} need an {UPSERT_KEY_COLUMN}, as it has no natural key; {missing} have none"
+        )
+
+def _last_per_key(clean: pd.DataFrame, table: str) -> np.ndarray:
+    # Mask of the rows no later row repeats the upsert key of; missing values count as equal
+    keys = [column for column in upsert_key(table) if column in clean.columns]
+    return ~clean.duplicated(subset=keys, keep='last').to_numpy()
+
+async def ingest_chunk(db, table: str, model: typing.Type[BaseModel], df: pd.DataFrame,
+                       row_numbers: Optional[np.ndarray] = None,
+                       upsert: bool = False) -> Tuple[int, int, List[Tuple[np.ndarray, Optional[str], str]], List[str]]:
+    """Validate and write one frame of raw rows; returns the written and superseded counts, errors and ignored columns
+
+    Errors name rows by row_numbers, the numbers of df's rows in the whole upload
+    when df is one chunk of it; by default their positions in df. With upsert,
+    rows whose upsert key (see upsert_key) already exists are updated, and of
+    rows sharing a key only the last is written; the others count as superseded.
+    """
+    if upsert:
+        check_upsert_keys(df, table)
+    clean, positions, errors, ignored = await asyncio.to_thread(validate_rows, df, model)
+
+    clean.insert(0, 'user_id', db.user_id)
+    superseded = 0
+    if upsert:
+        last = _last_per_key(clean, table)
+        superseded = int((~last).sum())
+        clean, positions = clean[last], positions[last]
+    records = clean.astype(object).where(clean.notna(), None).to_dict('records')
+
+    written, failures = await insert_rows(db, table, records, positions, upsert)
+    errors.extend(failures)
+    if row_numbers is not None:
+        errors = [(row_numbers[rows], field, message) for rows, field, message in errors]
+    return written, superseded, errors, ignored
+
+def ingest_summary(table: str, received: int, inserted: int, errors: List[Tuple[np.ndarray, Optional[str], str]],
+                   ignored: List[str], superseded: int = 0) -> Dict[str, Any]:
+    """Response body of a bulk insert, listing at most MAX_REPORTED_ERRORS row errors"""
+    failed_rows = np.unique(np.concatenate([rows for rows, _, _ in errors])) if errors else np.zeros(0, dtype='int64')
+    total_errors = sum(len(rows) for rows, _, _ in errors)
+    listed = sorted(
+        ((int(row), field, message) for rows, field, message in errors for row in rows[:MAX_REPORTED_ERRORS]),
+        key=lambda error: error[0]
+    )[:MAX_REPORTED_ERRORS]
+
+    logger.info(f"Bulk insert into {table}: {inserted} of {received} rows inserted, {len(failed_rows)} failed")
+    return {
+        'table': table,
+        'received': received,
+        'inserted': inserted,
+        'failed': len(failed_rows),
+        'superseded': superseded,
+        'ignored_columns': ignored,
+        'errors': [{'row': row, 'field': field, 'error': message} for row, field, message in listed],
+        'errors_truncated': total_errors > len(listed),
+    }
+
+async def ingest_rows(db, table: str, model: typing.Type[BaseModel], df: pd.DataFrame,
+                      upsert: bool = False) -> Dict[str, Any]:
+    """Validate a frame of raw rows against model and insert (or upsert) the valid ones for db's user"""
+    inserted, superseded, errors, ignored = await ingest_chunk(db, table, model, df, upsert=upsert)
+    return ingest_summary(table, len(df), inserted, errors, ignored, superseded)
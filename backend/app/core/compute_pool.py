@@ -0,0 +1,178 @@
+"""
+Compute Pool - CPU-bound analysis steps in worker processes, off the API event loop
+Input frames travel to the workers as Arrow IPC buffers in shared memory; concurrency is bounded and tasks time out
+"""
+import asyncio
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import pandas as pd
+import pyarrow as pa
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Frames Arrow can't represent, such as object columns mixing numbers and strings
+_ARROW_ERRORS = (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError)
+
+class ComputePoolError(RuntimeError):
+    """A pooled task was lost with the worker process running it"""
+
+class ComputeTimeoutError(ComputePoolError, TimeoutError):
+    """A pooled task ran past the timeout; its worker was terminated to stop it"""
+
+def _to_ipc(df: pd.DataFrame) -> Optional[pa.Buffer]:
+    # None when the frame has to be pickled instead
+    try:
+        table = pa.Table.from_pandas(df)
+    except _ARROW_ERRORS:
+        return None
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def _from_ipc(buffer) -> pd.DataFrame:
+    return pa.ipc.open_stream(pa.py_buffer(buffer)).read_all().to_pandas()
+
+def _share_frames(frames: Dict[str, pd.DataFrame]) -> Tuple[shared_memory.SharedMemory, Dict[str, Tuple[int, int, Optional[pd.DataFrame]]]]:
+    """One shared memory block holding every frame's IPC stream, and where each one is"""
+    buffers = {key: _to_ipc(df) for key, df in frames.items()}
+    size = sum(buffer.size for buffer in buffers.values() if buffer is not None)
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    layout, offset = {}, 0
+    try:
+        for key, buffer in buffers.items():
+            if buffer is None:
+                layout[key] = (0, 0, frames[key])
+                continue
+            shm.buf[offset:offset + buffer.size] = memoryview(buffer).cast('B')
+            layout[key] = (offset, buffer.size, None)
+            offset += buffer.size
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, layout
+
+def _run_task(fn: Callable, shm_name: str, layout: Dict[str, Tuple[int, int, Optional[pd.DataFrame]]],
+              args: Tuple) -> Tuple[Any, Any]:
+    """Worker side: rebuild the frames, run fn and send its frame back as IPC where possible"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # Numeric columns come out of Arrow zero-copy, so each stream is copied out first:
+        # frames that pinned the block would keep it from closing, and be read-only
+        frames = {
+            key: frame if frame is not None else _from_ipc(bytes(shm.buf[offset:offset + size]))
+            for key, (offset, size, frame) in layout.items()
+        }
+    finally:
+        shm.close()
+
+    result, extra = fn(frames, *args)
+    buffer = _to_ipc(result)
+    return (buffer.to_pybytes() if buffer is not None else result), extra
+
+def _warm_up(modules: Tuple[str, ...]) -> int:
+    # Pays a spawned worker's imports up front instead of out of the first task's timeout
+    for module in modules:
+        importlib.import_module(module)
+    return 0
+
+class ComputePool:
+    """Process pool for (frame, extra) returning computations over a dict of input frames
+
+    Each of the max_workers workers is a single-process executor of its own, held
+    by one task at a time; other tasks wait without blocking the event loop. A
+    running task can't be cancelled, so one that times out has its worker
+    terminated and replaced, while the tasks on the other workers carry on.
+    With max_workers 0 tasks run on a thread of the API process instead.
+    """
+
+    def __init__(self, max_workers: int, timeout_seconds: float):
+        self.max_workers = max_workers
+        self.timeout_seconds = timeout_seconds
+        self._semaphore = asyncio.Semaphore(max(max_workers, 1))
+        self._idle: List[ProcessPoolExecutor] = []
+        self._busy: Set[ProcessPoolExecutor] = set()
+        self._preload: Tuple[str, ...] = ()
+
+    async def _spawn(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked: the API process runs threads (query pool, event loop)
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        await asyncio.get_running_loop().run_in_executor(executor, _warm_up, self._preload)
+        return executor
+
+    async def start(self, preload: Tuple[str, ...] = ()):
+        """Spawn the workers and import preload in each, so tasks don't wait on process startup"""
+        self._preload = preload
+        if self.max_workers <= 0:
+            return
+        missing = self.max_workers - len(self._idle) - len(self._busy)
+        self._idle.extend(await asyncio.gather(*(self._spawn() for _ in range(missing))))
+
+    @staticmethod
+    def _terminate(executor: ProcessPoolExecutor):
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    async def run(self, fn: Callable, frames: Dict[str, pd.DataFrame], *args) -> Tuple[pd.DataFrame, Any]:
+        """Run fn(frames, *args) -> (frame, extra) in a worker process"""
+        if self.max_workers <= 0:
+            return await asyncio.to_thread(fn, frames, *args)
+
+        async with self._semaphore:
+            # Encoding and decoding are CPU work too; they run off the event loop
+            shm, layout = await asyncio.to_thread(_share_frames, frames)
+            try:
+                # The semaphore leaves a worker for every holder; one is spawned if none is idle,
+                # on the first tasks or after a worker was lost
+                executor = self._idle.pop() if self._idle else await self._spawn()
+                self._busy.add(executor)
+                future, healthy = None, False
+                try:
+                    future = asyncio.get_running_loop().run_in_executor(
+                        executor, _run_task, fn, shm.name, layout, args
+                    )
+                    result, extra = await asyncio.wait_for(future, self.timeout_seconds)
+                    healthy = True
+                except asyncio.TimeoutError:
+                    logger.error(f"{fn.__name__} exceeded {self.timeout_seconds}s; terminating its worker")
+                    raise ComputeTimeoutError(f"Computation exceeded {self.timeout_seconds}s")
+                except BrokenProcessPool as e:
+                    logger.error(f"Worker running {fn.__name__} died; replacing it")
+                    raise ComputePoolError(f"Compute worker died running {fn.__name__}") from e
+                except BaseException:
+                    # fn's own errors come back from a worker that is still fine
+                    healthy = future is not None and future.done() and not future.cancelled()
+                    raise
+                finally:
+                    self._busy.discard(executor)
+                    if healthy:
+                        self._idle.append(executor)
+                    else:
+                        self._terminate(executor)
+            finally:
+                shm.close()
+                shm.unlink()
+
+        if isinstance(result, bytes):
+            result = await asyncio.to_thread(_from_ipc, result)
+        return result, extra
+
+    def shutdown(self):
+        for executor in [*self._idle, *self._busy]:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._idle.clear()
+        self._busy.clear()
+
+# Global pool shared by all requests of this API process
+compute_pool = ComputePool(settings.compute_pool_workers, settings.compute_timeout_seconds)
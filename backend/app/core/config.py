@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 import logging
 
 # Configure logging
@@ -8,6 +8,9 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+# Cost allocation engines; a setting outside these fails at startup
+AllocationMode = Literal["topological", "sparse", "reciprocal"]
+
 class Settings(BaseSettings):
     # Supabase Configuration
     supabase_url: str
@@ -21,6 +24,38 @@ class Settings(BaseSettings):
     
     # Database Configuration
     database_url: Optional[str] = None
+    db_load_max_workers: int = 12
+    db_page_size: int = 1000
+    # Rows per insert request of the bulk endpoints, and how many such requests run at once
+    bulk_insert_chunk_rows: int = 5000
+    bulk_insert_concurrency: int = 4
+    # Rows read from an uploaded workbook or CSV sheet at a time
+    sheet_upload_chunk_rows: int = 20000
+    
+    # Local snapshot cache of tenant tables; disabled when unset
+    snapshot_cache_dir: Optional[str] = None
+    
+    # Cost allocation engine: "topological" (notebook logic), "sparse" or "reciprocal"
+    allocation_mode: AllocationMode = "topological"
+    
+    # In-process cache of computed cost-analysis results
+    result_cache_max_bytes: int = 256 * 1024 * 1024
+    result_cache_ttl_seconds: int = 900
+    # Patch cached results in place after single expense / HR row edits instead of recomputing
+    incremental_allocation: bool = True
+    
+    # Persisted cost-centre -> service allocation matrices per user and period; disabled when unset
+    allocation_matrix_dir: Optional[str] = None
+    
+    # Worker processes for the CPU-bound analysis steps; 0 runs them on a thread of the API process
+    compute_pool_workers: int = 2
+    compute_timeout_seconds: float = 300
+    
+    # Background jobs: concurrent jobs per API process and how long finished jobs and results are kept
+    job_workers: int = 2
+    job_retention_seconds: int = 3600
+    # SQLite file sharing job status and results between the API processes; in memory when unset
+    job_store_path: Optional[str] = None
     
     class Config:
         env_file = ".env"
@@ -2,52 +2,427 @@
 Database Layer - Responsible for loading all required sheets/tables from the database
 Replaces direct Excel/Jupyter loading with database queries returning DataFrames
 """
+import asyncio
+import calendar
+import operator
+import re
 import pandas as pd
-from typing import Optional, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
 from app.core.database import get_supabase_client
 from app.core.config import settings
+from app.core.schema import coerce_frame
+from app.core.snapshot_cache import SnapshotCache
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Bill-wise variable cost columns carried through to the cost analysis output
+VARIABLE_COST_COLUMNS = [
+    'pharmacy_charged_to_patient',
+    'medical_surgical_consumables_charged_to_patient',
+    'implants_and_prosthetics_charged_to_patient',
+    'non_medical_consumables_charged_to_patient',
+    'fee_for_service',
+    'incentives_to_consultants_treating_doctors',
+    'patient_food_beverages_outsource_service',
+    'laboratory_test_outsource_service',
+    'any_other_patient_related_outsourced_services_1',
+    'any_other_patient_related_outsourced_services_2',
+    'any_other_patient_related_outsourced_services_3',
+    'brokerage_commission',
+    'provision_for_deduction_bad_debts'
+]
+
+# Numeric driver columns of the secondary cost driver sheet
+SECONDARY_COST_DRIVER_COLUMNS = [
+    'nursing_hostel_occupancy', 'doctors_hostel_occupancy', 'staff_accomodation_occupancy',
+    'frequency_of_audit', 'no_of_it_users', 'no_of_transaction_in_finance_billing_cost_centre',
+    'no_of_trips_km', 'no_of_laboratory_test', 'no_of_sample_collected_report_dispatch',
+    'no_of_home_sample_collection', 'no_of_radiology_test', 'no_of_neuro_test',
+    'no_of_cardiac_test', 'no_of_nuclear_medicine_test', 'no_of_ivf_consultation',
+    'ot_time_hours', 'ccu_occupancy', 'micu_occupancy', 'picu_occupancy',
+    'nicu_occupancy', 'hdu_occupancy', 'issolation_room_occupancy', 'gw_occupancy',
+    'pw_sr_occupancy', 'sw_ts_occupancy', 'dw_occupancy', 'head_office',
+    'other_unit_1_allocation_ratio', 'other_unit_2_allocation_ratio',
+    'other_unit_3_allocation_ratio', 'other_unit_4_allocation_ratio',
+    'other_unit_5_allocation_ratio', 'no_of_patient_op_ip',
+    'no_of_corporate_patient_op_ip', 'no_of_institutional_patient_op_ip',
+    'no_of_international_patient_op_ip', 'no_of_ip_patients',
+    'no_of_credit_ip_patients', 'surgical_store_issue_ratio',
+    'central_store_issue_ratio', 'non_surgical_store_issue_ratio',
+    'stationery_housekeeping_issue_ratio', 'no_of_doctors',
+    'doctor_fee_for_service_ratio', 'consultant_retainer_fee_mg_bonus_ratio',
+    'no_of_nursing_staff', 'nursing_station_1_for_care_units',
+    'nursing_station_2_for_care_units', 'nursing_station_3_for_care_units',
+    'nursing_station_4_for_care_units', 'nursing_station_5_for_care_units',
+    'service_under_op_billing_1', 'service_under_op_billing_2',
+    'service_under_op_billing_3', 'service_under_op_billing_4',
+    'brokerage_commission', 'no_of_cssd_set_issued', 'no_of_diet_served',
+    'no_of_ward_boy', 'no_of_housekeeping_staff',
+    'no_of_fumigation_cycle_performed_standard_resource_allocation_ratio',
+    'volume_of_cloth_load', 'efforts_of_supply_chain_department',
+    'area_in_sq_meter', 'no_of_security_staff_deployed_no_of_exits',
+    'actual_water_utilization_standard_utilization_ratio',
+    'actual_gas_utilization_standard_utilization_ratio',
+    'actual_vaccume_utilization_standard_utilization_ratio'
+]
+
+# Filter keys each table can answer, mapped onto the table's own column
+TABLE_FILTER_COLUMNS = {
+    'service_register': {
+        'month': 'month',
+        'department': 'service_department',
+        'service_name': 'service_name',
+        'patient_type': 'patient_type'
+    },
+    'variable_cost_bill_wise': {'service_name': 'service_name', 'patient_type': 'patient_type'},
+    'hr_data': {'department': 'department'},
+    'occupancy_register': {'service_name': 'service_name'},
+    'ot_register': {'service_name': 'service_name'}
+}
+
+# Date column that year / month / start_date / end_date filters translate onto
+TABLE_DATE_COLUMNS = {
+    'service_register': 'service_date',
+    'occupancy_register': 'date_of_final_bill',
+    'ot_register': 'service_date',
+    'consumption_data': 'transaction_date'
+}
+
+PERIOD_FILTER_KEYS = ('month', 'year', 'start_date', 'end_date')
+
+# Natural key of the tables whose registers hold one row per key, as in the unique
+# indexes upserts resolve conflicts on
+TABLE_NATURAL_KEYS = {
+    'service_register': ('user_id', 'bill_no', 'service_name', 'service_date'),
+    'trial_balance': ('user_id', 'category_code', 'grouping_code', 'ledger_code'),
+    'expense_wise': ('user_id', 'nature_of_data', 'ledger_code', 'sub_cost_centre_code'),
+    'hr_data': ('user_id', 'associate_code', 'period', 'sub_cost_centre_code'),
+    'occupancy_register': (
+        'user_id', 'medical_record_number_or_registration_number_uhid', 'patient_admission_date',
+        'bed_number', 'the_date_time_at_which_patient_was_transferred_to_this_bed'
+    ),
+    'consumption_data': ('user_id', 'transaction_date', 's_no'),
+    'cost_center': ('user_id', 'cost_centre_code', 'sub_cost_centre_code'),
+}
+
+# Other tables can repeat any combination of their columns (a cost centre has
+# several assets, a bill several lines of a cost), so upserts into them match
+# rows on the source system's id instead, which every upserted row must carry
+UPSERT_KEY_COLUMN = 'external_id'
+
+def upsert_key(table: str) -> Tuple[str, ...]:
+    """Columns an upsert into table resolves conflicts on"""
+    return TABLE_NATURAL_KEYS.get(table, ('user_id', UPSERT_KEY_COLUMN))
+
+_MONTH_NUMBERS = {
+    **{name.lower(): number for number, name in enumerate(calendar.month_name) if name},
+    **{name.lower(): number for number, name in enumerate(calendar.month_abbr) if name}
+}
+
+def _month_number(month: Any) -> Optional[int]:
+    """Resolve a month filter given as a name, abbreviation or number"""
+    text = str(month).strip().lower()
+    if text.isdigit():
+        number = int(text)
+        return number if 1 <= number <= 12 else None
+    return _MONTH_NUMBERS.get(text)
+
+def period_month(period: Any) -> Optional[Tuple[int, int]]:
+    """Year and month a period label such as 'January 2024', 'Jan-2024' or '2024-01' names; None if it names no single month"""
+    text = str(period).strip()
+    match = re.fullmatch(r'([A-Za-z]+)[\s,/-]*(\d{4})', text)
+    if match and match.group(1).lower() in _MONTH_NUMBERS:
+        return int(match.group(2)), _MONTH_NUMBERS[match.group(1).lower()]
+    match = re.fullmatch(r'(\d{4})[/-](\d{1,2})', text) or re.fullmatch(r'(\d{1,2})[/-](\d{4})', text)
+    if match:
+        year, month = sorted((int(match.group(1)), int(match.group(2))), reverse=True)
+        if 1 <= month <= 12:
+            return year, month
+    return None
+
+def route_filters(table: str, filters: Optional[Dict[str, Any]]) -> List[Tuple[str, str, Any]]:
+    """Translate cost-analysis filters into (column, operator, value) predicates valid for table
+    
+    Keys a table has no column for are dropped rather than sent as predicates that
+    fail or match nothing. year (optionally with month) and start_date/end_date
+    become a range on the table's date column.
+    """
+    if not filters:
+        return []
+    
+    predicates = []
+    filter_columns = TABLE_FILTER_COLUMNS.get(table, {})
+    date_column = TABLE_DATE_COLUMNS.get(table)
+    month_number = _month_number(filters['month']) if filters.get('month') else None
+    year = filters.get('year')
+    month_as_range = bool(date_column and year and month_number)
+    
+    if date_column:
+        if year:
+            start = date(int(year), month_number or 1, 1)
+            if month_number:
+                end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+            else:
+                end = date(start.year + 1, 1, 1)
+            predicates.append((date_column, 'gte', start.isoformat()))
+            predicates.append((date_column, 'lt', end.isoformat()))
+        
+        if filters.get('start_date'):
+            predicates.append((date_column, 'gte', str(filters['start_date'])))
+        if filters.get('end_date'):
+            predicates.append((date_column, 'lte', str(filters['end_date'])))
+    
+    for key, value in filters.items():
+        if value is None or key in ('year', 'start_date', 'end_date'):
+            continue
+        if key == 'month' and month_as_range:
+            continue
+        
+        column = filter_columns.get(key)
+        if column:
+            predicates.append((column, 'eq', value))
+        else:
+            logger.debug(f"Filter '{key}' does not apply to {table}, skipping")
+    
+    return predicates
+
+# Per-user change counters of the tenant tables, kept by the database's triggers
+TABLE_VERSIONS = 'table_versions'
+
+# How far before a snapshot's high-water mark the change query starts
+SNAPSHOT_OVERLAP = pd.Timedelta(minutes=1)
+
+_OPERATORS = {'eq': operator.eq, 'gte': operator.ge, 'lt': operator.lt, 'lte': operator.le}
+
+def filter_frame(df: pd.DataFrame, table: str, filters: Optional[Dict[str, Any]]) -> pd.DataFrame:
+    """Apply the same predicates as route_filters to an already loaded frame"""
+    predicates = route_filters(table, filters)
+    if df.empty or not predicates:
+        return df
+    
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in predicates:
+        if column not in df.columns:
+            continue
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            value = pd.Timestamp(value)
+        mask &= _OPERATORS[op](df[column], value)
+    
+    return df[mask]
+
+# Bounded pool for the blocking supabase client calls, shared by all requests
+_query_executor = ThreadPoolExecutor(
+    max_workers=settings.db_load_max_workers,
+    thread_name_prefix="db-layer"
+)
+
 class DatabaseLayer:
     """Database layer for loading hospital data into pandas DataFrames"""
     
     def __init__(self, user_id: str):
         self.user_id = user_id
         self.supabase = get_supabase_client()
+        self.snapshots = SnapshotCache(settings.snapshot_cache_dir) if settings.snapshot_cache_dir else None
     
-    async def load_service_register(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
-        """Load service register data as DataFrame"""
-        try:
-            query = self.supabase.table("service_register").select("*").eq("user_id", self.user_id)
-            
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
+    async def _execute(self, query):
+        """Run a blocking supabase query on the shared pool without stalling the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_query_executor, query.execute)
+    
+    async def insert_records(self, table: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert rows in one request on the query pool; all or none of them are written"""
+        result = await self._execute(self.supabase.table(table).insert(records))
+        return result.data or []
+    
+    async def upsert_records(self, table: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert rows in one request, updating those whose upsert key already exists
+        
+        The records must not repeat a key among themselves; the database rejects
+        a statement that would update the same row twice.
+        """
+        query = self.supabase.table(table).upsert(records, on_conflict=",".join(upsert_key(table)))
+        result = await self._execute(query)
+        return result.data or []
+    
+    async def data_versions(self, tables: List[str]) -> Dict[str, int]:
+        """Change counter of each of the given tables for the user, from one small query
+        
+        Statement triggers bump a table's counter on every insert, update and delete
+        of the user's rows, whichever process or client wrote; a table never written
+        to since the counters were added is at 0.
+        """
+        query = self.supabase.table(TABLE_VERSIONS).select("table_name,version").eq(
+            "user_id", self.user_id
+        ).in_("table_name", list(tables))
+        result = await self._execute(query)
+        counters = {row["table_name"]: int(row["version"]) for row in result.data or []}
+        return {table: counters.get(table, 0) for table in sorted(tables)}
+    
+    async def iter_table_chunks(self, table: str,
+                                columns: Optional[List[str]] = None,
+                                filters: Optional[Dict[str, Any]] = None,
+                                page_size: Optional[int] = None,
+                                since: Optional[str] = None) -> AsyncIterator[pd.DataFrame]:
+        """Yield a table as DataFrame chunks, walking the (user_id, id) keyset
+        
+        PostgREST silently caps the rows of a single response, so large registers
+        are read page by page and only the current page is held in memory.
+        since restricts the walk to rows created or updated at or after that timestamp.
+        """
+        page_size = page_size or settings.db_page_size
+        select = "*"
+        if columns:
+            select = ",".join(dict.fromkeys(["id", *columns]))
+        
+        last_id = None
+        while True:
+            query = self.supabase.table(table).select(select).eq("user_id", self.user_id)
+            
+            for column, operator, value in route_filters(table, filters):
+                query = getattr(query, operator)(column, value)
+            
+            if since is not None:
+                query = query.or_(f"updated_at.gte.{since},created_at.gte.{since}")
+            
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            
+            result = await self._execute(query.order("id").limit(page_size))
+            
+            # Stop on an empty page rather than a short one, the server cap may be below page_size
             if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
+                break
             
-            # Data type conversions
-            numeric_columns = ['quantity', 'gross_amount', 'discount', 'net_amount', 
-                             'performing_doctor_share_if_applicable', 
-                             'cost_of_pharmacy_material_billed_to_patient',
-                             'share_of_outsource_service_billed']
-            
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+            last_id = result.data[-1]["id"]
+            yield pd.DataFrame(result.data)
+    
+    async def _fetch_frame(self, table: str, filters: Optional[Dict[str, Any]] = None,
+                           columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Read a complete table through the keyset reader into a single typed DataFrame"""
+        if self.snapshots:
+            return await self._load_from_snapshot(table, filters, columns)
+        
+        return await self._read_table(table, filters, columns)
+    
+    async def _read_table(self, table: str, filters: Optional[Dict[str, Any]] = None,
+                          columns: Optional[List[str]] = None,
+                          since: Optional[str] = None) -> pd.DataFrame:
+        """Page through a table from the database and return the typed frame"""
+        # Coerce page by page so the JSON-shaped object columns never pile up in memory
+        chunks = [
+            coerce_frame(chunk, table, categorical=False)
+            async for chunk in self.iter_table_chunks(table, columns, filters, since=since)
+        ]
+        
+        if not chunks:
+            return pd.DataFrame()
+        
+        return coerce_frame(pd.concat(chunks, ignore_index=True), table)
+    
+    async def _row_count(self, table: str) -> int:
+        """Number of the user's rows in a table, from one exact count"""
+        query = self.supabase.table(table).select("id", count="exact").eq("user_id", self.user_id).limit(1)
+        result = await self._execute(query)
+        return result.count or 0
+    
+    async def _live_ids(self, table: str) -> pd.Index:
+        """Ids of all the user's rows in a table, read page by page without the other columns"""
+        ids = [chunk['id'] async for chunk in self.iter_table_chunks(table, columns=['id'])]
+        return pd.Index(pd.concat(ids, ignore_index=True) if ids else [])
+    
+    @staticmethod
+    def _high_water_mark(df: pd.DataFrame) -> Optional[str]:
+        """Latest updated_at (or created_at) in a frame, as a UTC timestamp string"""
+        stamps = [pd.to_datetime(df[col], errors='coerce', utc=True)
+                  for col in ('updated_at', 'created_at') if col in df.columns]
+        if df.empty or not stamps:
+            return None
+        
+        latest = max(stamp.max() for stamp in stamps)
+        if pd.isna(latest):
+            return None
+        return latest.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    
+    @staticmethod
+    def _project(df: pd.DataFrame, table: str, filters: Optional[Dict[str, Any]],
+                 columns: Optional[List[str]]) -> pd.DataFrame:
+        """Narrow a full snapshot frame to what the database query would have returned"""
+        df = filter_frame(df, table, filters)
+        if columns and not df.empty:
+            df = df[[col for col in dict.fromkeys(["id", *columns]) if col in df.columns]]
+        return df.reset_index(drop=True)
+    
+    async def _load_from_snapshot(self, table: str, filters: Optional[Dict[str, Any]] = None,
+                                  columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Table from the local snapshot, topped up with rows changed since it was taken
+        
+        Only rows at or past the snapshot's high-water mark are fetched in full.
+        Deleted rows leave no updated_at trace, so the topped-up snapshot is also
+        checked against the table's row count; only when they disagree is the
+        id set read, and ids gone from it are dropped. The filters and columns
+        are applied to the snapshot as the query would have.
+        """
+        snapshot, meta = await asyncio.to_thread(self.snapshots.read, self.user_id, table)
+        
+        if snapshot is not None and meta and meta.get('high_water_mark'):
+            # Overlap the window so rows committed late with an earlier timestamp are not missed
+            since = pd.Timestamp(meta['high_water_mark']) - SNAPSHOT_OVERLAP
+            delta, row_count = await asyncio.gather(
+                self._read_table(table, since=since.strftime('%Y-%m-%dT%H:%M:%S.%fZ')),
+                self._row_count(table)
+            )
+            
+            if not delta.empty:
+                # Rows re-read from the overlap window are only changes if their stamp moved
+                known = pd.to_datetime(snapshot.set_index('id')['updated_at'], errors='coerce', utc=True)
+                stamps = pd.to_datetime(delta['updated_at'], errors='coerce', utc=True)
+                unchanged = stamps.values == known.reindex(delta['id']).values
+                delta = delta[~unchanged]
+            
+            if delta.empty:
+                df = snapshot
+            else:
+                kept = snapshot[~snapshot['id'].isin(delta['id'])]
+                df = coerce_frame(pd.concat([kept, delta], ignore_index=True), table)
+            
+            deleted = pd.Series(False, index=df.index)
+            if len(df) != row_count:
+                live_ids = await self._live_ids(table)
+                deleted = ~df['id'].isin(live_ids)
+                row_count = len(live_ids)
+            if len(df) - deleted.sum() == row_count:
+                if deleted.any():
+                    df = df[~deleted].reset_index(drop=True)
+                if deleted.any() or not delta.empty:
+                    await self._write_snapshot(table, df)
+                logger.info(f"Loaded {table} from snapshot with {len(delta)} changed and {deleted.sum()} deleted rows")
+                return self._project(df, table, filters, columns)
+            
+            # A live row neither in the snapshot nor in the delta; the stamps can't be trusted
+            logger.info(f"Snapshot of {table} is missing rows, refreshing")
+        
+        df = await self._read_table(table)
+        await self._write_snapshot(table, df)
+        return self._project(df, table, filters, columns)
+    
+    async def _write_snapshot(self, table: str, df: pd.DataFrame):
+        meta = {'high_water_mark': self._high_water_mark(df), 'row_count': len(df)}
+        try:
+            await asyncio.to_thread(self.snapshots.write, self.user_id, table, df, meta)
+        except Exception as e:
+            logger.warning(f"Could not write snapshot of {table}: {e}")
+    
+    async def load_service_register(self, filters: Optional[Dict[str, Any]] = None,
+                                    columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Load service register data as DataFrame"""
+        try:
+            df = await self._fetch_frame("service_register", filters, columns)
             
-            # Date conversions
-            date_columns = ['date_of_final_bill', 'service_date']
-            for col in date_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} service register records")
             return df
@@ -56,27 +431,14 @@ class DatabaseLayer:
             logger.error(f"Error loading service register: {e}")
             return pd.DataFrame()
     
-    async def load_trial_balance(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_trial_balance(self, filters: Optional[Dict[str, Any]] = None,
+                                 columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load trial balance data as DataFrame"""
         try:
-            query = self.supabase.table("trial_balance").select("*").eq("user_id", self.user_id)
-            
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
+            df = await self._fetch_frame("trial_balance", filters, columns)
             
-            # Data type conversions
-            numeric_columns = ['amount', 'amount_2']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} trial balance records")
             return df
@@ -85,25 +447,14 @@ class DatabaseLayer:
             logger.error(f"Error loading trial balance: {e}")
             return pd.DataFrame()
     
-    async def load_expense_wise(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_expense_wise(self, filters: Optional[Dict[str, Any]] = None,
+                                columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load expense wise data as DataFrame"""
         try:
-            query = self.supabase.table("expense_wise").select("*").eq("user_id", self.user_id)
+            df = await self._fetch_frame("expense_wise", filters, columns)
             
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
-            
-            # Data type conversions
-            if 'amount' in df.columns:
-                df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0)
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} expense wise records")
             return df
@@ -112,42 +463,14 @@ class DatabaseLayer:
             logger.error(f"Error loading expense wise: {e}")
             return pd.DataFrame()
     
-    async def load_variable_cost_bill_wise(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_variable_cost_bill_wise(self, filters: Optional[Dict[str, Any]] = None,
+                                           columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load variable cost bill wise data as DataFrame"""
         try:
-            query = self.supabase.table("variable_cost_bill_wise").select("*").eq("user_id", self.user_id)
-            
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
+            df = await self._fetch_frame("variable_cost_bill_wise", filters, columns)
             
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
-            
-            # Data type conversions for all cost columns
-            cost_columns = [
-                'pharmacy_charged_to_patient',
-                'medical_surgical_consumables_charged_to_patient',
-                'implants_and_prosthetics_charged_to_patient',
-                'non_medical_consumables_charged_to_patient',
-                'fee_for_service',
-                'incentives_to_consultants_treating_doctors',
-                'patient_food_beverages_outsource_service',
-                'laboratory_test_outsource_service',
-                'any_other_patient_related_outsourced_services_1',
-                'any_other_patient_related_outsourced_services_2',
-                'any_other_patient_related_outsourced_services_3',
-                'brokerage_commission',
-                'provision_for_deduction_bad_debts'
-            ]
-            
-            for col in cost_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} variable cost records")
             return df
@@ -156,40 +479,14 @@ class DatabaseLayer:
             logger.error(f"Error loading variable cost: {e}")
             return pd.DataFrame()
     
-    async def load_hr_data(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_hr_data(self, filters: Optional[Dict[str, Any]] = None,
+                           columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load HR data as DataFrame"""
         try:
-            query = self.supabase.table("hr_data").select("*").eq("user_id", self.user_id)
-            
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
-            
-            # Data type conversions
-            numeric_columns = [
-                'efforts_allocation', 'efforts_sub_allocation', 'utilization',
-                'available_hours', 'actual_hours', 'basic_pay', 'allowances',
-                'other_benefits', 'overtime', 'bonus', 'epf', 'esic',
-                'any_other_contribution', 'gross_total', 'deduction', 'net_salary',
-                'no_of_headcount'
-            ]
+            df = await self._fetch_frame("hr_data", filters, columns)
             
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            
-            # Date conversions
-            date_columns = ['date_of_joining', 'date_of_resignation']
-            for col in date_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} HR records")
             return df
@@ -198,40 +495,14 @@ class DatabaseLayer:
             logger.error(f"Error loading HR data: {e}")
             return pd.DataFrame()
     
-    async def load_occupancy_register(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_occupancy_register(self, filters: Optional[Dict[str, Any]] = None,
+                                      columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load occupancy register data as DataFrame"""
         try:
-            query = self.supabase.table("occupancy_register").select("*").eq("user_id", self.user_id)
-            
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
-            
-            # Data type conversions
-            if 'length_of_stay_in_hours' in df.columns:
-                df['length_of_stay_in_hours'] = pd.to_numeric(df['length_of_stay_in_hours'], errors='coerce').fillna(0)
+            df = await self._fetch_frame("occupancy_register", filters, columns)
             
-            # Date conversions
-            date_columns = ['patient_admission_date', 'patient_discharge_date', 'date_of_final_bill']
-            for col in date_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
-            
-            # DateTime conversions
-            datetime_columns = [
-                'the_date_time_at_which_patient_was_transferred_to_this_bed',
-                'the_date_time_at_which_patient_left_this_bed'
-            ]
-            for col in datetime_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} occupancy records")
             return df
@@ -240,33 +511,14 @@ class DatabaseLayer:
             logger.error(f"Error loading occupancy register: {e}")
             return pd.DataFrame()
     
-    async def load_ot_register(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_ot_register(self, filters: Optional[Dict[str, Any]] = None,
+                               columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load OT register data as DataFrame"""
         try:
-            query = self.supabase.table("ot_register").select("*").eq("user_id", self.user_id)
-            
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
+            df = await self._fetch_frame("ot_register", filters, columns)
             
-            # Date conversions
-            date_columns = ['patient_admission_date', 'patient_discharge_date', 'service_date']
-            for col in date_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
-            
-            # Time conversions
-            time_columns = ['on_table_time', 'incision_time', 'finish_time']
-            for col in time_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], format='%H:%M:%S', errors='coerce').dt.time
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} OT register records")
             return df
@@ -275,31 +527,14 @@ class DatabaseLayer:
             logger.error(f"Error loading OT register: {e}")
             return pd.DataFrame()
     
-    async def load_consumption_data(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_consumption_data(self, filters: Optional[Dict[str, Any]] = None,
+                                    columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load consumption data as DataFrame"""
         try:
-            query = self.supabase.table("consumption_data").select("*").eq("user_id", self.user_id)
-            
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
-            
-            # Data type conversions
-            numeric_columns = ['quantity', 'rate', 'transaction_value_excluding_tax']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+            df = await self._fetch_frame("consumption_data", filters, columns)
             
-            # Date conversions
-            if 'transaction_date' in df.columns:
-                df['transaction_date'] = pd.to_datetime(df['transaction_date'], errors='coerce')
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} consumption records")
             return df
@@ -308,27 +543,14 @@ class DatabaseLayer:
             logger.error(f"Error loading consumption data: {e}")
             return pd.DataFrame()
     
-    async def load_connected_load(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_connected_load(self, filters: Optional[Dict[str, Any]] = None,
+                                  columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load connected load data as DataFrame"""
         try:
-            query = self.supabase.table("connected_load").select("*").eq("user_id", self.user_id)
+            df = await self._fetch_frame("connected_load", filters, columns)
             
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
-            
-            # Data type conversions
-            numeric_columns = ['connected_load', 'running_load', 'standby_load', 'days', 'hours', 'total_load_kg']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} connected load records")
             return df
@@ -337,27 +559,14 @@ class DatabaseLayer:
             logger.error(f"Error loading connected load: {e}")
             return pd.DataFrame()
     
-    async def load_fixed_asset_register(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_fixed_asset_register(self, filters: Optional[Dict[str, Any]] = None,
+                                        columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load fixed asset register data as DataFrame"""
         try:
-            query = self.supabase.table("fixed_asset_register").select("*").eq("user_id", self.user_id)
-            
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
+            df = await self._fetch_frame("fixed_asset_register", filters, columns)
             
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
-            
-            # Data type conversions
-            numeric_columns = ['bio_medical_equipments', 'engineering_equipments', 'furniture_fixture', 'others']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} fixed asset records")
             return df
@@ -366,21 +575,15 @@ class DatabaseLayer:
             logger.error(f"Error loading fixed asset register: {e}")
             return pd.DataFrame()
     
-    async def load_cost_center(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_cost_center(self, filters: Optional[Dict[str, Any]] = None,
+                               columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load cost center data as DataFrame"""
         try:
-            query = self.supabase.table("cost_center").select("*").eq("user_id", self.user_id)
+            df = await self._fetch_frame("cost_center", filters, columns)
             
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
+            if df.empty:
+                return df
             
-            df = pd.DataFrame(result.data)
             logger.info(f"Loaded {len(df)} cost center records")
             return df
             
@@ -388,59 +591,14 @@ class DatabaseLayer:
             logger.error(f"Error loading cost center: {e}")
             return pd.DataFrame()
     
-    async def load_secondary_cost_driver(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    async def load_secondary_cost_driver(self, filters: Optional[Dict[str, Any]] = None,
+                                         columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Load secondary cost driver data as DataFrame"""
         try:
-            query = self.supabase.table("secondary_cost_driver").select("*").eq("user_id", self.user_id)
+            df = await self._fetch_frame("secondary_cost_driver", filters, columns)
             
-            if filters:
-                for key, value in filters.items():
-                    query = query.eq(key, value)
-            
-            result = query.execute()
-            
-            if not result.data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(result.data)
-            
-            # Data type conversions for all numeric columns
-            numeric_columns = [
-                'nursing_hostel_occupancy', 'doctors_hostel_occupancy', 'staff_accomodation_occupancy',
-                'frequency_of_audit', 'no_of_it_users', 'no_of_transaction_in_finance_billing_cost_centre',
-                'no_of_trips_km', 'no_of_laboratory_test', 'no_of_sample_collected_report_dispatch',
-                'no_of_home_sample_collection', 'no_of_radiology_test', 'no_of_neuro_test',
-                'no_of_cardiac_test', 'no_of_nuclear_medicine_test', 'no_of_ivf_consultation',
-                'ot_time_hours', 'ccu_occupancy', 'micu_occupancy', 'picu_occupancy',
-                'nicu_occupancy', 'hdu_occupancy', 'issolation_room_occupancy', 'gw_occupancy',
-                'pw_sr_occupancy', 'sw_ts_occupancy', 'dw_occupancy', 'head_office',
-                'other_unit_1_allocation_ratio', 'other_unit_2_allocation_ratio',
-                'other_unit_3_allocation_ratio', 'other_unit_4_allocation_ratio',
-                'other_unit_5_allocation_ratio', 'no_of_patient_op_ip',
-                'no_of_corporate_patient_op_ip', 'no_of_institutional_patient_op_ip',
-                'no_of_international_patient_op_ip', 'no_of_ip_patients',
-                'no_of_credit_ip_patients', 'surgical_store_issue_ratio',
-                'central_store_issue_ratio', 'non_surgical_store_issue_ratio',
-                'stationery_housekeeping_issue_ratio', 'no_of_doctors',
-                'doctor_fee_for_service_ratio', 'consultant_retainer_fee_mg_bonus_ratio',
-                'no_of_nursing_staff', 'nursing_station_1_for_care_units',
-                'nursing_station_2_for_care_units', 'nursing_station_3_for_care_units',
-                'nursing_station_4_for_care_units', 'nursing_station_5_for_care_units',
-                'service_under_op_billing_1', 'service_under_op_billing_2',
-                'service_under_op_billing_3', 'service_under_op_billing_4',
-                'brokerage_commission', 'no_of_cssd_set_issued', 'no_of_diet_served',
-                'no_of_ward_boy', 'no_of_housekeeping_staff',
-                'no_of_fumigation_cycle_performed_standard_resource_allocation_ratio',
-                'volume_of_cloth_load', 'efforts_of_supply_chain_department',
-                'area_in_sq_meter', 'no_of_security_staff_deployed_no_of_exits',
-                'actual_water_utilization_standard_utilization_ratio',
-                'actual_gas_utilization_standard_utilization_ratio',
-                'actual_vaccume_utilization_standard_utilization_ratio'
-            ]
-            
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+            if df.empty:
+                return df
             
             logger.info(f"Loaded {len(df)} secondary cost driver records")
             return df
@@ -449,27 +607,52 @@ class DatabaseLayer:
             logger.error(f"Error loading secondary cost driver: {e}")
             return pd.DataFrame()
     
-    async def load_all_tables(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, pd.DataFrame]:
-        """Load all tables and return as dictionary of DataFrames"""
+    async def load_all_tables(self, filters: Optional[Dict[str, Any]] = None,
+                              concurrent: bool = True,
+                              columns: Optional[Dict[str, List[str]]] = None,
+                              tables: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+        """Load all tables and return as dictionary of DataFrames
+        
+        With concurrent=True all tables are fetched in parallel on the query pool,
+        so wall time tracks the slowest table rather than the sum of all of them.
+        columns maps a table name to the columns to select (all columns when absent),
+        and tables restricts the load to the named tables.
+        """
         try:
-            tables = {
-                'service_register': await self.load_service_register(filters),
-                'trial_balance': await self.load_trial_balance(filters),
-                'expense_wise': await self.load_expense_wise(filters),
-                'variable_cost_bill_wise': await self.load_variable_cost_bill_wise(filters),
-                'hr_data': await self.load_hr_data(filters),
-                'occupancy_register': await self.load_occupancy_register(filters),
-                'ot_register': await self.load_ot_register(filters),
-                'consumption_data': await self.load_consumption_data(filters),
-                'connected_load': await self.load_connected_load(filters),
-                'fixed_asset_register': await self.load_fixed_asset_register(filters),
-                'cost_center': await self.load_cost_center(filters),
-                'secondary_cost_driver': await self.load_secondary_cost_driver(filters)
+            loaders = {
+                'service_register': self.load_service_register,
+                'trial_balance': self.load_trial_balance,
+                'expense_wise': self.load_expense_wise,
+                'variable_cost_bill_wise': self.load_variable_cost_bill_wise,
+                'hr_data': self.load_hr_data,
+                'occupancy_register': self.load_occupancy_register,
+                'ot_register': self.load_ot_register,
+                'consumption_data': self.load_consumption_data,
+                'connected_load': self.load_connected_load,
+                'fixed_asset_register': self.load_fixed_asset_register,
+                'cost_center': self.load_cost_center,
+                'secondary_cost_driver': self.load_secondary_cost_driver
             }
             
+            if tables is not None:
+                loaders = {name: loader for name, loader in loaders.items() if name in tables}
+            
+            columns = columns or {}
+            
+            if concurrent:
+                # Each loader handles its own errors and falls back to an empty frame
+                frames = await asyncio.gather(*(
+                    loader(filters, columns.get(name)) for name, loader in loaders.items()
+                ))
+                loaded = dict(zip(loaders.keys(), frames))
+            else:
+                loaded = {}
+                for name, loader in loaders.items():
+                    loaded[name] = await loader(filters, columns.get(name))
+            
             logger.info("Successfully loaded all database tables")
-            return tables
+            return loaded
             
         except Exception as e:
             logger.error(f"Error loading all tables: {e}")
-            return {}
\ No newline at end of file
+            return {}
@@ -0,0 +1,155 @@
+"""
+Frame Encoding - Response bodies built straight from DataFrames
+Arrow IPC, Parquet, column-oriented JSON and chunked NDJSON/CSV exports, without a model object per row
+"""
+import io
+import json
+import zlib
+from typing import Iterator, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.responses import Response, StreamingResponse
+
+RECORDS = "json"
+COLUMNAR = "columnar"
+ARROW = "arrow"
+PARQUET = "parquet"
+
+FRAME_FORMATS = (RECORDS, COLUMNAR, ARROW, PARQUET)
+
+MEDIA_TYPES = {
+    COLUMNAR: "application/json",
+    ARROW: "application/vnd.apache.arrow.stream",
+    PARQUET: "application/vnd.apache.parquet",
+}
+
+# Accept header media types that select a format when no explicit one is given
+ACCEPT_FORMATS = {
+    "application/vnd.apache.arrow.stream": ARROW,
+    "application/vnd.apache.arrow.file": ARROW,
+    "application/vnd.apache.parquet": PARQUET,
+    "application/x-parquet": PARQUET,
+}
+
+NDJSON = "ndjson"
+CSV = "csv"
+
+EXPORT_FORMATS = (NDJSON, CSV)
+
+EXPORT_MEDIA_TYPES = {
+    NDJSON: "application/x-ndjson",
+    CSV: "text/csv",
+}
+
+# Rows per Arrow record batch / Parquet row group
+BATCH_ROWS = 64 * 1024
+
+# Rows serialized per export chunk
+EXPORT_CHUNK_ROWS = 10_000
+
+def resolve_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """Pick the response format from an explicit request, else the Accept header"""
+    if requested:
+        if requested not in FRAME_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(FRAME_FORMATS)}")
+        return requested
+
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in ACCEPT_FORMATS:
+            return ACCEPT_FORMATS[media_type]
+
+    return RECORDS
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+def iter_arrow_stream(table: pa.Table) -> Iterator[bytes]:
+    """Arrow IPC stream, yielded one record batch at a time"""
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        yield _drain(sink)
+        for batch in table.to_batches(max_chunksize=BATCH_ROWS):
+            writer.write_batch(batch)
+            yield _drain(sink)
+    yield _drain(sink)
+
+def iter_parquet(table: pa.Table) -> Iterator[bytes]:
+    """Parquet file, yielded one row group at a time; the footer comes last"""
+    sink = io.BytesIO()
+    with pq.ParquetWriter(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=BATCH_ROWS):
+            writer.write_table(pa.Table.from_batches([batch], schema=table.schema))
+            yield _drain(sink)
+    yield _drain(sink)
+
+def columnar_json(df: pd.DataFrame) -> str:
+    """{"columns": [...], "row_count": n, "data": {column: [values]}} with NaN as null"""
+    # Each column goes through pandas' C encoder in one call
+    data = ",".join(f"{json.dumps(column)}:{df[column].to_json(orient='values')}" for column in df.columns)
+    return f'{{"columns":{json.dumps(list(df.columns))},"row_count":{len(df)},"data":{{{data}}}}}'
+
+def frame_response(df: pd.DataFrame, fmt: str, filename: str = "data") -> Response:
+    """Encode a frame in one of the columnar formats"""
+    if fmt == COLUMNAR:
+        return Response(content=columnar_json(df), media_type=MEDIA_TYPES[COLUMNAR])
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == ARROW:
+        body, extension = iter_arrow_stream(table), "arrow"
+    elif fmt == PARQUET:
+        body, extension = iter_parquet(table), "parquet"
+    else:
+        raise ValueError(f"Not a columnar format: {fmt}")
+
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'}
+    )
+
+def iter_ndjson(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """One JSON object per line, serialized a chunk of rows at a time"""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield chunk.to_json(orient="records", lines=True).rstrip("\n").encode() + b"\n"
+
+def iter_csv(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """CSV with a single header row, serialized a chunk of rows at a time"""
+    yield df.iloc[:0].to_csv(index=False).encode()
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode()
+
+def iter_gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Gzip a byte stream incrementally, flushing after every chunk"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        # Sync-flush so each chunk reaches the client instead of waiting in the compressor
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_response(df: pd.DataFrame, fmt: str, compress: bool = True, filename: str = "export") -> StreamingResponse:
+    """Stream a frame as NDJSON or CSV, optionally gzipped"""
+    if fmt == NDJSON:
+        body = iter_ndjson(df)
+    elif fmt == CSV:
+        body = iter_csv(df)
+    else:
+        raise ValueError(f"Not an export format: {fmt}")
+
+    media_type = EXPORT_MEDIA_TYPES[fmt]
+    filename = f"{filename}.{fmt}"
+    if compress:
+        body, media_type, filename = iter_gzip(body), "application/gzip", f"{filename}.gz"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,366 @@
+"""
+Job Queue - Long-running ingestion and cost runs in the background, outside the request that started them
+Jobs run on a fixed number of workers of the API event loop; their status and results live in memory or in SQLite
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set
+import pandas as pd
+import pyarrow as pa
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """Raised in a running job when its cancellation was requested"""
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class MemoryJobStore:
+    """Jobs and results of this API process"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._results: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict[str, Any]):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list(self, user_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(job) for job in self._jobs.values() if job['user_id'] == user_id]
+
+    def set_result(self, job_id: str, result: Any):
+        with self._lock:
+            self._results[job_id] = result
+
+    def get_result(self, job_id: str) -> Any:
+        with self._lock:
+            return self._results.get(job_id)
+
+    def fail_orphans(self):
+        # Jobs of this store die with the process; nothing outlives it
+        pass
+
+    def purge(self, finished_before: datetime) -> int:
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['finished_at'] is not None and job['finished_at'] < finished_before
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._results.pop(job_id, None)
+            return len(expired)
+
+class SqliteJobStore:
+    """Jobs and results in an SQLite file, visible to every API process on the host
+
+    Frame results are kept as Arrow IPC streams and everything else as JSON.
+    Every call blocks on the file, for up to the lock timeout under contention,
+    so the queue makes them on worker threads rather than on the event loop.
+    """
+
+    COLUMNS = (
+        'id', 'user_id', 'kind', 'status', 'progress', 'message', 'error',
+        'cancel_requested', 'owner_pid', 'created_at', 'started_at', 'finished_at'
+    )
+    TIMESTAMPS = ('created_at', 'started_at', 'finished_at')
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, kind TEXT NOT NULL, status TEXT NOT NULL, "
+                "progress REAL, message TEXT, error TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                "owner_pid INTEGER, created_at TEXT NOT NULL, started_at TEXT, finished_at TEXT, "
+                "result_format TEXT, result BLOB)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, created_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per call, committed and closed; sqlite3 connections can't be shared across threads
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _row(self, row) -> Dict[str, Any]:
+        job = dict(zip(self.COLUMNS, row))
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        for name in self.TIMESTAMPS:
+            if job[name] is not None:
+                job[name] = datetime.fromisoformat(job[name])
+        return job
+
+    @staticmethod
+    def _value(value: Any) -> Any:
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    def create(self, job: Dict[str, Any]):
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                [self._value(job[name]) for name in self.COLUMNS]
+            )
+
+    def update(self, job_id: str, **fields):
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                [self._value(value) for value in fields.values()] + [job_id]
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row is not None else None
+
+    def list(self, user_id: str) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE user_id = ? ORDER BY created_at", (user_id,)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def set_result(self, job_id: str, result: Any):
+        if isinstance(result, pd.DataFrame):
+            table = pa.Table.from_pandas(result, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            result_format, data = 'arrow', sink.getvalue().to_pybytes()
+        else:
+            result_format, data = 'json', json.dumps(result, default=str).encode()
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET result_format = ?, result = ? WHERE id = ?", (result_format, data, job_id))
+
+    def get_result(self, job_id: str) -> Any:
+        with self._connect() as conn:
+            row = conn.execute("SELECT result_format, result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row[1] is None:
+            return None
+        result_format, data = row
+        if result_format == 'arrow':
+            return pa.ipc.open_stream(pa.py_buffer(data)).read_all().to_pandas()
+        return json.loads(data)
+
+    def fail_orphans(self):
+        """Mark unfinished jobs whose process is gone as failed; nothing is left to run them"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, owner_pid FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+            # Runs before this process queues anything, so its own pid (reused after a restart) marks an orphan too
+            orphans = [job_id for job_id, pid in rows if pid is None or pid == os.getpid() or not _pid_alive(pid)]
+            conn.executemany(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                [(FAILED, "Interrupted by an API restart", _now().isoformat(), job_id) for job_id in orphans]
+            )
+        if orphans:
+            logger.warning(f"Marked {len(orphans)} interrupted jobs as failed")
+
+    def purge(self, finished_before: datetime) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (finished_before.isoformat(),)
+            ).rowcount
+
+class JobContext:
+    """Handle through which a running job reports progress and learns of its cancellation"""
+
+    def __init__(self, store, job_id: str):
+        self._store = store
+        self.job_id = job_id
+
+    async def progress(self, fraction: Optional[float] = None, message: Optional[str] = None):
+        """Record progress; raises JobCancelled once cancellation was requested, from any process"""
+        fields = {'message': message}
+        if fraction is not None:
+            fields['progress'] = min(max(fraction, 0.0), 1.0)
+        await asyncio.to_thread(self._store.update, self.job_id, **fields)
+
+        job = await asyncio.to_thread(self._store.get, self.job_id)
+        if job is not None and job['cancel_requested']:
+            raise JobCancelled()
+
+# fn(job, *args) -> result; the result is a frame or anything JSON-serializable
+JobFunction = Callable[..., Awaitable[Any]]
+
+class JobQueue:
+    """Background jobs run by max_workers workers on the API event loop
+
+    A job is a coroutine function, so CPU-bound parts still belong in the compute
+    pool and blocking I/O on threads; the queue only moves them out of the
+    request. Results are kept for retention_seconds after a job finishes. With a
+    store path, status, progress and results are shared through SQLite by all
+    API processes on the host and cancellation reaches the process running the
+    job at its next progress report; jobs themselves always run in the process
+    that queued them. Store calls run on threads, since SQLite can block.
+    """
+
+    def __init__(self, max_workers: int, retention_seconds: int, store_path: Optional[str] = None):
+        self.max_workers = max_workers
+        self.retention_seconds = retention_seconds
+        self.store = SqliteJobStore(store_path) if store_path else MemoryJobStore()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        # Running jobs cancel() stopped, as opposed to tasks stopped by shutdown()
+        self._cancelled: Set[str] = set()
+        self._starting = asyncio.Lock()
+
+    async def start(self):
+        """Start the workers on the running event loop"""
+        async with self._starting:
+            if self._workers:
+                return
+            await asyncio.to_thread(self.store.fail_orphans)
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._work()) for _ in range(max(self.max_workers, 1))]
+
+    async def shutdown(self):
+        for task in [*self._running.values(), *self._workers]:
+            task.cancel()
+        await asyncio.gather(*self._running.values(), *self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def _purge(self):
+        removed = await asyncio.to_thread(self.store.purge, _now() - timedelta(seconds=self.retention_seconds))
+        if removed:
+            logger.info(f"Purged {removed} expired jobs")
+
+    async def submit(self, user_id: str, kind: str, fn: JobFunction, *args) -> Dict[str, Any]:
+        """Queue fn(job, *args) for a user and return the new job"""
+        await self.start()
+        await self._purge()
+
+        job = {
+            'id': str(uuid.uuid4()), 'user_id': user_id, 'kind': kind, 'status': QUEUED,
+            'progress': 0.0, 'message': None, 'error': None, 'cancel_requested': False,
+            'owner_pid': os.getpid(), 'created_at': _now(), 'started_at': None, 'finished_at': None,
+        }
+        await asyncio.to_thread(self.store.create, job)
+        self._queue.put_nowait((job['id'], fn, args))
+        logger.info(f"Queued {kind} job {job['id']}")
+        return job
+
+    async def get(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """A user's job, or None when it doesn't exist, expired or belongs to someone else"""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        return job if job is not None and job['user_id'] == user_id else None
+
+    async def list(self, user_id: str) -> List[Dict[str, Any]]:
+        await self._purge()
+        return await asyncio.to_thread(self.store.list, user_id)
+
+    async def result(self, user_id: str, job_id: str) -> Any:
+        if await self.get(user_id, job_id) is None:
+            return None
+        return await asyncio.to_thread(self.store.get_result, job_id)
+
+    async def cancel(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job at once and a running one as soon as it can stop; finished jobs are unchanged"""
+        job = await self.get(user_id, job_id)
+        if job is None or job['status'] in FINISHED_STATUSES:
+            return job
+
+        if job['status'] == QUEUED:
+            await asyncio.to_thread(self.store.update, job_id, status=CANCELLED, finished_at=_now())
+        else:
+            await asyncio.to_thread(self.store.update, job_id, cancel_requested=True)
+            task = self._running.get(job_id)
+            if task is not None:
+                self._cancelled.add(job_id)
+                task.cancel()
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _work(self):
+        while True:
+            job_id, fn, args = await self._queue.get()
+            try:
+                job = await asyncio.to_thread(self.store.get, job_id)
+                if job is not None and job['status'] == QUEUED:
+                    await self._run(job_id, fn, args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job_id} could not be recorded: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, fn: JobFunction, args):
+        await asyncio.to_thread(self.store.update, job_id, status=RUNNING, started_at=_now())
+        task = asyncio.create_task(fn(JobContext(self.store, job_id), *args))
+        self._running[job_id] = task
+        try:
+            result = await task
+        except (asyncio.CancelledError, JobCancelled) as e:
+            await asyncio.to_thread(self.store.update, job_id, status=CANCELLED, finished_at=_now())
+            logger.info(f"Cancelled job {job_id}")
+            if job_id not in self._cancelled and not isinstance(e, JobCancelled):
+                # The worker itself is being stopped
+                raise
+            return
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            await asyncio.to_thread(self.store.update, job_id, status=FAILED, error=str(e), finished_at=_now())
+            return
+        finally:
+            self._running.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+        await asyncio.to_thread(self.store.set_result, job_id, result)
+        await asyncio.to_thread(
+            self.store.update, job_id, status=SUCCEEDED, progress=1.0, message=None, finished_at=_now()
+        )
+        logger.info(f"Finished job {job_id}")
+
+# Global queue of this API process
+job_queue = JobQueue(settings.job_workers, settings.job_retention_seconds, settings.job_store_path)
@@ -0,0 +1,65 @@
+"""
+Matrix Store - Per-user, per-period allocation matrices on local disk
+Stored as uncompressed .npz archives of plain arrays, written atomically and read without pickling
+"""
+import os
+import re
+import shutil
+import tempfile
+from typing import Optional, Dict, Any
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+def period_key(filters: Optional[Dict[str, Any]]) -> str:
+    """File-safe name for the period a set of filters selects, 'all' when unfiltered"""
+    parts = [f"{name}-{value}" for name, value in sorted((filters or {}).items()) if value is not None]
+    return re.sub(r'[^A-Za-z0-9._-]', '_', '_'.join(parts)) or 'all'
+
+class MatrixStore:
+    """Arrays of each (user, period) allocation matrix, keyed by the period's filters"""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def _path(self, user_id: str, period: str) -> str:
+        return os.path.join(self.root_dir, user_id, f"allocation-{period}.npz")
+
+    def read(self, user_id: str, period: str) -> Optional[Dict[str, np.ndarray]]:
+        """Return the stored arrays, or None when there are none"""
+        path = self._path(user_id, period)
+
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as archive:
+                return {name: archive[name] for name in archive.files}
+        except Exception as e:
+            logger.warning(f"Discarding unreadable allocation matrix {path}: {e}")
+            self.invalidate(user_id, period)
+            return None
+
+    def write(self, user_id: str, period: str, arrays: Dict[str, np.ndarray]):
+        """Atomically replace the arrays stored for a period"""
+        path = self._path(user_id, period)
+        user_dir = os.path.dirname(path)
+        os.makedirs(user_dir, exist_ok=True)
+
+        # Write next to the target and rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=user_dir, suffix=".npz.tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def invalidate(self, user_id: str, period: Optional[str] = None):
+        """Drop one period's matrix, or every matrix of the user"""
+        if period is None:
+            shutil.rmtree(os.path.join(self.root_dir, user_id), ignore_errors=True)
+            return
+
+        try:
+            os.remove(self._path(user_id, period))
+        except FileNotFoundError:
+            pass
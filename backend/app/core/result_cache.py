@@ -0,0 +1,138 @@
+"""
+Result Cache - In-process LRU cache of computed cost-analysis frames
+Keyed by user, normalized filters and the data version of the input tables they were computed from
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, Callable
+import pandas as pd
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """LRU cache of result frames bounded by their in-memory size
+
+    The data version of each input table, its change counter as read from the
+    database, is part of every key. A write from any process or client moves the
+    counter, so the entries computed before it are no longer reached. Writes made through this process also evict the affected entries
+    at once, so they stop counting against the memory budget.
+
+    An entry can carry a state object alongside its frame. patch() hands both
+    to a callback on an update, so results that can absorb the change are
+    updated and re-keyed to the version after it instead of being evicted.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: int = 0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[pd.DataFrame, int, float, Any]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, user_id: str, filters: Optional[Dict[str, Any]],
+                 versions: Dict[str, int]) -> Tuple:
+        """Cache key for a computation over the tables in versions; None filter values are ignored"""
+        normalized = tuple(sorted(
+            (name, str(value)) for name, value in (filters or {}).items() if value is not None
+        ))
+        return user_id, normalized, tuple(sorted(versions.items()))
+
+    def get(self, key: Tuple) -> Optional[pd.DataFrame]:
+        """Return a cached frame and mark it recently used, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            df, size, stored_at, _ = entry
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                self._drop(key)
+                return None
+
+            self._entries.move_to_end(key)
+
+        # Shallow copy so callers adding or dropping columns don't alter the cached frame
+        return df.copy(deep=False)
+
+    def put(self, key: Tuple, df: pd.DataFrame, state: Any = None):
+        """Store a frame, evicting least recently used entries to stay within the budget"""
+        size = int(df.memory_usage(deep=True).sum()) + int(getattr(state, 'nbytes', 0))
+        if size > self.max_bytes:
+            logger.info(f"Result of {size} bytes exceeds the cache budget; not cached")
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+            while self._entries and self._size + size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+            self._entries[key] = (df, size, time.monotonic(), state)
+            self._size += size
+
+    def invalidate(self, user_id: str, table: Optional[str] = None):
+        """Evict a user's results computed from a table (or all of them) after a write through this process"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                if table is None or table in dict(key[2]):
+                    self._drop(key)
+
+    def has_state(self, user_id: str, table: str) -> bool:
+        """Whether any of the user's frames computed from the table carries a state patch() can use"""
+        with self._lock:
+            return any(
+                key[0] == user_id and table in dict(key[2]) and entry[3] is not None
+                for key, entry in self._entries.items()
+            )
+
+    def patch(self, user_id: str, table: str, version: Optional[int],
+              apply: Callable[[pd.DataFrame, Any], Optional[pd.DataFrame]]):
+        """Record an update of one row of a user's table, carrying over the results that can absorb it
+
+        version is the table's counter read after the update. Only entries computed
+        at the version just before it are patched: their data differs from the
+        table's by that one update alone. apply receives each such frame with the
+        state stored beside it and returns the updated frame or None to evict it.
+        Every other entry from the table is evicted.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                versions = dict(key[2])
+                if table not in versions:
+                    continue
+
+                df, size, stored_at, state = self._entries[key]
+                self._drop(key)
+
+                patched = None
+                if state is not None and version is not None and versions[table] == version - 1:
+                    try:
+                        patched = apply(df, state)
+                    except Exception as e:
+                        logger.warning(f"Could not update cached result after a {table} write: {e}")
+
+                if patched is not None:
+                    versions[table] = version
+                    new_key = (user_id, key[1], tuple(sorted(versions.items())))
+                    if new_key in self._entries:
+                        self._drop(new_key)
+                    # Keeps its original timestamp, so the TTL still bounds how long it lives
+                    self._entries[new_key] = (patched, size, stored_at, state)
+                    self._size += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _drop(self, key: Tuple):
+        _, size, _, _ = self._entries.pop(key)
+        self._size -= size
+
+# Shared by every request handled by this process
+result_cache = ResultCache(settings.result_cache_max_bytes, settings.result_cache_ttl_seconds)
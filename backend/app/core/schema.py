@@ -0,0 +1,117 @@
+"""
+Table Schemas - Column dtypes for frames loaded from the hospital tables
+Derived from the Pydantic models in app.models.new_tables so loaders and models stay in step
+"""
+import typing
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Dict, Optional
+import pandas as pd
+from pydantic import BaseModel
+from app.models import new_tables as models
+
+# Response models describe every column a table returns, including id and timestamps
+TABLE_MODELS: Dict[str, typing.Type[BaseModel]] = {
+    'service_register': models.ServiceRegisterResponse,
+    'trial_balance': models.TrialBalanceResponse,
+    'expense_wise': models.ExpenseWiseResponse,
+    'variable_cost_bill_wise': models.VariableCostBillWiseResponse,
+    'hr_data': models.HRDataResponse,
+    'occupancy_register': models.OccupancyRegisterResponse,
+    'ot_register': models.OTRegisterResponse,
+    'consumption_data': models.ConsumptionDataResponse,
+    'connected_load': models.ConnectedLoadResponse,
+    'fixed_asset_register': models.FixedAssetRegisterResponse,
+    'tat_data': models.TATDataResponse,
+    'cost_center': models.CostCenterResponse,
+    'secondary_cost_driver': models.SecondaryCostDriverResponse,
+}
+
+# Low-cardinality text columns the cost analysis groups and joins on
+CATEGORICAL_COLUMNS = {'sub_cost_centre', 'service_name', 'patient_type'}
+
+_TYPE_DTYPES = {
+    Decimal: 'float64',
+    float: 'float64',
+    int: 'int32',
+    bool: 'bool',
+    date: 'datetime64[ns]',
+    datetime: 'datetime64[ns]',
+    time: 'time',
+}
+
+def _dtype_for(column: str, annotation) -> Optional[str]:
+    """Map a model field annotation onto the dtype used for its column"""
+    # Unwrap Optional[X]
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        annotation = args[0] if len(args) == 1 else None
+
+    if annotation is str:
+        return 'category' if column in CATEGORICAL_COLUMNS else None
+
+    return _TYPE_DTYPES.get(annotation)
+
+def _build_table_dtypes() -> Dict[str, Dict[str, str]]:
+    table_dtypes = {}
+    for table, model in TABLE_MODELS.items():
+        dtypes = {}
+        for column, field in model.model_fields.items():
+            dtype = _dtype_for(column, field.annotation)
+            if dtype:
+                dtypes[column] = dtype
+        table_dtypes[table] = dtypes
+    return table_dtypes
+
+# {table: {column: dtype}}; columns absent from a table's map stay as loaded
+TABLE_DTYPES = _build_table_dtypes()
+
+def coerce_frame(df: pd.DataFrame, table: str, categorical: bool = True) -> pd.DataFrame:
+    """Cast a frame built from JSON rows to the table's dtypes
+
+    Columns are converted block by block (all numerics, then all dates) and the
+    typed frame is assembled once. Missing numbers become 0 as before. Pass
+    categorical=False for chunks that are concatenated later, since chunks with
+    different categories would concatenate back to object dtype.
+    """
+    dtypes = TABLE_DTYPES.get(table)
+    if df.empty or not dtypes:
+        return df
+
+    by_dtype: Dict[str, list] = {}
+    for column, dtype in dtypes.items():
+        if column not in df.columns or str(df[column].dtype) == dtype:
+            continue
+        if dtype == 'category' and not categorical:
+            continue
+        by_dtype.setdefault(dtype, []).append(column)
+
+    if not by_dtype:
+        return df
+
+    converted = {}
+
+    for dtype in ('float64', 'int32'):
+        columns = by_dtype.get(dtype)
+        if columns:
+            block = df[columns].apply(pd.to_numeric, errors='coerce').fillna(0)
+            converted.update(block.astype(dtype).items())
+
+    if by_dtype.get('bool'):
+        block = df[by_dtype['bool']].fillna(False)
+        converted.update(block.astype('bool').items())
+
+    if by_dtype.get('datetime64[ns]'):
+        block = df[by_dtype['datetime64[ns]']].apply(pd.to_datetime, errors='coerce')
+        converted.update(block.items())
+
+    for column in by_dtype.get('time', []):
+        converted[column] = pd.to_datetime(df[column], format='%H:%M:%S', errors='coerce').dt.time
+
+    for column in by_dtype.get('category', []):
+        converted[column] = df[column].astype('category')
+
+    return pd.DataFrame(
+        {column: converted.get(column, df[column]) for column in df.columns},
+        index=df.index
+    )
@@ -0,0 +1,419 @@
+"""
+Sheet Ingest - Stream an uploaded workbook sheet or CSV into a table, a chunk of rows at a time
+Sheets follow the notebook's layout: long column titles on one row, data a few rows below
+"""
+import asyncio
+import csv
+import io
+import os
+import typing
+from itertools import islice
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+import logging
+
+from app.core.bulk_ingest import ingest_chunk, ingest_summary
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Row positions (0-based) of the column titles and the first data row in the source sheets
+SHEET_HEADER_ROW = 1
+SHEET_DATA_ROW = 3
+
+SHEET_EXTENSIONS = {'.xlsx': 'xlsx', '.xlsm': 'xlsx', '.csv': 'csv'}
+
+# Sheet column title -> column name, as in the Unique_Column_Mapping workbook
+COLUMN_RENAME_MAP = {
+    'Month': 'month',
+    'Bill no.': 'bill_no',
+    'Patient Type': 'patient_type',
+    'Reg. No.': 'reg_no',
+    'IPD Number': 'ipd_number',
+    'Payor Type': 'payor_type',
+    'Payor Alias Name': 'payor_alias_name',
+    'Admitting Doctor Name': 'admitting_doctor_name',
+    'Admitting Doctor Department / Speciality Name': 'admitting_doctor_department_speciality_name',
+    'Performing Doctor Name': 'performing_doctor_name',
+    'performing Doctor Department / Speciality Name': 'performing_doctor_department_speciality_name',
+    'Refering Doctor Name': 'refering_doctor_name',
+    'Refering Doctor Department / Speciality Name': 'refering_doctor_department_speciality_name',
+    'Service Name': 'service_name',
+    'Service Department': 'service_department',
+    'service Sub department': 'service_sub_department',
+    'Service Status i.e. Active or Cancelled.': 'service_status_i_e_active_or_cancelled',
+    'under Package or Not.': 'under_package_or_not',
+    'Outsourced or Inhouse.': 'outsourced_or_inhouse',
+    'No. of service': 'quantity',
+    'Gross Amount': 'gross_amount',
+    'Discount Amount': 'discount',
+    'Net Amount': 'net_amount',
+    'Emergency charges for Service or Not.': 'emergency_charges_for_service_or_not',
+    'performing Doctor Share if applicable': 'performing_doctor_share_if_applicable',
+    'Cost Of Pharmacy & Material Billed to Patient.': 'cost_of_pharmacy_material_billed_to_patient',
+    'share of  Outsource Service billed': 'share_of_outsource_service_billed',
+    'Sub Cost Centre Code': 'sub_cost_centre_code',
+    'Sub Cost Centre Name': 'sub_cost_centre_name',
+    'Service TAT': 'service_tat',
+    'Service Date.': 'service_date',
+    'Category Code': 'category_code',
+    'Category': 'category',
+    'Grouping Code': 'grouping_code',
+    'Grouping': 'grouping',
+    'Ledger Code': 'ledger_code',
+    'Ledger Name': 'ledger_name',
+    'Alias Code': 'alias_code',
+    'Alias Name': 'alias_name',
+    'Amount': 'amount',
+    'Remarks': 'remarks',
+    'Primary Cost Driver': 'primary_cost_driver',
+    'Nature of Data': 'nature_of_data',
+    'CC_Type': 'cc_type',
+    'Cost Centre Code': 'cost_centre_code',
+    'Cost centre category': 'cost_centre_category',
+    'Cost Centre': 'cost_centre',
+    'Cost Centre Name': 'cost_centre_name',
+    'Cost Driver': 'cost_driver',
+    'Source of Driver': 'source_of_driver',
+    'Bill No.': 'bill_no',
+    'Pharmacy Charged to patient': 'pharmacy_charged_to_patient',
+    'Medical & Surgical Consumables Charged to patient': 'medical_surgical_consumables_charged_to_patient',
+    'Implants and Prosthetics - Charged to patient': 'implants_and_prosthetics_charged_to_patient',
+    'Non Medical Consumables Charged To Patient': 'non_medical_consumables_charged_to_patient',
+    'Fee For Service': 'fee_for_service',
+    'Incentives To Consultants/ Treating Doctors': 'incentives_to_consultants_treating_doctors',
+    'Patient Food & Beverages - Outsource service': 'patient_food_beverages_outsource_service',
+    'Laboratory Test Outsource service': 'laboratory_test_outsource_service',
+    'Any Other patient related Outsourced Services_1': 'any_other_patient_related_outsourced_services_1',
+    'Any Other patient related Outsourced Services_2': 'any_other_patient_related_outsourced_services_2',
+    'Any Other patient related Outsourced Services_3': 'any_other_patient_related_outsourced_services_3',
+    'Brokerage & Commission': 'brokerage_commission',
+    'Provision for Deduction & Bad Debts': 'provision_for_deduction_bad_debts',
+    'Doctor Name': 'doctor_name',
+    'Group Code': 'group_code',
+    'Group Name': 'group_name',
+    'Sub - Group Code': 'sub_group_code',
+    'Sub - Group Name': 'sub_group_name',
+    'Associate Code': 'associate_code',
+    'Associate Name': 'associate_name',
+    'Period': 'period',
+    'Date of Joining': 'date_of_joining',
+    'Date of Resignation': 'date_of_resignation',
+    'Working Period': 'working_period',
+    'Department': 'department',
+    'Sub Department': 'sub_department',
+    'Designation': 'designation',
+    'Efforts Category': 'efforts_category',
+    'Master for Multiple': 'master_for_multiple',
+    'Nature Of Allocation': 'nature_of_allocation',
+    'Efforts Allocation': 'efforts_allocation',
+    'Efforts Sub - Allocation': 'efforts_sub_allocation',
+    'Utilization': 'utilization',
+    'Available Hours': 'available_hours',
+    'Actual Hours': 'actual_hours',
+    'Basic Pay': 'basic_pay',
+    'Allowances': 'allowances',
+    'Other Benefits': 'other_benefits',
+    'Overtime': 'overtime',
+    'Bonus': 'bonus',
+    'EPF': 'epf',
+    'ESIC': 'esic',
+    'Any Other Contribution': 'any_other_contribution',
+    'Gross Total': 'gross_total',
+    'Deduction': 'deduction',
+    'Net Salary': 'net_salary',
+    'No. of Headcount': 'no_of_headcount',
+    'Medical Record Number or Registration Number (UHID)': 'medical_record_number_or_registration_number_uhid',
+    'Patient Admission Date': 'patient_admission_date',
+    'Patient Discharge Date': 'patient_discharge_date',
+    'Sub Cost Centre': 'sub_cost_centre',
+    'Bed Number': 'bed_number',
+    'Length Of Stay In Hours': 'length_of_stay_in_hours',
+    'The Date & Time at which Patient was transferred to this Bed.': 'the_date_time_at_which_patient_was_transferred_to_this_bed',
+    'The Date & Time at which Patient left this Bed.': 'the_date_time_at_which_patient_left_this_bed',
+    'Ward Category Code': 'ward_category_code',
+    'Bed Category Name': 'bed_category_name',
+    'S.No.': 's_no',
+    'Anaesthesist Name': 'anaesthesist_name',
+    'Anesthesia Type': 'anesthesia_type',
+    'Type Of Procedure': 'type_of_procedure',
+    'Nature of Procedure': 'nature_of_procedure',
+    'On Table Time': 'on_table_time',
+    'Incision time': 'incision_time',
+    'Finish time': 'finish_time',
+    'Procedure Time': 'procedure_time',
+    'Change Over Time': 'change_over_time',
+    'Total Time': 'total_time',
+    'Transaction Date': 'transaction_date',
+    'From - Store': 'from_store',
+    'To - Store': 'to_store',
+    'SKU Name': 'sku_name',
+    'Unit of Measurement': 'unit_of_measurement',
+    'Quantity': 'quantity',
+    'Rate': 'rate',
+    'Transaction Value (Excluding Tax)': 'transaction_value_excluding_tax',
+    'Connected Load': 'connected_load',
+    'Running Load': 'running_load',
+    'Standby Load': 'standby_load',
+    'Days': 'days',
+    'Hours': 'hours',
+    'Total Load (Kg)': 'total_load_kg',
+    'TAT': 'tat',
+    'Bio Medical Equipments': 'bio_medical_equipments',
+    'Engineering Equipments': 'engineering_equipments',
+    'Furniture & Fixture': 'furniture_fixture',
+    'Others': 'others',
+    'Nursing Hostel Occupancy': 'nursing_hostel_occupancy',
+    'Doctors hostel Occupancy': 'doctors_hostel_occupancy',
+    'Staff accomodation Occupancy': 'staff_accomodation_occupancy',
+    'Frequency of Audit': 'frequency_of_audit',
+    'No. of IT Users': 'no_of_it_users',
+    'No. of Transaction in Finance & Billing Cost Centre': 'no_of_transaction_in_finance_billing_cost_centre',
+    'List of Equipment for which loan was taken': 'list_of_equipment_for_which_loan_was_taken',
+    'No. of  Trips (Km)': 'no_of_trips_km',
+    'No. of Laboratory Test': 'no_of_laboratory_test',
+    'No. of Sample collected & Report dispatch': 'no_of_sample_collected_report_dispatch',
+    'No. of Home sample collection': 'no_of_home_sample_collection',
+    'No. of Radiology Test': 'no_of_radiology_test',
+    'No. of Neuro Test': 'no_of_neuro_test',
+    'No. of Cardiac Test': 'no_of_cardiac_test',
+    'No. of Nuclear Medicine Test': 'no_of_nuclear_medicine_test',
+    'No. of IVF Consultation': 'no_of_ivf_consultation',
+    'OT Time (Hours)': 'ot_time_hours',
+    'CCU Occupancy': 'ccu_occupancy',
+    'MICU Occupancy': 'micu_occupancy',
+    'PICU Occupancy': 'picu_occupancy',
+    'NICU Occupancy': 'nicu_occupancy',
+    'HDU Occupancy': 'hdu_occupancy',
+    'Issolation Room Occupancy': 'issolation_room_occupancy',
+    'GW Occupancy': 'gw_occupancy',
+    'PW-SR Occupancy': 'pw_sr_occupancy',
+    'SW-TS Occupancy': 'sw_ts_occupancy',
+    'DW Occupancy': 'dw_occupancy',
+    'Head office': 'head_office',
+    'Other Unit 1 Allocation Ratio': 'other_unit_1_allocation_ratio',
+    'Other Unit 2 Allocation Ratio': 'other_unit_2_allocation_ratio',
+    'Other Unit 3 Allocation Ratio': 'other_unit_3_allocation_ratio',
+    'Other Unit 4 Allocation Ratio': 'other_unit_4_allocation_ratio',
+    'Other Unit 5 Allocation Ratio': 'other_unit_5_allocation_ratio',
+    'No. of Patient (OP+IP)': 'no_of_patient_op_ip',
+    'No. of Corporate Patient (OP+IP)': 'no_of_corporate_patient_op_ip',
+    'No. of Institutional Patient (OP+IP)': 'no_of_institutional_patient_op_ip',
+    'No. of International Patient (OP+IP)': 'no_of_international_patient_op_ip',
+    'No. of IP Patients': 'no_of_ip_patients',
+    'No. of Credit IP Patients': 'no_of_credit_ip_patients',
+    'Surgical Store Issue Ratio': 'surgical_store_issue_ratio',
+    'Central Store Issue Ratio': 'central_store_issue_ratio',
+    'Non Surgical Store Issue Ratio': 'non_surgical_store_issue_ratio',
+    'Stationery/Housekeeping Issue Ratio': 'stationery_housekeeping_issue_ratio',
+    'No. of Doctors': 'no_of_doctors',
+    'Doctor Fee for Service Ratio': 'doctor_fee_for_service_ratio',
+    'Consultant retainer fee/MG/Bonus Ratio': 'consultant_retainer_fee_mg_bonus_ratio',
+    'No. of Nursing Staff': 'no_of_nursing_staff',
+    'Nursing Station 1 for Care Units': 'nursing_station_1_for_care_units',
+    'Nursing Station 2 for Care Units': 'nursing_station_2_for_care_units',
+    'Nursing Station 3 for Care Units': 'nursing_station_3_for_care_units',
+    'Nursing Station 4 for Care Units': 'nursing_station_4_for_care_units',
+    'Nursing Station 5 for Care Units': 'nursing_station_5_for_care_units',
+    'Service under OP Billing 1': 'service_under_op_billing_1',
+    'Service under OP Billing 2': 'service_under_op_billing_2',
+    'Service under OP Billing 3': 'service_under_op_billing_3',
+    'Service under OP Billing 4': 'service_under_op_billing_4',
+    'No. of CSSD Set Issued': 'no_of_cssd_set_issued',
+    'No. of Diet Served': 'no_of_diet_served',
+    'No. of Ward Boy': 'no_of_ward_boy',
+    'No. of Housekeeping Staff': 'no_of_housekeeping_staff',
+    'No. of Fumigation Cycle Performed/ Standard Resource Allocation Ratio': 'no_of_fumigation_cycle_performed_standard_resource_allocation_ratio',
+    'Volume of Cloth Load': 'volume_of_cloth_load',
+    'Efforts of Supply Chain Department': 'efforts_of_supply_chain_department',
+    'Area in sq. meter': 'area_in_sq_meter',
+    'No. of Security Staff Deployed/ No. of Exits.': 'no_of_security_staff_deployed_no_of_exits',
+    'Actual Water Utilization/ Standard Utilization Ratio.': 'actual_water_utilization_standard_utilization_ratio',
+    'Actual Gas Utilization/ Standard Utilization Ratio.': 'actual_gas_utilization_standard_utilization_ratio',
+    'Actual Vaccume Utilization/ Standard Utilization Ratio.': 'actual_vaccume_utilization_standard_utilization_ratio',
+    'Civil': 'civil',
+    'Date of final bill - DD/MM/YY': 'date_of_final_bill',
+    'Service Sub department': 'service_sub_department',
+    'Service Status i.e. Active or Cancelled': 'service_status',
+    'under Package or Not': 'is_packaged',
+    'Outsourced or Inhouse': 'is_outsourced',
+    'Emergency charges for Service or Not': 'emergency_charges_applied',
+    'Service Date': 'service_date',
+    'Sub - Cost Centre Code': 'sub_cost_centre_code',
+    'Sub - Cost Centre Name': 'sub_cost_centre',
+    'Bill No': 'bill_no',
+    'The date at which service was provided to patient.': 'service_date',
+    'The Name of Services Billed': 'service_name'
+}
+
+# Column names of the mapping that the tables store under another name
+FIELD_ALIASES = {
+    'sub_cost_centre_name': 'sub_cost_centre',
+    'service_status_i_e_active_or_cancelled': 'service_status',
+    'under_package_or_not': 'is_packaged',
+    'outsourced_or_inhouse': 'is_outsourced',
+    'emergency_charges_for_service_or_not': 'emergency_charges_applied',
+}
+
+# Sheet wordings of yes/no columns, read as the true/false the converters expect
+SHEET_VALUES = {
+    'is_outsourced': {'outsourced': 'true', 'inhouse': 'false', 'in-house': 'false', 'in house': 'false'},
+    'is_packaged': {'package': 'true', 'packaged': 'true', 'non package': 'false', 'non-package': 'false'},
+}
+
+def _normalize_title(title: str) -> str:
+    return ' '.join(title.split()).lower()
+
+_TITLES = {
+    **{_normalize_title(title): name for title, name in COLUMN_RENAME_MAP.items()},
+    # Upsert key of the tables without a natural key; not a workbook column
+    'external id': 'external_id',
+}
+
+def sheet_column_name(title: Any) -> Optional[str]:
+    """Column name for a sheet title; titles outside the mapping pass through, blank ones are None"""
+    if title is None or (isinstance(title, float) and np.isnan(title)):
+        return None
+    title = str(title).strip()
+    if not title:
+        return None
+    name = COLUMN_RENAME_MAP.get(title) or _TITLES.get(_normalize_title(title), title)
+    return FIELD_ALIASES.get(name, name)
+
+def _header_columns(header: Sequence[Any]) -> Tuple[List[int], List[str]]:
+    # Positions and names of the columns to keep; a name seen twice keeps the first column,
+    # later ones keep their sheet title and are ignored
+    positions, names = [], []
+    for position, title in enumerate(header):
+        name = sheet_column_name(title)
+        if name is None:
+            continue
+        if name in names:
+            name = str(title).strip()
+        positions.append(position)
+        names.append(name)
+    return positions, names
+
+def _csv_rows(file: BinaryIO, sheet: Optional[str]) -> Iterator[Sequence[Any]]:
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        # Leave the upload open for its owner
+        text.detach()
+
+def _xlsx_rows(file: BinaryIO, sheet: Optional[str]) -> Iterator[Sequence[Any]]:
+    # Only workbook uploads need openpyxl; read-only mode parses the sheet as it is iterated
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        if sheet is None:
+            worksheet = workbook.worksheets[0]
+        elif sheet in workbook.sheetnames:
+            worksheet = workbook[sheet]
+        else:
+            raise ValueError(f"Workbook has no sheet {sheet}; sheets: {', '.join(workbook.sheetnames)}")
+        yield from worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def sheet_format(filename: Optional[str]) -> str:
+    """'xlsx' or 'csv' by the upload's file extension"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in SHEET_EXTENSIONS:
+        raise ValueError(f"Unsupported file type; expected one of: {', '.join(SHEET_EXTENSIONS)}")
+    return SHEET_EXTENSIONS[extension]
+
+def _chunk_frame(rows: List[Sequence[Any]], positions: List[int], names: List[str], first: int) -> Tuple[pd.DataFrame, np.ndarray]:
+    # Kept columns of the rows, without the blank ones, and the data row numbers of those left
+    width = max(positions) + 1
+    padded = [tuple(row[:width]) + (None,) * (width - len(row)) for row in rows]
+    frame = pd.DataFrame.from_records(padded, columns=range(width))[positions]
+    frame.columns = names
+
+    blank = np.ones(len(frame), dtype=bool)
+    for name in names:
+        column = frame[name]
+        blank &= (column.isna() | (column.astype(str).str.strip() == '')).to_numpy()
+    for name, values in SHEET_VALUES.items():
+        if name in frame.columns:
+            text = frame[name].astype(str).str.strip().str.lower()
+            frame[name] = text.map(values).where(text.isin(values.keys()), frame[name])
+
+    keep = np.flatnonzero(~blank)
+    return frame.iloc[keep].reset_index(drop=True), keep + first
+
+def read_sheet_chunks(file: BinaryIO, filename: Optional[str], sheet: Optional[str] = None,
+                      header_row: int = SHEET_HEADER_ROW, data_row: int = SHEET_DATA_ROW,
+                      chunk_rows: Optional[int] = None) -> Iterator[Tuple[pd.DataFrame, np.ndarray]]:
+    """Frames of up to chunk_rows data rows of a sheet, columns named through COLUMN_RENAME_MAP
+
+    Each frame comes with its rows' numbers counted from data_row. Fully blank
+    rows are skipped. Only the rows of the current chunk are held in memory.
+    """
+    if not 0 <= header_row < data_row:
+        raise ValueError("header_row must be below data_row, and neither negative")
+    chunk_rows = max(chunk_rows or settings.sheet_upload_chunk_rows, 1)
+    reader = _xlsx_rows if sheet_format(filename) == 'xlsx' else _csv_rows
+
+    rows = reader(file, sheet)
+    try:
+        leading = list(islice(rows, data_row))
+        if len(leading) <= header_row:
+            raise ValueError(f"Sheet has no header on row {header_row}")
+        positions, names = _header_columns(leading[header_row])
+        if not names:
+            raise ValueError(f"Sheet has no column titles on row {header_row}")
+
+        first = 0
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                return
+            yield _chunk_frame(chunk, positions, names, first)
+            first += len(chunk)
+    finally:
+        rows.close()
+
+async def ingest_sheet(db, table: str, model: typing.Type[BaseModel],
+                       chunks: Iterator[Tuple[pd.DataFrame, np.ndarray]],
+                       progress: Optional[Callable[[Optional[float], str], Awaitable[None]]] = None,
+                       upsert: bool = False) -> Dict[str, Any]:
+    """Validate and insert (or upsert) every chunk of a sheet for db's user; the next chunk is read while one inserts
+
+    progress, when given, is awaited after each chunk with the rows loaded so far.
+    Chunks are written in order, so with upsert the last row of an upsert key wins.
+    A chunk refused as a whole ends the upload with the chunks before it written;
+    with upsert, sending the corrected sheet again is safe.
+    """
+    received, inserted, superseded, errors, ignored = 0, 0, 0, [], None
+
+    pending = asyncio.create_task(asyncio.to_thread(next, chunks, None))
+    try:
+        while True:
+            chunk = await pending
+            if chunk is None:
+                break
+            pending = asyncio.create_task(asyncio.to_thread(next, chunks, None))
+
+            frame, row_numbers = chunk
+            count, chunk_superseded, chunk_errors, chunk_ignored = await ingest_chunk(
+                db, table, model, frame, row_numbers, upsert
+            )
+            received += len(frame)
+            inserted += count
+            superseded += chunk_superseded
+            errors.extend(chunk_errors)
+            if ignored is None:
+                ignored = chunk_ignored
+            if progress is not None:
+                await progress(None, f"{received} rows read, {inserted} inserted")
+    finally:
+        # A read still running holds the generator; it has to finish before the sheet is closed
+        await asyncio.gather(pending, return_exceptions=True)
+        await asyncio.to_thread(chunks.close)
+
+    return ingest_summary(table, received, inserted, errors, ignored or [], superseded)
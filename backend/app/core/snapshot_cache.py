@@ -0,0 +1,73 @@
+"""
+Snapshot Cache - Per-user columnar snapshots of tenant tables on local disk
+Stored as uncompressed Arrow IPC files so reads are memory-mapped instead of re-pulled as JSON
+"""
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional, Dict, Any, Tuple
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SnapshotCache:
+    """Arrow snapshots of each (user, table) with the high-water mark they were taken at"""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def _paths(self, user_id: str, table: str) -> Tuple[str, str]:
+        user_dir = os.path.join(self.root_dir, user_id)
+        return os.path.join(user_dir, f"{table}.arrow"), os.path.join(user_dir, f"{table}.json")
+
+    def read(self, user_id: str, table: str) -> Tuple[Optional[pd.DataFrame], Optional[Dict[str, Any]]]:
+        """Return the snapshot frame and its metadata, or (None, None) when there is none"""
+        data_path, meta_path = self._paths(user_id, table)
+
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None, None
+
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            df = feather.read_table(data_path, memory_map=True).to_pandas()
+            return df, meta
+        except Exception as e:
+            logger.warning(f"Discarding unreadable snapshot {data_path}: {e}")
+            self.invalidate(user_id, table)
+            return None, None
+
+    def write(self, user_id: str, table: str, df: pd.DataFrame, meta: Dict[str, Any]):
+        """Atomically replace the snapshot of a table"""
+        data_path, meta_path = self._paths(user_id, table)
+        user_dir = os.path.dirname(data_path)
+        os.makedirs(user_dir, exist_ok=True)
+
+        arrow_table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+
+        # Write next to the target and rename, so readers never see a partial file
+        fd, tmp_data = tempfile.mkstemp(dir=user_dir, suffix=".arrow.tmp")
+        os.close(fd)
+        feather.write_feather(arrow_table, tmp_data, compression="uncompressed")
+        fd, tmp_meta = tempfile.mkstemp(dir=user_dir, suffix=".json.tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f)
+
+        os.replace(tmp_data, data_path)
+        os.replace(tmp_meta, meta_path)
+
+    def invalidate(self, user_id: str, table: Optional[str] = None):
+        """Drop one table's snapshot, or every snapshot of the user"""
+        if table is None:
+            shutil.rmtree(os.path.join(self.root_dir, user_id), ignore_errors=True)
+            return
+
+        for path in self._paths(user_id, table):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
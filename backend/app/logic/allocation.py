@@ -0,0 +1,380 @@
+"""
+Allocation - Sparse-matrix engines for pushing cost-centre costs through the allocation graph
+Level-by-level propagation matching the topological sort, and a reciprocal solve for cyclic graphs
+"""
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from typing import Dict, List, Tuple
+from functools import cached_property
+import logging
+
+logger = logging.getLogger(__name__)
+
+class IrregularGraphError(ValueError):
+    """Raised for graphs whose legacy processing can't be reproduced level by level"""
+
+class SingularAllocationError(ValueError):
+    """Raised when cost circulates between cost centres without ever leaving them"""
+
+class AllocationGraph:
+    """Cost-centre graph encoded as a sparse weight matrix with a level schedule
+
+    Row p of the weight matrix holds the edges node p allocates on: its cost
+    centre children, or its service children when it has no cost centre
+    children, as in the topological sort. A node propagates once every node with
+    an edge to it (allocating or not) has propagated; nodes that never qualify
+    still receive costs but pass nothing on. Levels group nodes whose parents
+    have all propagated, so each level is one sparse product over every cost
+    type at once.
+
+    The reciprocal method instead lets every allocating node pass on its full
+    cost, including cost received back around cycles, by solving
+    (I - A)^T x = p for the total cost x of every node.
+    """
+
+    def __init__(self, node_dict: Dict[str, object]):
+        self.nodes = list(node_dict.values())
+        self.names = list(node_dict.keys())
+        self.index = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+        self._resolved: Dict[int, np.ndarray] = {}
+
+        active_cols, active_weights, active_rows = [], [], []
+        parent_cols, parent_rows = [], []
+        for p, node in enumerate(self.nodes):
+            children_cc = getattr(node, 'children_cc', None)
+            if children_cc is None:
+                continue
+
+            cc_targets, cc_weights = self._edge_arrays(children_cc, getattr(node, 'children_cc_lists', []))
+            svc_targets, svc_weights = self._edge_arrays(node.children_svc, [])
+
+            targets, weights = (cc_targets, cc_weights) if len(children_cc) > 0 else (svc_targets, svc_weights)
+            active_cols.append(targets)
+            active_weights.append(weights)
+            active_rows.append(np.full(len(targets), p))
+
+            parent_cols.extend([cc_targets, svc_targets])
+            parent_rows.append(np.full(len(cc_targets) + len(svc_targets), p))
+
+        self.weights = self._matrix(active_rows, active_cols, active_weights, n)
+        # Parallel edges are summed into one weight; only the level schedule minds them
+        self.has_parallel_edges = self.weights.nnz != sum(len(cols) for cols in active_cols)
+
+        self.structure = self.weights.copy()
+        self.structure.data[:] = 1.0
+
+        # Distinct parents per node over every edge, allocating or not
+        parents = self._matrix(parent_rows, parent_cols, None, n)
+        parents.data[:] = 1.0
+        self._parent_counts = np.asarray(parents.sum(axis=0)).ravel()
+
+    def _edge_arrays(self, edges, edge_lists) -> Tuple[np.ndarray, np.ndarray]:
+        """Target indices and weights of an edge list, read from EdgeList arrays when they cover it"""
+        if edge_lists and sum(len(edge_list) for edge_list in edge_lists) == len(edges):
+            targets = [self._target_indices(edge_list) for edge_list in edge_lists]
+            weights = [edge_list.drivers for edge_list in edge_lists]
+            return np.concatenate(targets), np.concatenate(weights).astype('float64')
+
+        return (
+            np.array([self.index[edge.target_node.name] for edge in edges], dtype='int64'),
+            np.array([edge.driver for edge in edges], dtype='float64'),
+        )
+
+    def _target_indices(self, edge_list) -> np.ndarray:
+        # Shared by every parent on the driver, so resolve the names once per EdgeList
+        key = id(edge_list)
+        if key not in self._resolved:
+            self._resolved[key] = np.array(
+                [self.index[target.name] for target in edge_list.targets], dtype='int64'
+            )
+        return self._resolved[key]
+
+    @staticmethod
+    def _matrix(rows, cols, weights, n) -> sp.csr_matrix:
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype='int64')
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype='int64')
+        data = np.concatenate(weights) if weights else np.ones(len(rows))
+        # Duplicate entries are summed; explicit zero weights are kept as edges
+        return sp.csr_matrix((data, (rows, cols)), shape=(n, n))
+
+    @cached_property
+    def levels(self) -> List[np.ndarray]:
+        """Kahn's algorithm one frontier at a time; the node indices of each level"""
+        remaining = self._parent_counts.copy()
+        scheduled = np.zeros(len(remaining), dtype=bool)
+        frontier = np.flatnonzero(remaining == 0)
+        structure_t = self.structure.T.tocsr()
+        levels = []
+
+        while len(frontier) > 0:
+            levels.append(frontier)
+            scheduled[frontier] = True
+            indicator = np.zeros(len(remaining))
+            indicator[frontier] = 1.0
+            remaining -= structure_t @ indicator
+            frontier = np.flatnonzero((remaining == 0) & ~scheduled)
+
+        return levels
+
+    @cached_property
+    def _level_matrices(self) -> List[Tuple[np.ndarray, sp.csr_matrix, sp.csr_matrix]]:
+        # Transposed per-level slices, taken once and reused by every propagation
+        level_matrices = []
+        for level in self.levels:
+            weights = self.weights[level]
+            if weights.nnz > 0:
+                structure = self.structure[level]
+                level_matrices.append((level, weights.T.tocsr(), structure.T.tocsr()))
+        return level_matrices
+
+    @property
+    def processed(self) -> int:
+        return int(sum(len(level) for level in self.levels))
+
+    def propagate(self, costs: np.ndarray, present: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Push a nodes x cost_types matrix of primary costs through the graph
+
+        present marks the entries a node's cost dict holds; an entry becomes present
+        once any allocating parent has it, matching the dicts' zero-initialised keys.
+        """
+        if self.has_parallel_edges:
+            # A parent reaching the same node twice gets that node processed twice by the
+            # topological sort, which a single pass per level can't mirror
+            raise IrregularGraphError("a cost centre allocates to the same node more than once")
+
+        costs = costs.copy()
+        present = present.copy()
+
+        for level, weights_t, structure_t in self._level_matrices:
+            costs += weights_t @ np.where(present[level], costs[level], 0.0)
+            present |= (structure_t @ present[level].astype('float64')) > 0
+
+        return costs, present
+
+    @property
+    def unprocessed(self) -> List[str]:
+        """Allocating nodes the level schedule never reaches, such as those on cycles"""
+        scheduled = np.zeros(len(self.nodes), dtype=bool)
+        for level in self.levels:
+            scheduled[level] = True
+        allocating = np.diff(self.weights.indptr) > 0
+        return [self.names[i] for i in np.flatnonzero(allocating & ~scheduled)]
+
+    @cached_property
+    def _reciprocal_system(self) -> Tuple[np.ndarray, sp.csr_matrix, sp.csc_matrix, object]:
+        # Factorized once per graph and reused by every later solve
+        allocating = np.flatnonzero(np.diff(self.weights.indptr) > 0)
+        a_r = self.weights[allocating]
+        system = (sp.identity(len(allocating), format='csc') - a_r[:, allocating].T).tocsc()
+
+        factor = None
+        if len(allocating) > 0:
+            try:
+                factor = spla.splu(system)
+            except RuntimeError as e:
+                logger.warning(f"Sparse LU failed ({e}); solving iteratively")
+
+        return allocating, a_r, system, factor
+
+    def solve_reciprocal(self, costs: np.ndarray, present: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Total cost of every node when allocating nodes pass on everything they hold
+
+        Only the allocating nodes are coupled, so (I - A_rr)^T x_r = p_r is solved
+        for them with a sparse LU over all cost types at once, falling back to
+        GMRES if the factorization fails. Every other node then receives
+        x = p + A_r^T x_r. A cost type is present wherever an allocating
+        node holding it can reach.
+        """
+        allocating, a_r, system, factor = self._reciprocal_system
+        rhs = np.where(present, costs, 0.0)
+
+        totals_r = self._solve(system, factor, rhs[allocating])
+
+        totals = rhs + a_r.T @ totals_r
+
+        # Reachability to a fixed point; each pass extends the presence one edge further
+        structure_t = self.structure.T.tocsr()
+        while True:
+            reached = present | ((structure_t @ present.astype('float64')) > 0)
+            if (reached == present).all():
+                break
+            present = reached
+
+        return totals, present
+
+    @staticmethod
+    def _solve(system: sp.csc_matrix, factor, rhs: np.ndarray) -> np.ndarray:
+        if rhs.size == 0:
+            return rhs.copy()
+
+        if factor is not None:
+            return np.asarray(factor.solve(rhs)).reshape(rhs.shape)
+
+        solution = np.zeros_like(rhs)
+        for j in range(rhs.shape[1]):
+            solution[:, j], info = spla.gmres(system, rhs[:, j], atol=1e-10)
+            if info != 0:
+                raise SingularAllocationError(
+                    "allocation system has no solution; cost centres allocate to each other in a closed loop"
+                )
+        return solution
+
+    def transfer_matrices(self, targets: np.ndarray, reciprocal: bool = False) -> Tuple[sp.csr_matrix, sp.csr_matrix]:
+        """What each target node receives per unit of primary cost on every node, and which nodes reach it
+
+        Row t of the transfer matrix holds the cost target t ends up with for one
+        unit on each node, so target costs are transfer @ costs, as propagate (or
+        solve_reciprocal) would leave them. Costs a node doesn't hold are zero
+        anyway, so only the presence depends on the masks: the reach matrix
+        marks the nodes whose cost types a target picks up.
+        """
+        n = len(self.names)
+        identity = sp.identity(n, format='csr')
+
+        if reciprocal:
+            allocating, a_r, system, factor = self._reciprocal_system
+            # A unit on an allocating node circulates among them; any other node keeps its own
+            totals_r = self._solve(system, factor, np.eye(len(allocating)))
+            spread = sp.csr_matrix(
+                (np.ones(len(allocating)), (np.arange(len(allocating)), allocating)), shape=(len(allocating), n)
+            )
+            transfer = identity + sp.csr_matrix(a_r.T @ totals_r) @ spread
+
+            structure_t = self.structure.T.tocsr()
+            reach = identity.copy()
+            while True:
+                reached = ((reach + structure_t @ reach) > 0).astype('float64')
+                if reached.nnz == reach.nnz:
+                    break
+                reach = reached
+        else:
+            if self.has_parallel_edges:
+                raise IrregularGraphError("a cost centre allocates to the same node more than once")
+
+            transfer, reach = identity, identity.copy()
+            for level, weights_t, structure_t in self._level_matrices:
+                transfer = transfer + weights_t @ transfer[level]
+                reach = ((reach + structure_t @ reach[level]) > 0).astype('float64')
+
+        return transfer[targets].tocsr(), reach[targets].tocsr()
+
+    def allocate(self, reciprocal: bool = False) -> int:
+        """Run the allocation on the nodes' cost dicts in place; returns the processed node count"""
+        primary = [(i, node.cost) for i, node in enumerate(self.nodes) if node.cost]
+        cost_types = list(dict.fromkeys(cost_type for _, cost in primary for cost_type in cost))
+        column = {cost_type: j for j, cost_type in enumerate(cost_types)}
+
+        costs = np.zeros((len(self.nodes), len(cost_types)))
+        present = np.zeros((len(self.nodes), len(cost_types)), dtype=bool)
+        for i, cost in primary:
+            for cost_type, value in cost.items():
+                costs[i, column[cost_type]] = value
+                present[i, column[cost_type]] = True
+
+        if reciprocal:
+            costs, present = self.solve_reciprocal(costs, present)
+        else:
+            costs, present = self.propagate(costs, present)
+
+        rows = np.flatnonzero(present.any(axis=1))
+        for i, row, row_present in zip(rows.tolist(), costs[rows].tolist(), present[rows].tolist()):
+            self.nodes[i].cost = {
+                cost_type: value for cost_type, value, has in zip(cost_types, row, row_present) if has
+            }
+
+        return len(self.nodes) if reciprocal else self.processed
+
+    def release_nodes(self):
+        """Drop the node objects, keeping only the matrices, for a graph held on to after allocate"""
+        self.nodes = []
+        self._resolved.clear()
+
+    def __getstate__(self):
+        # Sent back from compute pool workers; the LU factorization doesn't pickle and is rebuilt on use
+        state = self.__dict__.copy()
+        state.pop('_reciprocal_system', None)
+        state['_resolved'] = {}
+        return state
+
+class AllocationMatrix:
+    """Transitive allocation of every node's primary cost onto a set of target nodes
+
+    Built once from an AllocationGraph, after which an allocation is a sparse
+    product per cost type with no graph in sight. version identifies the
+    structural inputs it was built from.
+    """
+
+    def __init__(self, names: List[str], targets: np.ndarray, transfer: sp.csr_matrix,
+                 reach: sp.csr_matrix, version: str):
+        self.names = names
+        self.targets = targets
+        self.transfer = transfer
+        self.reach = reach
+        self.version = version
+
+    @classmethod
+    def build(cls, graph: AllocationGraph, targets: List[str], version: str,
+              reciprocal: bool = False) -> 'AllocationMatrix':
+        target_indices = np.array([graph.index[name] for name in targets], dtype='int64')
+        transfer, reach = graph.transfer_matrices(target_indices, reciprocal)
+        return cls(list(graph.names), target_indices, transfer, reach, version)
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+            for matrix in (self.transfer, self.reach)
+        ) + self.targets.nbytes)
+
+    def allocate(self, node_dict: Dict[str, object]):
+        """Set the target nodes' cost dicts from the primary costs on the nodes of node_dict
+
+        node_dict has to hold the matrix's nodes in order; the other nodes keep
+        their primary costs.
+        """
+        nodes = list(node_dict.values())
+        primary = [(i, node.cost) for i, node in enumerate(nodes) if node.cost]
+        cost_types = list(dict.fromkeys(cost_type for _, cost in primary for cost_type in cost))
+        column = {cost_type: j for j, cost_type in enumerate(cost_types)}
+
+        costs = np.zeros((len(nodes), len(cost_types)))
+        present = np.zeros((len(nodes), len(cost_types)))
+        for i, cost in primary:
+            for cost_type, value in cost.items():
+                costs[i, column[cost_type]] = value
+                present[i, column[cost_type]] = 1.0
+
+        target_costs = self.transfer @ costs
+        target_present = (self.reach @ present) > 0
+
+        for t, row, row_present in zip(self.targets.tolist(), target_costs.tolist(), target_present.tolist()):
+            nodes[t].cost = {
+                cost_type: value for cost_type, value, has in zip(cost_types, row, row_present) if has
+            }
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Plain arrays for storage; node names have to be strings"""
+        return {
+            'version': np.array(self.version),
+            'names': np.array(self.names, dtype=str),
+            'targets': self.targets,
+            'transfer_data': self.transfer.data,
+            'transfer_indices': self.transfer.indices,
+            'transfer_indptr': self.transfer.indptr,
+            'reach_indices': self.reach.indices,
+            'reach_indptr': self.reach.indptr,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'AllocationMatrix':
+        names = arrays['names'].tolist()
+        shape = (len(arrays['targets']), len(names))
+        transfer = sp.csr_matrix(
+            (arrays['transfer_data'], arrays['transfer_indices'], arrays['transfer_indptr']), shape=shape
+        )
+        reach = sp.csr_matrix(
+            (np.ones(len(arrays['reach_indices'])), arrays['reach_indices'], arrays['reach_indptr']), shape=shape
+        )
+        return cls(names, arrays['targets'], transfer, reach, str(arrays['version']))
@@ -4,20 +4,185 @@ Direct integration of Jupyter notebook logic without modifications
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Optional, Tuple, Any, Union
+from typing import Dict, List, Optional, Tuple, Any, Union, Callable, Awaitable, get_args
 from decimal import Decimal
+import calendar
+import hashlib
 import logging
 from collections import deque
 from queue import Queue
-from app.core.database_layer import DatabaseLayer
+from app.core.database_layer import (
+    DatabaseLayer, VARIABLE_COST_COLUMNS, SECONDARY_COST_DRIVER_COLUMNS, PERIOD_FILTER_KEYS,
+    TABLE_DATE_COLUMNS, filter_frame, period_month
+)
+from app.core.matrix_store import MatrixStore, period_key
+from app.core.sheet_ingest import COLUMN_RENAME_MAP, SHEET_HEADER_ROW, SHEET_DATA_ROW
+from app.core.result_cache import result_cache
+from app.core.compute_pool import compute_pool, ComputePoolError
+from app.core.job_queue import JobCancelled
+from app.core.config import settings, AllocationMode
+from app.logic.allocation import AllocationGraph, AllocationMatrix, IrregularGraphError
+from app.logic.incremental import AllocationState
+from app.logic.scenarios import scenario_deltas, primary_cost_matrix, SCENARIO_COST_TYPES
 
 logger = logging.getLogger(__name__)
 
+# Columns the allocation steps read from each input table; nothing else is fetched
+COST_INPUT_COLUMNS = {
+    'service_register': ['service_name', 'service_tat', 'sub_cost_centre', 'quantity',
+                         'bill_no', 'ipd_number', 'performing_doctor_name',
+                         'service_department', 'patient_type'],
+    'trial_balance': ['primary_cost_driver', 'amount'],
+    'expense_wise': ['sub_cost_centre', 'amount'],
+    'variable_cost_bill_wise': ['bill_no', 'ipd_number', 'service_name', 'doctor_name',
+                                *VARIABLE_COST_COLUMNS],
+    'hr_data': ['sub_cost_centre', 'net_salary'],
+    'consumption_data': ['sub_cost_centre', 'transaction_value_excluding_tax'],
+    'connected_load': ['sub_cost_centre', 'total_load_kg'],
+    'cost_center': ['sub_cost_centre', 'cost_driver'],
+    'secondary_cost_driver': ['sub_cost_centre', *SECONDARY_COST_DRIVER_COLUMNS],
+}
+
+# Engines for step 7: the notebook's topological sort, its sparse-matrix equivalent,
+# or the reciprocal method, which also allocates cost circulating between support centres
+ALLOCATION_MODES = get_args(AllocationMode)
+
+# Service-level filters and the service register column each one narrows.
+# They are applied to the output only: the allocation has to see every service
+# of the period, or cost-centre costs would be split over the filtered services alone.
+SERVICE_OUTPUT_FILTERS = {
+    'department': 'service_department',
+    'service_name': 'service_name',
+    'patient_type': 'patient_type',
+}
+
+# Inputs that shape the allocation graph rather than the costs flowing through it;
+# a persisted allocation matrix is valid for as long as these are unchanged
+STRUCTURE_COLUMNS = {
+    'cost_center': ['sub_cost_centre', 'cost_driver'],
+    'secondary_cost_driver': ['sub_cost_centre', *SECONDARY_COST_DRIVER_COLUMNS],
+    'service_register': ['service_name', 'service_tat', 'sub_cost_centre'],
+}
+
+# Bump when the way allocation matrices are built changes, to retire stored ones
+ALLOCATION_MATRIX_FORMAT = 1
+
+# Months a cost trend covers unless asked for fewer, in calendar order
+TREND_MONTHS = list(calendar.month_name)[1:]
+
+# Primary cost inputs a date range can't narrow, and the amount each brings to the
+# primary costs. In a trend, HR rows count in the month their period names; these
+# tables' other rows carry no month, are taken as the year's figures and put a
+# twelfth of their amount into every month. connected_load only splits the power
+# cost between cost centres, so it is used whole.
+ANNUAL_AMOUNT_COLUMNS = {'expense_wise': 'amount', 'trial_balance': 'amount', 'hr': 'net_salary'}
+
+# hr_data column naming the month a row is for, e.g. 'January 2024'
+HR_PERIOD_COLUMN = 'period'
+
+def trend_months(months: Optional[List[str]]) -> List[str]:
+    """Month names a cost trend covers, normalized and deduplicated; all twelve when none are given"""
+    normalized = [month.strip().capitalize() for month in (months or TREND_MONTHS)]
+    for month in normalized:
+        if month not in TREND_MONTHS:
+            raise ValueError(f"Unknown month: {month}")
+    return list(dict.fromkeys(normalized))
+
+# Estimated revenue until actual revenue data is wired in: a 20% markup over total cost
+REVENUE_MARKUP = 1.2
+
+def summarize_cost_frame(cost_df: pd.DataFrame) -> Dict[str, Any]:
+    """Summary metrics of a service-wise cost output frame
+    
+    Columnar throughout: line totals are row sums over the allocated and
+    variable cost blocks, margins are taken per service_name, and the most and
+    least profitable services and threshold counts come from numpy reductions.
+    """
+    if cost_df.empty:
+        return {}
+    
+    allocated = cost_df.reindex(columns=['cm', 'ew', 'hr', 'cn']).fillna(0)
+    variable = cost_df.reindex(columns=VARIABLE_COST_COLUMNS).fillna(0)
+    
+    allocated_by_type = allocated.sum()
+    total_allocated_costs = float(allocated_by_type.sum())
+    total_variable_costs = float(variable.to_numpy().sum())
+    total_costs = total_allocated_costs + total_variable_costs
+    
+    estimated_revenue = total_costs * REVENUE_MARKUP
+    overall_profit_margin = 0
+    if estimated_revenue > 0:
+        overall_profit_margin = (estimated_revenue - total_costs) / estimated_revenue * 100
+    
+    most_profitable = {'name': 'N/A', 'margin': 0}
+    least_profitable = {'name': 'N/A', 'margin': 0}
+    high_potential = critical_services = 0
+    
+    if 'service_name' in cost_df.columns:
+        line_costs = allocated.sum(axis=1) + variable.sum(axis=1)
+        service_costs = line_costs.groupby(cost_df['service_name'], observed=True, sort=False).sum()
+        
+        if not service_costs.empty:
+            costs = service_costs.to_numpy(dtype='float64')
+            revenue = costs * REVENUE_MARKUP
+            margins = np.zeros(len(costs))
+            np.divide((revenue - costs) * 100, revenue, out=margins, where=revenue > 0)
+            
+            best, worst = int(np.argmax(margins)), int(np.argmin(margins))
+            most_profitable = {'name': service_costs.index[best], 'margin': float(margins[best])}
+            least_profitable = {'name': service_costs.index[worst], 'margin': float(margins[worst])}
+            high_potential = int(np.count_nonzero(margins > 25))
+            critical_services = int(np.count_nonzero(margins < 10))
+    
+    def percent(cost_type):
+        return float(allocated_by_type[cost_type] / total_costs * 100) if total_costs > 0 and cost_type in cost_df.columns else 0
+    
+    return {
+        'total_services': len(cost_df),
+        'total_revenue': float(estimated_revenue),
+        'total_allocated_costs': float(total_costs),
+        'overall_profit_margin': float(overall_profit_margin),
+        'most_profitable_service': most_profitable,
+        'least_profitable_service': least_profitable,
+        'cost_breakdown': {
+            'allocated_costs': total_allocated_costs,
+            'variable_costs': total_variable_costs,
+            'cm_percent': percent('cm'),
+            'ew_percent': percent('ew'),
+            'hr_percent': percent('hr'),
+            'cn_percent': percent('cn')
+        },
+        'optimization_opportunities': {
+            'high_potential': high_potential,
+            'critical_services': critical_services
+        }
+    }
+
 class Edge:
     def __init__(self, target_node: 'Node', driver: float = 0.0):
         self.target_node = target_node
         self.driver: float = driver
 
+class EdgeList:
+    """Edges of one driver held as parallel arrays of target nodes and weights
+
+    Iterating yields Edge objects, built once and shared by every parent that
+    allocates on the driver.
+    """
+    
+    def __init__(self, targets: np.ndarray, drivers: np.ndarray):
+        self.targets = targets
+        self.drivers = drivers
+        self._edges: Optional[List[Edge]] = None
+    
+    def __len__(self):
+        return len(self.drivers)
+    
+    def __iter__(self):
+        if self._edges is None:
+            self._edges = [Edge(target, driver) for target, driver in zip(self.targets, self.drivers.tolist())]
+        return iter(self._edges)
+
 class Node:
     def __init__(self, name: str):
         self.name = name
@@ -30,6 +195,8 @@ class CostCenter(Node):
         super().__init__(name)
         self.children_cc: List[Edge] = []
         self.children_svc: List[Edge] = []
+        # EdgeLists children_cc was extended with, for engines that work on arrays
+        self.children_cc_lists: List[EdgeList] = []
 
 class Service(Node):
     def __init__(self, name: str, tat: float):
@@ -40,47 +207,122 @@ class Service(Node):
 class CostAnalysisModule:
     """Service-wise cost analysis module with exact Jupyter notebook logic"""
     
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, allocation_mode: Optional[str] = None):
         self.user_id = user_id
+        self.allocation_mode = allocation_mode or settings.allocation_mode
+        if self.allocation_mode not in ALLOCATION_MODES:
+            raise ValueError(f"Unknown allocation mode: {self.allocation_mode}")
         self.db_layer = DatabaseLayer(user_id)
         self.input_data = {}
         self.node_dict = {}
         self.rename_dict = {}
         self.secondary_drivers = {}
+        self.secondary_edges = {}
+        self.output_filters = {}
+        self.allocation_graph = None
+        self.allocation_matrix = None
+        self.output_lines = None
+        self.matrix_store = MatrixStore(settings.allocation_matrix_dir) if settings.allocation_matrix_dir else None
         
     def preprocess(self, df):
         """Exact preprocessing function from Jupyter notebook"""
-        df.columns = df.iloc[1]
-        df = df.iloc[3:].copy()
+        df.columns = df.iloc[SHEET_HEADER_ROW]
+        df = df.iloc[SHEET_DATA_ROW:].copy()
         df = df.loc[:, df.columns.notna()] 
         df = df.reset_index(drop=True)
         return df
     
     def build_edges(self, df, driver):
         """Exact build_edges function from Jupyter notebook"""
-        total = df[driver].sum()
-        edge_list = []
-        for _, row in df.iterrows():
-            if row['sub_cost_centre'] not in self.node_dict:
-                print(row['sub_cost_centre'], "not present in node dict!!")
-                continue
-                # self.node_dict[row['sub_cost_centre']] = CostCenter(row['sub_cost_centre'])
-            edge_list.append(Edge(target_node=self.node_dict[row['sub_cost_centre']], driver=row[driver] / total))
-        return edge_list
+        return self.build_edge_lists(df, [driver])[driver]
+    
+    def build_edge_lists(self, df, drivers):
+        """Normalize every driver column of df at once into one EdgeList per driver
+        
+        Weights are a column's positive values over their sum, as in build_edges.
+        Rows whose sub cost centre has no node still count towards the sum but get no edge.
+        """
+        values = df[drivers].to_numpy(dtype='float64')
+        positive = values > 0
+        masked = np.where(positive, values, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = masked / masked.sum(axis=0)
+        
+        sccs = df['sub_cost_centre'].to_numpy(dtype=object)
+        nodes = np.array([self.node_dict.get(scc) for scc in sccs], dtype=object)
+        known = np.array([node is not None for node in nodes], dtype=bool)
+        
+        for scc in pd.unique(sccs[~known & positive.any(axis=1)]):
+            print(scc, "not present in node dict!!")
+        
+        edge_lists = {}
+        for j, driver in enumerate(drivers):
+            rows = np.flatnonzero(positive[:, j] & known)
+            edge_lists[driver] = EdgeList(nodes[rows], weights[rows, j])
+        return edge_lists
     
     async def generate_service_wise_cost_analysis(self, 
-                                                filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+                                                filters: Optional[Dict[str, Any]] = None,
+                                                progress: Optional[Callable[[float, str], Awaitable[None]]] = None,
+                                                raise_errors: bool = False) -> pd.DataFrame:
         """
         Main function to generate service-wise cost analysis
         Direct implementation of Jupyter notebook logic
+        progress, when given, is awaited with the fraction done and the step starting;
+        with raise_errors, a failed analysis raises instead of giving an empty frame
         """
         try:
-            # Step 1: Load all data from database
-            await self._load_input_data(filters)
+            # Unchanged inputs and filters give the same frame; serve it from the cache
+            filters = {k: v for k, v in (filters or {}).items() if v is not None}
+            versions = await self.db_layer.data_versions(list(COST_INPUT_COLUMNS))
+            cache_key = result_cache.make_key(
+                self.user_id, {**filters, 'allocation_mode': self.allocation_mode}, versions
+            )
+            cached_df = result_cache.get(cache_key)
+            if cached_df is not None:
+                logger.info(f"Served service-wise cost analysis from cache with {len(cached_df)} records")
+                return cached_df
+            
+            # Step 1: Load all data from database, pushing down only the period filters
+            if progress is not None:
+                await progress(0.0, "Loading input data")
+            self.output_filters = {k: v for k, v in filters.items() if k in SERVICE_OUTPUT_FILTERS}
+            await self._load_input_data({k: v for k, v in filters.items() if k not in SERVICE_OUTPUT_FILTERS})
             
-            # Step 2: Build rename dictionary (placeholder - would need actual mapping file)
-            self._build_rename_dict()
+            # Steps 2-8 are CPU-bound; they run in the compute pool so other requests keep being served
+            if progress is not None:
+                await progress(0.5, "Allocating costs")
+            final_df, state = await compute_pool.run(
+                _compute_cost_analysis, self.input_data, self.user_id, self.allocation_mode,
+                self.output_filters, {k: v for k, v in filters.items() if k in PERIOD_FILTER_KEYS}
+            )
             
+            # Keyed on the counters read before loading: a write landing meanwhile moves
+            # them on, so a result that may have seen it is never reached
+            if not final_df.empty:
+                result_cache.put(cache_key, final_df, state)
+            
+            logger.info(f"Generated service-wise cost analysis with {len(final_df)} records")
+            return final_df
+            
+        except (ComputePoolError, JobCancelled):
+            # Lost or timed-out computations are server errors, not an empty analysis
+            raise
+        except Exception as e:
+            logger.error(f"Error in service-wise cost analysis: {e}")
+            if raise_errors:
+                raise
+            return pd.DataFrame()
+    
+    def _compute(self, period_filters: Dict[str, Any]) -> Tuple[pd.DataFrame, Optional[AllocationState]]:
+        """Steps 2-8 on the loaded input_data, and the state for patching the result later"""
+        # Step 2: Build rename dictionary (placeholder - would need actual mapping file)
+        self._build_rename_dict()
+        
+        if self.matrix_store is not None:
+            # Steps 3-7 through the period's persisted allocation matrix
+            self._run_matrix_allocation(period_filters)
+        else:
             # Step 3: Build nodes (exact Jupyter logic)
             self._build_nodes()
             
@@ -93,24 +335,29 @@ class CostAnalysisModule:
             # Step 6: Calculate primary costs (exact Jupyter logic)
             self._calculate_primary_costs()
             
-            # Step 7: Run topological sort (exact Jupyter logic)
-            self._run_topological_sort()
-            
-            # Step 8: Generate final output (exact Jupyter logic)
-            final_df = self._generate_final_output()
-            
-            logger.info(f"Generated service-wise cost analysis with {len(final_df)} records")
-            return final_df
-            
-        except Exception as e:
-            logger.error(f"Error in service-wise cost analysis: {e}")
-            return pd.DataFrame()
+            # Step 7: Run topological sort (exact Jupyter logic), or a matrix engine
+            self._run_allocation()
+        
+        # Step 8: Generate final output (exact Jupyter logic)
+        final_df = self._generate_final_output()
+        
+        state = None
+        if not final_df.empty and settings.incremental_allocation:
+            # Lets expense / HR edits be patched into the cached frame, see app.logic.incremental
+            state = AllocationState.capture(self, self.allocation_graph, self.allocation_matrix)
+        return final_df, state
     
-    async def _load_input_data(self, filters: Optional[Dict[str, Any]] = None):
+    async def _load_input_data(self, filters: Optional[Dict[str, Any]] = None,
+                               columns: Optional[Dict[str, List[str]]] = None):
         """Load all required data from database into input_data dict"""
         try:
-            # Load all tables using database layer
-            tables = await self.db_layer.load_all_tables(filters)
+            # Load only the tables and columns the allocation reads
+            columns = columns or COST_INPUT_COLUMNS
+            tables = await self.db_layer.load_all_tables(
+                filters,
+                columns=columns,
+                tables=list(columns)
+            )
             
             # Convert to the exact format expected by Jupyter notebook
             self.input_data = {
@@ -136,230 +383,10 @@ class CostAnalysisModule:
             self.input_data = {}
     
     def _build_rename_dict(self):
-        """Build rename dictionary - placeholder for actual mapping"""
-        # This would normally come from the Unique_Column_Mapping.xlsx file
-        # For now, creating a basic mapping based on common patterns
-        self.rename_dict = {
-            'Month': 'month',
-            'Bill no.': 'bill_no',
-            'Patient Type': 'patient_type',
-            'Reg. No.': 'reg_no',
-            'IPD Number': 'ipd_number',
-            'Payor Type': 'payor_type',
-            'Payor Alias Name': 'payor_alias_name',
-            'Admitting Doctor Name': 'admitting_doctor_name',
-            'Admitting Doctor Department / Speciality Name': 'admitting_doctor_department_speciality_name',
-            'Performing Doctor Name': 'performing_doctor_name',
-            'performing Doctor Department / Speciality Name': 'performing_doctor_department_speciality_name',
-            'Refering Doctor Name': 'refering_doctor_name',
-            'Refering Doctor Department / Speciality Name': 'refering_doctor_department_speciality_name',
-            'Service Name': 'service_name',
-            'Service Department': 'service_department',
-            'service Sub department': 'service_sub_department',
-            'Service Status i.e. Active or Cancelled.': 'service_status_i_e_active_or_cancelled',
-            'under Package or Not.': 'under_package_or_not',
-            'Outsourced or Inhouse.': 'outsourced_or_inhouse',
-            'No. of service': 'quantity',
-            'Gross Amount': 'gross_amount',
-            'Discount Amount': 'discount',
-            'Net Amount': 'net_amount',
-            'Emergency charges for Service or Not.': 'emergency_charges_for_service_or_not',
-            'performing Doctor Share if applicable': 'performing_doctor_share_if_applicable',
-            'Cost Of Pharmacy & Material Billed to Patient.': 'cost_of_pharmacy_material_billed_to_patient',
-            'share of  Outsource Service billed': 'share_of_outsource_service_billed',
-            'Sub Cost Centre Code': 'sub_cost_centre_code',
-            'Sub Cost Centre Name': 'sub_cost_centre_name',
-            'Service TAT': 'service_tat',
-            'Service Date.': 'service_date',
-            'Category Code': 'category_code',
-            'Category': 'category',
-            'Grouping Code': 'grouping_code',
-            'Grouping': 'grouping',
-            'Ledger Code': 'ledger_code',
-            'Ledger Name': 'ledger_name',
-            'Alias Code': 'alias_code',
-            'Alias Name': 'alias_name',
-            'Amount': 'amount',
-            'Remarks': 'remarks',
-            'Primary Cost Driver': 'primary_cost_driver',
-            'Nature of Data': 'nature_of_data',
-            'CC_Type': 'cc_type',
-            'Cost Centre Code': 'cost_centre_code',
-            'Cost centre category': 'cost_centre_category',
-            'Cost Centre': 'cost_centre',
-            'Cost Centre Name': 'cost_centre_name',
-            'Cost Driver': 'cost_driver',
-            'Source of Driver': 'source_of_driver',
-            'Bill No.': 'bill_no',
-            'Pharmacy Charged to patient': 'pharmacy_charged_to_patient',
-            'Medical & Surgical Consumables Charged to patient': 'medical_surgical_consumables_charged_to_patient',
-            'Implants and Prosthetics - Charged to patient': 'implants_and_prosthetics_charged_to_patient',
-            'Non Medical Consumables Charged To Patient': 'non_medical_consumables_charged_to_patient',
-            'Fee For Service': 'fee_for_service',
-            'Incentives To Consultants/ Treating Doctors': 'incentives_to_consultants_treating_doctors',
-            'Patient Food & Beverages - Outsource service': 'patient_food_beverages_outsource_service',
-            'Laboratory Test Outsource service': 'laboratory_test_outsource_service',
-            'Any Other patient related Outsourced Services_1': 'any_other_patient_related_outsourced_services_1',
-            'Any Other patient related Outsourced Services_2': 'any_other_patient_related_outsourced_services_2',
-            'Any Other patient related Outsourced Services_3': 'any_other_patient_related_outsourced_services_3',
-            'Brokerage & Commission': 'brokerage_commission',
-            'Provision for Deduction & Bad Debts': 'provision_for_deduction_bad_debts',
-            'Doctor Name': 'doctor_name',
-            'Group Code': 'group_code',
-            'Group Name': 'group_name',
-            'Sub - Group Code': 'sub_group_code',
-            'Sub - Group Name': 'sub_group_name',
-            'Associate Code': 'associate_code',
-            'Associate Name': 'associate_name',
-            'Period': 'period',
-            'Date of Joining': 'date_of_joining',
-            'Date of Resignation': 'date_of_resignation',
-            'Working Period': 'working_period',
-            'Department': 'department',
-            'Sub Department': 'sub_department',
-            'Designation': 'designation',
-            'Efforts Category': 'efforts_category',
-            'Master for Multiple': 'master_for_multiple',
-            'Nature Of Allocation': 'nature_of_allocation',
-            'Efforts Allocation': 'efforts_allocation',
-            'Efforts Sub - Allocation': 'efforts_sub_allocation',
-            'Utilization': 'utilization',
-            'Available Hours': 'available_hours',
-            'Actual Hours': 'actual_hours',
-            'Basic Pay': 'basic_pay',
-            'Allowances': 'allowances',
-            'Other Benefits': 'other_benefits',
-            'Overtime': 'overtime',
-            'Bonus': 'bonus',
-            'EPF': 'epf',
-            'ESIC': 'esic',
-            'Any Other Contribution': 'any_other_contribution',
-            'Gross Total': 'gross_total',
-            'Deduction': 'deduction',
-            'Net Salary': 'net_salary',
-            'No. of Headcount': 'no_of_headcount',
-            'Medical Record Number or Registration Number (UHID)': 'medical_record_number_or_registration_number_uhid',
-            'Patient Admission Date': 'patient_admission_date',
-            'Patient Discharge Date': 'patient_discharge_date',
-            'Sub Cost Centre': 'sub_cost_centre',
-            'Bed Number': 'bed_number',
-            'Length Of Stay In Hours': 'length_of_stay_in_hours',
-            'The Date & Time at which Patient was transferred to this Bed.': 'the_date_time_at_which_patient_was_transferred_to_this_bed',
-            'The Date & Time at which Patient left this Bed.': 'the_date_time_at_which_patient_left_this_bed',
-            'Ward Category Code': 'ward_category_code',
-            'Bed Category Name': 'bed_category_name',
-            'S.No.': 's_no',
-            'Anaesthesist Name': 'anaesthesist_name',
-            'Anesthesia Type': 'anesthesia_type',
-            'Type Of Procedure': 'type_of_procedure',
-            'Nature of Procedure': 'nature_of_procedure',
-            'On Table Time': 'on_table_time',
-            'Incision time': 'incision_time',
-            'Finish time': 'finish_time',
-            'Procedure Time': 'procedure_time',
-            'Change Over Time': 'change_over_time',
-            'Total Time': 'total_time',
-            'Transaction Date': 'transaction_date',
-            'From - Store': 'from_store',
-            'To - Store': 'to_store',
-            'SKU Name': 'sku_name',
-            'Unit of Measurement': 'unit_of_measurement',
-            'Quantity': 'quantity',
-            'Rate': 'rate',
-            'Transaction Value (Excluding Tax)': 'transaction_value_excluding_tax',
-            'Connected Load': 'connected_load',
-            'Running Load': 'running_load',
-            'Standby Load': 'standby_load',
-            'Days': 'days',
-            'Hours': 'hours',
-            'Total Load (Kg)': 'total_load_kg',
-            'TAT': 'tat',
-            'Bio Medical Equipments': 'bio_medical_equipments',
-            'Engineering Equipments': 'engineering_equipments',
-            'Furniture & Fixture': 'furniture_fixture',
-            'Others': 'others',
-            'Nursing Hostel Occupancy': 'nursing_hostel_occupancy',
-            'Doctors hostel Occupancy': 'doctors_hostel_occupancy',
-            'Staff accomodation Occupancy': 'staff_accomodation_occupancy',
-            'Frequency of Audit': 'frequency_of_audit',
-            'No. of IT Users': 'no_of_it_users',
-            'No. of Transaction in Finance & Billing Cost Centre': 'no_of_transaction_in_finance_billing_cost_centre',
-            'List of Equipment for which loan was taken': 'list_of_equipment_for_which_loan_was_taken',
-            'No. of  Trips (Km)': 'no_of_trips_km',
-            'No. of Laboratory Test': 'no_of_laboratory_test',
-            'No. of Sample collected & Report dispatch': 'no_of_sample_collected_report_dispatch',
-            'No. of Home sample collection': 'no_of_home_sample_collection',
-            'No. of Radiology Test': 'no_of_radiology_test',
-            'No. of Neuro Test': 'no_of_neuro_test',
-            'No. of Cardiac Test': 'no_of_cardiac_test',
-            'No. of Nuclear Medicine Test': 'no_of_nuclear_medicine_test',
-            'No. of IVF Consultation': 'no_of_ivf_consultation',
-            'OT Time (Hours)': 'ot_time_hours',
-            'CCU Occupancy': 'ccu_occupancy',
-            'MICU Occupancy': 'micu_occupancy',
-            'PICU Occupancy': 'picu_occupancy',
-            'NICU Occupancy': 'nicu_occupancy',
-            'HDU Occupancy': 'hdu_occupancy',
-            'Issolation Room Occupancy': 'issolation_room_occupancy',
-            'GW Occupancy': 'gw_occupancy',
-            'PW-SR Occupancy': 'pw_sr_occupancy',
-            'SW-TS Occupancy': 'sw_ts_occupancy',
-            'DW Occupancy': 'dw_occupancy',
-            'Head office': 'head_office',
-            'Other Unit 1 Allocation Ratio': 'other_unit_1_allocation_ratio',
-            'Other Unit 2 Allocation Ratio': 'other_unit_2_allocation_ratio',
-            'Other Unit 3 Allocation Ratio': 'other_unit_3_allocation_ratio',
-            'Other Unit 4 Allocation Ratio': 'other_unit_4_allocation_ratio',
-            'Other Unit 5 Allocation Ratio': 'other_unit_5_allocation_ratio',
-            'No. of Patient (OP+IP)': 'no_of_patient_op_ip',
-            'No. of Corporate Patient (OP+IP)': 'no_of_corporate_patient_op_ip',
-            'No. of Institutional Patient (OP+IP)': 'no_of_institutional_patient_op_ip',
-            'No. of International Patient (OP+IP)': 'no_of_international_patient_op_ip',
-            'No. of IP Patients': 'no_of_ip_patients',
-            'No. of Credit IP Patients': 'no_of_credit_ip_patients',
-            'Surgical Store Issue Ratio': 'surgical_store_issue_ratio',
-            'Central Store Issue Ratio': 'central_store_issue_ratio',
-            'Non Surgical Store Issue Ratio': 'non_surgical_store_issue_ratio',
-            'Stationery/Housekeeping Issue Ratio': 'stationery_housekeeping_issue_ratio',
-            'No. of Doctors': 'no_of_doctors',
-            'Doctor Fee for Service Ratio': 'doctor_fee_for_service_ratio',
-            'Consultant retainer fee/MG/Bonus Ratio': 'consultant_retainer_fee_mg_bonus_ratio',
-            'No. of Nursing Staff': 'no_of_nursing_staff',
-            'Nursing Station 1 for Care Units': 'nursing_station_1_for_care_units',
-            'Nursing Station 2 for Care Units': 'nursing_station_2_for_care_units',
-            'Nursing Station 3 for Care Units': 'nursing_station_3_for_care_units',
-            'Nursing Station 4 for Care Units': 'nursing_station_4_for_care_units',
-            'Nursing Station 5 for Care Units': 'nursing_station_5_for_care_units',
-            'Service under OP Billing 1': 'service_under_op_billing_1',
-            'Service under OP Billing 2': 'service_under_op_billing_2',
-            'Service under OP Billing 3': 'service_under_op_billing_3',
-            'Service under OP Billing 4': 'service_under_op_billing_4',
-            'No. of CSSD Set Issued': 'no_of_cssd_set_issued',
-            'No. of Diet Served': 'no_of_diet_served',
-            'No. of Ward Boy': 'no_of_ward_boy',
-            'No. of Housekeeping Staff': 'no_of_housekeeping_staff',
-            'No. of Fumigation Cycle Performed/ Standard Resource Allocation Ratio': 'no_of_fumigation_cycle_performed_standard_resource_allocation_ratio',
-            'Volume of Cloth Load': 'volume_of_cloth_load',
-            'Efforts of Supply Chain Department': 'efforts_of_supply_chain_department',
-            'Area in sq. meter': 'area_in_sq_meter',
-            'No. of Security Staff Deployed/ No. of Exits.': 'no_of_security_staff_deployed_no_of_exits',
-            'Actual Water Utilization/ Standard Utilization Ratio.': 'actual_water_utilization_standard_utilization_ratio',
-            'Actual Gas Utilization/ Standard Utilization Ratio.': 'actual_gas_utilization_standard_utilization_ratio',
-            'Actual Vaccume Utilization/ Standard Utilization Ratio.': 'actual_vaccume_utilization_standard_utilization_ratio',
-            'Civil': 'civil',
-            'Date of final bill - DD/MM/YY': 'date_of_final_bill',
-            'Service Sub department': 'service_sub_department',
-            'Service Status i.e. Active or Cancelled': 'service_status',
-            'under Package or Not': 'is_packaged',
-            'Outsourced or Inhouse': 'is_outsourced',
-            'Emergency charges for Service or Not': 'emergency_charges_applied',
-            'Service Date': 'service_date',
-            'Sub - Cost Centre Code': 'sub_cost_centre_code',
-            'Sub - Cost Centre Name': 'sub_cost_centre',
-            'Bill No': 'bill_no',
-            'The date at which service was provided to patient.': 'service_date',
-            'The Name of Services Billed': 'service_name'
-        }
+        """Build rename dictionary from the sheet title -> column mapping"""
+        # This would normally come from the Unique_Column_Mapping.xlsx file;
+        # the upload pipeline maps sheet headers through the same dictionary
+        self.rename_dict = dict(COLUMN_RENAME_MAP)
     
     def _build_nodes(self):
         """Build nodes - exact Jupyter logic"""
@@ -376,11 +403,12 @@ class CostAnalysisModule:
         cc_scv_tat = self.input_data['service_register'][['service_name', 'service_tat', 'sub_cost_centre']]
         
         # cc - scv edges (exact Jupyter logic)
-        for scc, df in cc_scv_tat.groupby('sub_cost_centre'):
+        # observed=True keeps categorical keys from yielding empty groups for absent combinations
+        for scc, df in cc_scv_tat.groupby('sub_cost_centre', observed=True):
             try:
                 total_tat = int(df['service_tat'].astype('int').sum())
 
-                for service, df_2 in df.groupby('service_name'):
+                for service, df_2 in df.groupby('service_name', observed=True):
                     if service not in self.node_dict:
                         self.node_dict[service] = Service(service, int(df_2['service_tat'].astype('int').sum()))
 
@@ -396,6 +424,7 @@ class CostAnalysisModule:
             
         # Build secondary drivers (exact Jupyter logic)
         self.secondary_drivers = {}
+        self.secondary_edges = {}
         for cd, df in self.input_data['cost_center'].groupby('cost_driver'):
             if cd not in self.rename_dict:
                 print(cd, " not in rename dict")
@@ -409,26 +438,27 @@ class CostAnalysisModule:
         cc_drivers = self.input_data['secondary_cost_driver']
         
         # cc to cc relationships (exact Jupyter logic)
-        for driver in cc_drivers.columns[5:]:
-            try:
-                if driver not in self.secondary_drivers:
-                    continue
-                    
-                parent_scc_list = self.secondary_drivers[driver]
-                mini_df = cc_drivers[cc_drivers[driver] > 0][['sub_cost_centre', driver]]
-                edge_list = self.build_edges(mini_df, driver)
-                
-                for parent in parent_scc_list:
-                    if parent in self.node_dict:
-                        self.node_dict[parent].children_cc.extend(edge_list)
-            except Exception as e:
-                print("failed due to", repr(e), driver)
+        # Driver columns are picked by name since projected frames don't keep the sheet layout,
+        # and all of them are normalized in one pass over the frame
+        drivers = [col for col in SECONDARY_COST_DRIVER_COLUMNS
+                   if col in cc_drivers.columns and col in self.secondary_drivers]
+        try:
+            self.secondary_edges = self.build_edge_lists(cc_drivers, drivers)
+        except Exception as e:
+            print("failed due to", repr(e))
+            return
+        
+        for driver, edge_list in self.secondary_edges.items():
+            for parent in self.secondary_drivers[driver]:
+                if parent in self.node_dict:
+                    self.node_dict[parent].children_cc.extend(edge_list)
+                    self.node_dict[parent].children_cc_lists.append(edge_list)
     
     def _calculate_primary_costs(self):
         """Calculate primary costs - exact Jupyter logic"""
         # cm expense direct on scc (exact Jupyter logic)
         if 'consumption_data' in self.input_data and not self.input_data['consumption_data'].empty:
-            for scc, df in self.input_data['consumption_data'].groupby("sub_cost_centre"):
+            for scc, df in self.input_data['consumption_data'].groupby("sub_cost_centre", observed=True):
                 try:
                     if scc in self.node_dict:
                         self.node_dict[scc].cost['cm'] = int(df['transaction_value_excluding_tax'].sum())
@@ -437,13 +467,13 @@ class CostAnalysisModule:
         
         # ew expense direct on scc (exact Jupyter logic)
         if 'expense_wise' in self.input_data and not self.input_data['expense_wise'].empty:
-            for scc, df in self.input_data['expense_wise'].groupby("sub_cost_centre"):
+            for scc, df in self.input_data['expense_wise'].groupby("sub_cost_centre", observed=True):
                 if scc in self.node_dict:
                     self.node_dict[scc].cost['ew'] = int(df['amount'].sum())
         
         # HR expense direct on scc (exact Jupyter logic)
         if 'hr' in self.input_data and not self.input_data['hr'].empty:
-            for scc, df in self.input_data['hr'].groupby("sub_cost_centre"):
+            for scc, df in self.input_data['hr'].groupby("sub_cost_centre", observed=True):
                 if scc in self.node_dict:
                     self.node_dict[scc].cost['hr'] = int(df['net_salary'].sum())
         
@@ -457,7 +487,7 @@ class CostAnalysisModule:
                 
                 total_load = int(self.input_data['connected_load']['total_load_kg'].sum())
                 
-                for scc, df in self.input_data['connected_load'].groupby('sub_cost_centre'):
+                for scc, df in self.input_data['connected_load'].groupby('sub_cost_centre', observed=True):
                     try:
                         if scc in self.node_dict and total_load > 0:
                             self.node_dict[scc].cost['cn'] = (int(df['total_load_kg'].sum()) / total_load) * int(power_consumption)
@@ -537,36 +567,399 @@ class CostAnalysisModule:
         
         logger.info(f"Topological sort processed {count} nodes")
     
+    def _service_targets(self) -> List[str]:
+        """Register services that have a node, whose costs the output lines are built from"""
+        service_register = self.input_data.get('service_register', pd.DataFrame())
+        if 'service_name' not in service_register.columns:
+            return []
+        return [name for name in service_register['service_name'].dropna().unique() if name in self.node_dict]
+    
+    def _driver_edge_list(self, cost_driver: str) -> Optional[EdgeList]:
+        """Edges of a cost centre allocating on cost_driver; None when it allocates to its services"""
+        column = self.rename_dict.get(cost_driver)
+        cc_drivers = self.input_data.get('secondary_cost_driver', pd.DataFrame())
+        if column in SECONDARY_COST_DRIVER_COLUMNS and column in cc_drivers.columns:
+            if column not in self.secondary_edges:
+                self.secondary_edges.update(self.build_edge_lists(cc_drivers, [column]))
+            return self.secondary_edges[column]
+        
+        cost_center = self.input_data.get('cost_center', pd.DataFrame())
+        if 'cost_driver' in cost_center.columns and (cost_center['cost_driver'] == cost_driver).any():
+            # Drivers without secondary driver values, like Service TAT, send the cost to services
+            return None
+        raise ValueError(f"Unknown cost driver: {cost_driver}")
+    
+    async def run_scenarios(self, filters: Optional[Dict[str, Any]], scenarios: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Per-service cost deltas of what-if scenarios against one period
+        Builds the graph once (exact Jupyter logic) and leaves the rest to app.logic.scenarios
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        self.output_filters = {}
+        await self._load_input_data(filters)
+        
+        # Building the graph and propagating the scenarios is CPU-bound; it runs in the compute pool
+        deltas, _ = await compute_pool.run(
+            _compute_scenarios, self.input_data, self.user_id, self.allocation_mode, scenarios
+        )
+        return deltas
+    
+    def _scenario_deltas(self, scenarios: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Graph of the loaded input_data and the scenarios' per-service deltas on it"""
+        self._build_rename_dict()
+        self._build_nodes()
+        self._add_service_nodes()
+        self._process_secondary_cost()
+        self._calculate_primary_costs()
+        
+        return scenario_deltas(
+            self.node_dict, self._service_targets(), scenarios, self._driver_edge_list,
+            self.allocation_mode == 'reciprocal'
+        )
+    
+    async def generate_cost_trend(self, year: int, months: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Per-service costs of each month of a year, from one load and one allocation pass
+        Returns month, service_name, the cost types and total_cost for every service a month's lines cost
+        """
+        months = trend_months(months)
+        versions = await self.db_layer.data_versions(list(COST_INPUT_COLUMNS))
+        cache_key = result_cache.make_key(
+            self.user_id,
+            {'trend': year, 'months': ','.join(months), 'allocation_mode': self.allocation_mode},
+            versions
+        )
+        cached_df = result_cache.get(cache_key)
+        if cached_df is not None:
+            logger.info(f"Served cost trend from cache with {len(cached_df)} records")
+            return cached_df
+
+        # The year in one load, with the date columns the months are split on
+        columns = {
+            table: [*cols, TABLE_DATE_COLUMNS[table]] if table in TABLE_DATE_COLUMNS else cols
+            for table, cols in COST_INPUT_COLUMNS.items()
+        }
+        columns['hr_data'] = [*columns['hr_data'], HR_PERIOD_COLUMN]
+        self.output_filters = {}
+        await self._load_input_data({'year': year}, columns)
+
+        # Splitting the year and allocating every month is CPU-bound; it runs in the compute pool
+        trend_df, _ = await compute_pool.run(
+            _compute_cost_trend, self.input_data, self.user_id, self.allocation_mode, year, months
+        )
+
+        if not trend_df.empty:
+            result_cache.put(cache_key, trend_df)
+
+        logger.info(f"Generated cost trend for {len(months)} months with {len(trend_df)} records")
+        return trend_df
+
+    def _trend(self, year: int, months: List[str]) -> pd.DataFrame:
+        """Per-service costs of each month on the loaded year of input_data"""
+        self._build_rename_dict()
+
+        year_data = self.input_data
+        partitions = {month: self._month_inputs(year_data, year, month) for month in months}
+
+        try:
+            return self._allocate_months(year_data, partitions)
+        except IrregularGraphError as e:
+            logger.warning(f"Allocating each month separately: {e}")
+            return self._allocate_months_separately(partitions)
+
+    @staticmethod
+    def _month_inputs(year_data: Dict[str, pd.DataFrame], year: int, month: str) -> Dict[str, pd.DataFrame]:
+        """One month's inputs out of a loaded year, see ANNUAL_AMOUNT_COLUMNS"""
+        # Dated registers as a load filtered to the month would have returned them
+        month_data = {
+            key: filter_frame(df, 'hr_data' if key == 'hr' else key, {'year': year, 'month': month})
+            for key, df in year_data.items()
+        }
+
+        month_number = TREND_MONTHS.index(month) + 1
+        for key, column in ANNUAL_AMOUNT_COLUMNS.items():
+            df = month_data.get(key)
+            if df is None or df.empty or column not in df.columns:
+                continue
+
+            annual = np.ones(len(df), dtype=bool)
+            if key == 'hr' and HR_PERIOD_COLUMN in df.columns:
+                periods = df[HR_PERIOD_COLUMN].astype(object).fillna('')
+                named = {period: period_month(period) for period in pd.unique(periods)}
+                annual = periods.map(lambda period: named[period] is None).to_numpy(dtype=bool)
+                in_month = periods.map(lambda period: named[period] == (int(year), month_number)).to_numpy(dtype=bool)
+            else:
+                in_month = np.zeros(len(df), dtype=bool)
+
+            prorated = df[annual].copy()
+            prorated[column] = prorated[column].astype('float64') / 12
+            month_data[key] = pd.concat([df[in_month], prorated], ignore_index=True)
+
+        return month_data
+
+    def _allocate_months(self, year_data: Dict[str, pd.DataFrame],
+                         partitions: Dict[str, Dict[str, pd.DataFrame]]) -> pd.DataFrame:
+        """Steps 3-7 for all months at once, on one graph with per-month service nodes
+
+        Cost centres and their secondary edges come from tables the period doesn't
+        narrow, so they are built once; each month's services hang off them as
+        nodes named (month, service). Every month's primary costs are a block of
+        columns of one cost matrix, propagated together. Services are sinks, so
+        the cost a month's columns leave on other months' services is ignored.
+        """
+        self.input_data = year_data
+        self._build_nodes()
+        self._process_secondary_cost()
+        cost_centres = self.node_dict
+        union = dict(cost_centres)
+
+        month_services = {}
+        for month, month_data in partitions.items():
+            self.input_data = month_data
+            self.node_dict = {scc: CostCenter(scc) for scc in cost_centres}
+            self._add_service_nodes()
+
+            services = self._output_services()
+            if any(service in cost_centres for service in services):
+                raise IrregularGraphError("a service shares its name with a cost centre")
+            month_services[month] = services
+
+            for name, node in self.node_dict.items():
+                if name in cost_centres:
+                    cost_centres[name].children_svc.extend(node.children_svc)
+                else:
+                    node.name = (month, name)
+                    union[node.name] = node
+
+        graph = AllocationGraph(union)
+        k = len(SCENARIO_COST_TYPES)
+        costs = np.zeros((len(union), k * len(partitions)))
+        for m, month_data in enumerate(partitions.values()):
+            self.input_data = month_data
+            self.node_dict = {scc: Node(scc) for scc in cost_centres}
+            self._calculate_primary_costs()
+            # Cost centres come first in union
+            costs[:len(cost_centres), m * k:(m + 1) * k] = primary_cost_matrix(self.node_dict)
+
+        # Costs a node doesn't hold are zero, so every entry can be treated as present
+        present = np.ones(costs.shape, dtype=bool)
+        if self.allocation_mode == 'reciprocal':
+            totals, _ = graph.solve_reciprocal(costs, present)
+        else:
+            # Raises IrregularGraphError where only the topological sort applies
+            totals, _ = graph.propagate(costs, present)
+
+        frames = []
+        for m, (month, services) in enumerate(month_services.items()):
+            rows = [graph.index[(month, service)] for service in services]
+            frames.append(self._trend_frame(month, services, totals[rows, m * k:(m + 1) * k]))
+        return pd.concat(frames, ignore_index=True)
+
+    def _allocate_months_separately(self, partitions: Dict[str, Dict[str, pd.DataFrame]]) -> pd.DataFrame:
+        """Steps 3-7 once per month, for graphs the shared pass can't take"""
+        frames = []
+        for month, month_data in partitions.items():
+            self.input_data = month_data
+            self._build_nodes()
+            self._add_service_nodes()
+            self._process_secondary_cost()
+            self._calculate_primary_costs()
+            self._run_allocation()
+
+            services = self._output_services()
+            service_costs = primary_cost_matrix({service: self.node_dict[service] for service in services})
+            frames.append(self._trend_frame(month, services, service_costs))
+        return pd.concat(frames, ignore_index=True)
+
+    def _output_services(self) -> List[Any]:
+        """Services with a node whose cost reaches the output lines, in output order"""
+        service_register = self.input_data.get('service_register', pd.DataFrame())
+        if service_register.empty:
+            return []
+        services = pd.unique(self._line_weights(service_register)['service_name'])
+        return [service for service in services if service in self.node_dict]
+
+    @staticmethod
+    def _trend_frame(month: str, services: List[Any], costs: np.ndarray) -> pd.DataFrame:
+        frame = pd.DataFrame(costs, columns=list(SCENARIO_COST_TYPES))
+        frame.insert(0, 'service_name', np.asarray(services, dtype=object))
+        frame.insert(0, 'month', month)
+        frame['total_cost'] = frame[list(SCENARIO_COST_TYPES)].sum(axis=1)
+        return frame
+
+    def _run_allocation(self):
+        """Push primary costs through the node graph with the configured engine"""
+        if self.allocation_mode == 'sparse':
+            self._run_sparse_allocation()
+        elif self.allocation_mode == 'reciprocal':
+            self._run_reciprocal_allocation()
+        else:
+            self._run_topological_sort()
+    
+    def _structure_version(self) -> str:
+        """Hash of the inputs that determine the allocation graph, and of how it's allocated"""
+        digest = hashlib.sha256(
+            f"{ALLOCATION_MATRIX_FORMAT}|{self.allocation_mode}|{sorted(self.rename_dict.items())}".encode()
+        )
+        for table, columns in STRUCTURE_COLUMNS.items():
+            df = self.input_data.get(table, pd.DataFrame())
+            columns = [col for col in columns if col in df.columns]
+            digest.update(f"|{table}:{','.join(columns)}:{len(df)}|".encode())
+            if columns and not df.empty:
+                digest.update(pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+    
+    def _run_matrix_allocation(self, period_filters: Dict[str, Any]):
+        """Steps 3-7 as one product with the transitive cost-centre -> service matrix
+        
+        The matrix is read from the store when the cost centres, secondary drivers and
+        service TATs hash to the version it was built from. Otherwise the graph is
+        built as usual and the matrix derived from it is stored for the next run.
+        """
+        version = self._structure_version()
+        period = f"{self.allocation_mode}-{period_key(period_filters)}"
+        
+        matrix = None
+        arrays = self.matrix_store.read(self.user_id, period)
+        if arrays is not None and str(arrays.get('version')) == version:
+            matrix = AllocationMatrix.from_arrays(arrays)
+            logger.info(f"Loaded allocation matrix for period {period}")
+        
+        if matrix is None:
+            self._build_nodes()
+            self._add_service_nodes()
+            self._process_secondary_cost()
+            
+            graph = AllocationGraph(self.node_dict)
+            try:
+                matrix = AllocationMatrix.build(graph, self._service_targets(), version, self.allocation_mode == 'reciprocal')
+            except IrregularGraphError as e:
+                logger.warning(f"No allocation matrix for this graph, allocating directly: {e}")
+                self._calculate_primary_costs()
+                self._run_allocation()
+                return
+            
+            if all(isinstance(name, str) for name in matrix.names):
+                try:
+                    self.matrix_store.write(self.user_id, period, matrix.to_arrays())
+                except Exception as e:
+                    logger.warning(f"Could not store allocation matrix for period {period}: {e}")
+            logger.info(f"Built allocation matrix for period {period} with {matrix.transfer.nnz} entries")
+        
+        # Only the primary costs are needed from here on, and they only need the node names
+        self.node_dict = {name: Node(name) for name in matrix.names}
+        self._calculate_primary_costs()
+        matrix.allocate(self.node_dict)
+        self.allocation_matrix = matrix
+    
+    def _run_sparse_allocation(self):
+        """Allocate costs with the sparse-matrix engine; same node costs as _run_topological_sort"""
+        graph = AllocationGraph(self.node_dict)
+        try:
+            count = graph.allocate()
+        except IrregularGraphError as e:
+            logger.warning(f"Falling back to topological sort: {e}")
+            self._run_topological_sort()
+            return
+        self.allocation_graph = graph
+        
+        logger.info(f"Sparse allocation processed {count} nodes in {len(graph.levels)} levels")
+        
+        unprocessed = graph.unprocessed
+        if unprocessed:
+            logger.warning(
+                f"{len(unprocessed)} cost centres never allocated their cost, e.g. {unprocessed[:5]}; "
+                f"use the reciprocal allocation mode if they allocate to each other in a cycle"
+            )
+    
+    def _run_reciprocal_allocation(self):
+        """Allocate costs by the reciprocal method, solving for cost exchanged around cycles"""
+        graph = AllocationGraph(self.node_dict)
+        count = graph.allocate(reciprocal=True)
+        self.allocation_graph = graph
+        logger.info(f"Reciprocal allocation solved {count} nodes")
+    
+    @staticmethod
+    def _parse_tat(tat: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        """Integer TAT per line and whether it parsed, as astype('int') would take it"""
+        # TATs repeat heavily, so each distinct value is converted once
+        codes, uniques = pd.factorize(tat)
+        parsed = np.zeros(len(uniques), dtype='int64')
+        ok = np.zeros(len(uniques), dtype=bool)
+        for i, value in enumerate(uniques):
+            try:
+                parsed[i] = int(value)
+                ok[i] = True
+            except (TypeError, ValueError, OverflowError):
+                pass
+        
+        valid = codes >= 0
+        valid[valid] = ok[codes[valid]]
+        return np.where(valid, parsed[codes], 0), valid
+    
+    def _line_weights(self, service_register: pd.DataFrame) -> pd.DataFrame:
+        """Register lines with their share of the service's cost in total_tat
+        
+        Lines are weighted by TAT x quantity within their service as in the notebook
+        loop, services with an unparseable TAT or a non-positive TAT total are left
+        out, and lines come out grouped by service in groupby order.
+        """
+        sr = service_register[service_register['service_name'].notna()]
+        tat, valid = self._parse_tat(sr['service_tat'])
+        
+        services = sr['service_name']
+        invalid_services = pd.unique(services[~valid])
+        for service in invalid_services:
+            print(service, "service_tat is not an integer")
+        
+        weights = pd.Series(tat * sr['quantity'].to_numpy(), index=sr.index)
+        totals = weights.groupby(services, observed=True, sort=False).transform('sum')
+        
+        for service in pd.unique(services[(totals < 0) & valid]):
+            print(service, 'total tat is -ve!!')
+        
+        keep = (totals > 0).to_numpy() & ~services.isin(invalid_services).to_numpy()
+        sr = sr[keep].copy()
+        sr['total_tat'] = weights[keep] / totals[keep]
+        return sr.sort_values('service_name', kind='stable')
+    
+    def _allocate_to_service_lines(self, service_register: pd.DataFrame) -> pd.DataFrame:
+        """Spread each service's allocated cost over its lines by TAT x quantity"""
+        sr = self._line_weights(service_register)
+        
+        # One service x cost_type frame, joined onto the lines by service
+        kept_services = pd.unique(sr['service_name'])
+        service_costs = pd.DataFrame.from_dict(
+            {service: self.node_dict[service].cost for service in kept_services if service in self.node_dict},
+            orient='index'
+        )
+        if service_costs.empty:
+            return sr
+        
+        line_costs = (
+            service_costs.reindex(sr['service_name'].to_numpy()).to_numpy(dtype='float64')
+            * sr['total_tat'].to_numpy()[:, None]
+        )
+        for j, cost_name in enumerate(service_costs.columns):
+            sr[cost_name] = line_costs[:, j]
+        return sr
+    
     def _generate_final_output(self) -> pd.DataFrame:
         """Generate final output - exact Jupyter logic"""
         try:
             if 'service_register' not in self.input_data or self.input_data['service_register'].empty:
                 return pd.DataFrame()
             
-            # Service level cost update in SR (exact Jupyter logic)
-            service_df_list = []
-            for service, df in self.input_data['service_register'].groupby('service_name'):
-                try:
-                    
-                    df = df.copy()
-                    df['total_tat'] = df['service_tat'].astype('int') * df['quantity']
-                    total = int(df['total_tat'].sum())
-                    if total > 0:
-                        df['total_tat'] /= total
-
-                        if service in self.node_dict:
-                            for cost_name, cost in self.node_dict[service].cost.items():
-                                df[cost_name] = cost * df['total_tat']
-                        service_df_list.append(df)
-                    elif total < 0:
-                        print(service, 'total tat is -ve!!')
-                except Exception as e:
-                    print(service, e)
-            
-            if not service_df_list:
+            # Service level cost update in SR (exact Jupyter logic), in one pass over the register
+            final_sr_list = self._allocate_to_service_lines(self.input_data['service_register'])
+            if final_sr_list.empty:
                 return pd.DataFrame()
             
-            final_sr_list = pd.concat(service_df_list)
+            # Narrow to the requested services now that costs are allocated
+            for key, value in self.output_filters.items():
+                column = SERVICE_OUTPUT_FILTERS[key]
+                if column in final_sr_list.columns:
+                    final_sr_list = final_sr_list[final_sr_list[column] == value]
             
             # Merge with variable cost data (exact Jupyter logic)
             if 'variable_cost_bill_wise' in self.input_data and not self.input_data['variable_cost_bill_wise'].empty:
@@ -603,6 +996,9 @@ class CostAnalysisModule:
             existing_cols = [col for col in output_columns if col in final_cost_df.columns]
             output_df = final_cost_df[existing_cols]
             
+            # Service and TAT share behind each output line, for incremental updates
+            self.output_lines = (final_cost_df['service_name'].to_numpy(), final_cost_df['total_tat'].to_numpy())
+            
             return output_df
             
         except Exception as e:
@@ -612,101 +1008,34 @@ class CostAnalysisModule:
     async def get_cost_summary_metrics(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Get summary metrics for cost analysis"""
         try:
+            # Served from the result cache when the inputs are unchanged
             cost_df = await self.generate_service_wise_cost_analysis(filters)
+            return summarize_cost_frame(cost_df)
             
-            if cost_df.empty:
-                return {}
-            
-            # Calculate metrics from actual output columns
-            total_services = len(cost_df) if not cost_df.empty else 0
-            
-            # Calculate allocated costs
-            total_allocated_costs = 0
-            for col in ['cm', 'ew', 'hr', 'cn']:
-                if col in cost_df.columns:
-                    total_allocated_costs += cost_df[col].fillna(0).sum()
-            
-            # Calculate variable costs
-            variable_cost_columns = [
-                'pharmacy_charged_to_patient',
-                'medical_surgical_consumables_charged_to_patient',
-                'implants_and_prosthetics_charged_to_patient',
-                'non_medical_consumables_charged_to_patient',
-                'fee_for_service',
-                'incentives_to_consultants_treating_doctors',
-                'patient_food_beverages_outsource_service',
-                'laboratory_test_outsource_service',
-                'any_other_patient_related_outsourced_services_1',
-                'any_other_patient_related_outsourced_services_2',
-                'any_other_patient_related_outsourced_services_3',
-                'brokerage_commission',
-                'provision_for_deduction_bad_debts'
-            ]
-            
-            total_variable_costs = 0
-            for col in variable_cost_columns:
-                if col in cost_df.columns:
-                    total_variable_costs += cost_df[col].fillna(0).sum()
-            
-            total_costs = total_allocated_costs + total_variable_costs
-            
-            # Estimate revenue (would need actual revenue data)
-            # For now, assume 20% margin over total costs
-            estimated_revenue = total_costs * 1.2
-            
-            overall_profit_margin = 0
-            if estimated_revenue > 0:
-                overall_profit_margin = ((estimated_revenue - total_costs) / estimated_revenue * 100)
-            
-            # Find most and least profitable services
-            most_profitable = {'name': 'N/A', 'margin': 0}
-            least_profitable = {'name': 'N/A', 'margin': 0}
-            
-            if not cost_df.empty and 'service_name' in cost_df.columns:
-                # Calculate profit margin for each service
-                service_margins = []
-                for _, row in cost_df.iterrows():
-                    allocated_cost = (row.get('cm', 0) + row.get('ew', 0) + 
-                                    row.get('hr', 0) + row.get('cn', 0))
-                    variable_cost = sum(row.get(col, 0) for col in variable_cost_columns if col in row.index)
-                    total_service_cost = allocated_cost + variable_cost
-                    
-                    # Estimate service revenue
-                    estimated_service_revenue = total_service_cost * 1.2
-                    margin = ((estimated_service_revenue - total_service_cost) / estimated_service_revenue * 100) if estimated_service_revenue > 0 else 0
-                    
-                    service_margins.append({
-                        'name': row.get('service_name', 'Unknown'),
-                        'margin': margin
-                    })
-                
-                if service_margins:
-                    most_profitable = max(service_margins, key=lambda x: x['margin'])
-                    least_profitable = min(service_margins, key=lambda x: x['margin'])
-            
-            summary = {
-                'total_services': total_services,
-                'total_revenue': float(estimated_revenue),
-                'total_allocated_costs': float(total_costs),
-                'overall_profit_margin': float(overall_profit_margin),
-                'most_profitable_service': most_profitable,
-                'least_profitable_service': least_profitable,
-                'cost_breakdown': {
-                    'allocated_costs': float(total_allocated_costs),
-                    'variable_costs': float(total_variable_costs),
-                    'cm_percent': (cost_df['cm'].fillna(0).sum() / total_costs * 100) if total_costs > 0 and 'cm' in cost_df.columns else 0,
-                    'ew_percent': (cost_df['ew'].fillna(0).sum() / total_costs * 100) if total_costs > 0 and 'ew' in cost_df.columns else 0,
-                    'hr_percent': (cost_df['hr'].fillna(0).sum() / total_costs * 100) if total_costs > 0 and 'hr' in cost_df.columns else 0,
-                    'cn_percent': (cost_df['cn'].fillna(0).sum() / total_costs * 100) if total_costs > 0 and 'cn' in cost_df.columns else 0
-                },
-                'optimization_opportunities': {
-                    'high_potential': len([s for s in service_margins if s['margin'] > 25]) if 'service_margins' in locals() else 0,
-                    'critical_services': len([s for s in service_margins if s['margin'] < 10]) if 'service_margins' in locals() else 0
-                }
-            }
-            
-            return summary
-            
+        except ComputePoolError:
+            raise
         except Exception as e:
             logger.error(f"Error calculating cost summary metrics: {e}")
-            return {}
\ No newline at end of file
+            return {}
+
+def _compute_cost_analysis(input_data: Dict[str, pd.DataFrame], user_id: str, allocation_mode: str,
+                           output_filters: Dict[str, Any], period_filters: Dict[str, Any]) -> Tuple[pd.DataFrame, Optional[AllocationState]]:
+    """Compute pool entry point: steps 2-8 of the analysis on already loaded inputs"""
+    module = CostAnalysisModule(user_id, allocation_mode)
+    module.input_data = input_data
+    module.output_filters = output_filters
+    return module._compute(period_filters)
+
+def _compute_scenarios(input_data: Dict[str, pd.DataFrame], user_id: str, allocation_mode: str,
+                       scenarios: List[Dict[str, Any]]) -> Tuple[pd.DataFrame, None]:
+    """Compute pool entry point: what-if scenario deltas on already loaded inputs"""
+    module = CostAnalysisModule(user_id, allocation_mode)
+    module.input_data = input_data
+    return module._scenario_deltas(scenarios), None
+
+def _compute_cost_trend(input_data: Dict[str, pd.DataFrame], user_id: str, allocation_mode: str,
+                        year: int, months: List[str]) -> Tuple[pd.DataFrame, None]:
+    """Compute pool entry point: a year's per-month service costs on already loaded inputs"""
+    module = CostAnalysisModule(user_id, allocation_mode)
+    module.input_data = input_data
+    return module._trend(year, months), None
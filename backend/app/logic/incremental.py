@@ -0,0 +1,181 @@
+"""
+Incremental Allocation - Carry cached cost-analysis results over single-row edits
+Allocation is linear in the primary costs, so an edit only moves cost along the paths out of its sub cost centre
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple, Any
+import logging
+
+from app.core.result_cache import result_cache
+from app.core.database_layer import DatabaseLayer
+from app.logic.allocation import AllocationGraph, AllocationMatrix
+
+logger = logging.getLogger(__name__)
+
+# Tables whose rows are summed straight into a sub cost centre's primary cost:
+# the amount column and the cost type it feeds
+PRIMARY_COST_TABLES = {
+    'expense_wise': ('amount', 'ew'),
+    'hr_data': ('net_salary', 'hr'),
+}
+
+def _amount(value: Any) -> float:
+    # Missing amounts drop out of the notebook's sums
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(amount) else amount
+
+class AllocationState:
+    """The allocation operator and inputs behind one cached result
+
+    Holds the allocation graph (or the allocation matrix the result came from),
+    which cost types every node ended up with, the per sub cost centre sums and
+    row counts of the primary cost tables, and the service node and TAT weight
+    of every output line. An edit changes one centre's primary cost by the
+    difference of its truncated sums; pushing that difference through the graph
+    and onto the lines gives the same frame a full recomputation would. Edits
+    that add or remove a cost type on a centre change which costs the dicts
+    hold, so they are left to a recomputation.
+    """
+
+    def __init__(self, index: Dict[str, int], graph: Optional[AllocationGraph],
+                 matrix: Optional[AllocationMatrix], reciprocal: bool, cost_types: List[str],
+                 present: Optional[np.ndarray], primary: Dict[str, Dict[str, Tuple[float, int]]],
+                 line_nodes: np.ndarray, line_weights: np.ndarray):
+        self.index = index
+        self.graph = graph
+        self.matrix = matrix
+        self.reciprocal = reciprocal
+        self.cost_types = cost_types
+        self.present = present
+        self.primary = primary
+        self.line_nodes = line_nodes
+        self.line_weights = line_weights
+
+    @classmethod
+    def capture(cls, module, graph: Optional[AllocationGraph] = None,
+                matrix: Optional[AllocationMatrix] = None) -> Optional['AllocationState']:
+        """State of a CostAnalysisModule that has just generated its final output"""
+        lines = getattr(module, 'output_lines', None)
+        if lines is None:
+            return None
+
+        nodes = list(module.node_dict.values())
+        cost_types = list(dict.fromkeys(cost_type for node in nodes for cost_type in node.cost))
+
+        if matrix is not None:
+            # Its transfer matrix already holds every path, so no presence is needed
+            graph, present = None, None
+            index = {name: i for i, name in enumerate(matrix.names)}
+        else:
+            if graph is None:
+                graph = AllocationGraph(module.node_dict)
+            if graph.has_parallel_edges and module.allocation_mode != 'reciprocal':
+                # Not reproducible level by level, see AllocationGraph.propagate
+                return None
+            graph.release_nodes()
+            index = graph.index
+            present = np.array(
+                [[cost_type in node.cost for cost_type in cost_types] for node in nodes], dtype=bool
+            ).reshape(len(nodes), len(cost_types))
+
+        primary = {}
+        for table, (column, cost_type) in PRIMARY_COST_TABLES.items():
+            df = module.input_data.get('hr' if table == 'hr_data' else table, pd.DataFrame())
+            if df.empty:
+                primary[cost_type] = {}
+                continue
+            grouped = df.groupby('sub_cost_centre', observed=True)[column]
+            sums, counts = grouped.sum(), grouped.size()
+            primary[cost_type] = {
+                scc: (float(sums[scc]), int(counts[scc])) for scc in sums.index if scc in index
+            }
+
+        services, weights = lines
+        line_nodes = pd.Series(services).map(index).fillna(-1).to_numpy(dtype='int64')
+
+        return cls(index, graph, matrix, module.allocation_mode == 'reciprocal', cost_types, present,
+                   primary, line_nodes, np.asarray(weights, dtype='float64'))
+
+    @property
+    def nbytes(self) -> int:
+        if self.matrix is not None:
+            operator = self.matrix.nbytes
+        else:
+            weights = self.graph.weights
+            operator = 2 * (weights.data.nbytes + weights.indices.nbytes + weights.indptr.nbytes) + self.present.nbytes
+        return int(operator + self.line_nodes.nbytes + self.line_weights.nbytes)
+
+    def apply_edit(self, df: pd.DataFrame, table: str,
+                   old_row: Optional[Dict[str, Any]], new_row: Optional[Dict[str, Any]]) -> Optional[pd.DataFrame]:
+        """The cached frame with one row of a primary cost table replaced, or None if it can't be patched"""
+        column, cost_type = PRIMARY_COST_TABLES[table]
+        sums = self.primary[cost_type]
+
+        updated = {}
+        for row, sign in ((old_row, -1), (new_row, 1)):
+            scc = (row or {}).get('sub_cost_centre')
+            if scc is None or scc not in self.index:
+                continue
+            total, count = updated.get(scc, sums.get(scc, (0.0, 0)))
+            updated[scc] = (total + sign * _amount(row.get(column)), count + sign)
+
+        deltas = {}
+        for scc, (total, count) in updated.items():
+            old_total, old_count = sums.get(scc, (0.0, 0))
+            if (old_count > 0) != (count > 0):
+                return None
+            if count > 0:
+                # Primary costs are the truncated sums
+                deltas[self.index[scc]] = int(total) - int(old_total)
+
+        sums.update(updated)
+        deltas = {node: delta for node, delta in deltas.items() if delta != 0}
+        if not deltas:
+            return df
+
+        if cost_type not in df.columns:
+            return df
+
+        change = self._node_change(deltas, self.cost_types.index(cost_type))
+
+        on_graph = self.line_nodes >= 0
+        line_change = np.zeros(len(self.line_nodes))
+        line_change[on_graph] = change[self.line_nodes[on_graph]] * self.line_weights[on_graph]
+
+        patched = df.copy(deep=False)
+        patched[cost_type] = df[cost_type].to_numpy() + line_change
+        return patched
+
+    def _node_change(self, deltas: Dict[int, float], j: int) -> np.ndarray:
+        """Change in every node's cost of type j for changes in the primary costs of some nodes"""
+        change = np.zeros(len(self.index))
+
+        if self.matrix is not None:
+            sources = np.fromiter(deltas.keys(), dtype='int64')
+            values = np.fromiter(deltas.values(), dtype='float64')
+            change[self.matrix.targets] = self.matrix.transfer[:, sources] @ values
+            return change
+
+        change[list(deltas)] = list(deltas.values())
+        present = self.present[:, j:j + 1]
+        if self.reciprocal:
+            change, _ = self.graph.solve_reciprocal(change[:, None], present)
+        else:
+            change, _ = self.graph.propagate(change[:, None], present)
+        return change[:, 0]
+
+async def apply_primary_cost_edit(user_id: str, table: str,
+                                  old_row: Optional[Dict[str, Any]], new_row: Optional[Dict[str, Any]]):
+    """Record an edit of one expense_wise / hr_data row, updating the user's cached results in place"""
+    def apply(df: pd.DataFrame, state: Any) -> Optional[pd.DataFrame]:
+        if not isinstance(state, AllocationState):
+            return None
+        return state.apply_edit(df, table, old_row, new_row)
+
+    # The table's counter after the edit; results a step behind it lack only this edit
+    version = (await DatabaseLayer(user_id).data_versions([table]))[table] if new_row else None
+    result_cache.patch(user_id, table, version, apply)
@@ -0,0 +1,139 @@
+"""
+Scenarios - What-if cost deltas for many scenarios in one pass over the allocation graph
+Each scenario's primary-cost changes become columns of one matrix that is propagated at once
+"""
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Dict, List, Any, Callable, Optional, Tuple
+import logging
+
+from app.logic.allocation import AllocationGraph
+
+logger = logging.getLogger(__name__)
+
+# Primary cost types a scenario can adjust, in output column order
+SCENARIO_COST_TYPES = ('cm', 'ew', 'hr', 'cn')
+
+# Service deltas below this are rounding noise and left out of the result
+DELTA_TOLERANCE = 1e-6
+
+def primary_cost_matrix(node_dict: Dict[str, Any]) -> np.ndarray:
+    """Nodes x SCENARIO_COST_TYPES matrix of the primary costs on the nodes"""
+    costs = np.zeros((len(node_dict), len(SCENARIO_COST_TYPES)))
+    for i, node in enumerate(node_dict.values()):
+        for j, cost_type in enumerate(SCENARIO_COST_TYPES):
+            costs[i, j] = node.cost.get(cost_type, 0.0)
+    return costs
+
+def scenario_changes(scenario: Dict[str, Any], costs: np.ndarray, index: Dict[str, int]) -> np.ndarray:
+    """Change in primary costs a scenario's adjustments make; percentages apply to the base costs"""
+    change = np.zeros_like(costs)
+
+    for adjustment in scenario.get('adjustments') or []:
+        cost_type = adjustment.get('cost_type')
+        if cost_type not in SCENARIO_COST_TYPES:
+            raise ValueError(f"cost_type must be one of: {', '.join(SCENARIO_COST_TYPES)}")
+        j = SCENARIO_COST_TYPES.index(cost_type)
+
+        scc = adjustment.get('sub_cost_centre')
+        if scc is None:
+            if adjustment.get('amount'):
+                raise ValueError(f"Scenario {scenario['name']}: an amount needs a sub_cost_centre")
+            rows = slice(None)
+        elif scc in index:
+            rows = index[scc]
+        else:
+            raise ValueError(f"Scenario {scenario['name']}: unknown sub cost centre {scc}")
+
+        if adjustment.get('percent'):
+            change[rows, j] += costs[rows, j] * adjustment['percent'] / 100
+        if adjustment.get('amount'):
+            change[rows, j] += adjustment['amount']
+
+    return change
+
+@contextmanager
+def _reallocated(node_dict: Dict[str, Any], cost_drivers: Tuple[Tuple[str, str], ...],
+                 driver_edges: Callable[[str], Optional[Any]]):
+    # Points cost centres at another driver's edges for as long as the block runs
+    saved = {}
+    try:
+        for scc, cost_driver in cost_drivers:
+            node = node_dict.get(scc)
+            if node is None or not hasattr(node, 'children_cc'):
+                raise ValueError(f"Unknown cost centre: {scc}")
+
+            edge_list = driver_edges(cost_driver)
+            saved[scc] = (node.children_cc, node.children_cc_lists)
+            node.children_cc = list(edge_list) if edge_list is not None else []
+            node.children_cc_lists = [edge_list] if edge_list is not None else []
+        yield
+    finally:
+        for scc, (children_cc, children_cc_lists) in saved.items():
+            node_dict[scc].children_cc = children_cc
+            node_dict[scc].children_cc_lists = children_cc_lists
+
+def _propagate(graph: AllocationGraph, costs: np.ndarray, reciprocal: bool) -> np.ndarray:
+    # Costs a node doesn't hold are zero, so presence only matters for which keys exist, not for values
+    present = np.ones(costs.shape, dtype=bool)
+    if reciprocal:
+        totals, _ = graph.solve_reciprocal(costs, present)
+    else:
+        totals, _ = graph.propagate(costs, present)
+    return totals
+
+def scenario_deltas(node_dict: Dict[str, Any], services: List[str], scenarios: List[Dict[str, Any]],
+                    driver_edges: Callable[[str], Optional[Any]], reciprocal: bool = False) -> pd.DataFrame:
+    """Per-service cost deltas of every scenario against the primary costs on node_dict
+
+    A scenario is a dict with a name, adjustments ({cost_type, sub_cost_centre,
+    percent, amount}) and cost_drivers ({sub_cost_centre: cost driver}).
+    Scenarios that keep the drivers share one propagation of their stacked
+    changes; scenarios re-pointing the same cost centres share a graph with
+    those edges swapped and are taken against the base totals. Rows with no
+    delta above DELTA_TOLERANCE are left out.
+    """
+    names = [scenario['name'] for scenario in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError("Scenario names must be unique")
+
+    columns = ['scenario', 'service_name', *SCENARIO_COST_TYPES, 'total_cost']
+    if not services or not scenarios:
+        return pd.DataFrame(columns=columns)
+
+    index = {name: i for i, name in enumerate(node_dict)}
+    rows = np.array([index[service] for service in services], dtype='int64')
+    base = primary_cost_matrix(node_dict)
+    changes = [scenario_changes(scenario, base, index) for scenario in scenarios]
+    k = len(SCENARIO_COST_TYPES)
+
+    groups: Dict[Tuple[Tuple[str, str], ...], List[int]] = {}
+    for i, scenario in enumerate(scenarios):
+        groups.setdefault(tuple(sorted((scenario.get('cost_drivers') or {}).items())), []).append(i)
+
+    deltas = np.zeros((len(services), len(scenarios), k))
+
+    # Base costs and every scenario on the current drivers in one pass; the changes propagate linearly
+    same_drivers = groups.pop((), [])
+    totals = _propagate(AllocationGraph(node_dict), np.hstack([base, *(changes[i] for i in same_drivers)]), reciprocal)
+    totals = totals[rows].reshape(len(services), -1, k)
+    base_totals = totals[:, 0]
+    deltas[:, same_drivers] = totals[:, 1:]
+
+    for cost_drivers, members in groups.items():
+        with _reallocated(node_dict, cost_drivers, driver_edges):
+            graph = AllocationGraph(node_dict)
+        totals = _propagate(graph, np.hstack([base + changes[i] for i in members]), reciprocal)
+        deltas[:, members] = totals[rows].reshape(len(services), -1, k) - base_totals[:, None]
+
+    logger.info(f"Propagated {len(scenarios)} scenarios in {1 + len(groups)} passes")
+
+    # Scenario-major rows: every service of the first scenario, then the next
+    flat = deltas.transpose(1, 0, 2).reshape(-1, k)
+    frame = pd.DataFrame(flat, columns=list(SCENARIO_COST_TYPES))
+    frame.insert(0, 'service_name', np.tile(np.asarray(services, dtype=object), len(scenarios)))
+    frame.insert(0, 'scenario', np.repeat(np.asarray(names, dtype=object), len(services)))
+    frame['total_cost'] = flat.sum(axis=1)
+
+    return frame[(np.abs(flat) > DELTA_TOLERANCE).any(axis=1)].reset_index(drop=True)
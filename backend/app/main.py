@@ -1,7 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, new_tables, cost_analysis
+from app.routers import auth, new_tables, cost_analysis, jobs
 from app.core.config import settings
+from app.core.compute_pool import compute_pool
+from app.core.job_queue import job_queue
 
 app = FastAPI(
     title="Profitify.ai API",
@@ -22,6 +24,24 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(new_tables.router, prefix="/api/new-tables", tags=["new-tables"])
 app.include_router(cost_analysis.router, prefix="/api/cost-analysis", tags=["cost-analysis"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+
+@app.on_event("startup")
+async def start_compute_pool():
+    # Workers are spawned and import the cost module before the first analysis needs them
+    await compute_pool.start(preload=("app.logic.cost_module",))
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.shutdown()
+
+@app.on_event("shutdown")
+async def stop_compute_pool():
+    compute_pool.shutdown()
 
 @app.get("/")
 async def root():
@@ -2,8 +2,8 @@
 Simplified Pydantic models for cost analysis
 """
 from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Dict
+from datetime import datetime, date
 
 class CostAnalysisFilters(BaseModel):
     month: Optional[str] = None
@@ -11,6 +11,8 @@ class CostAnalysisFilters(BaseModel):
     department: Optional[str] = None
     service_name: Optional[str] = None
     patient_type: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
 
 class ServiceCostRecord(BaseModel):
     ipd_number: str
@@ -38,4 +40,63 @@ class ServiceCostRecord(BaseModel):
 class CostAnalysisResponse(BaseModel):
     data: List[ServiceCostRecord]
     total_records: int
-    generated_at: datetime
\ No newline at end of file
+    generated_at: datetime
+
+class CostAnalysisPage(CostAnalysisResponse):
+    offset: int
+    limit: int
+    next_offset: Optional[int] = None
+    sort_by: Optional[str] = None
+    sort_desc: bool = False
+
+class CostAdjustment(BaseModel):
+    """Change to one primary cost type, on one sub cost centre or on all of them when none is given"""
+    cost_type: str
+    sub_cost_centre: Optional[str] = None
+    percent: Optional[float] = None
+    amount: Optional[float] = None
+
+class Scenario(BaseModel):
+    name: str
+    adjustments: List[CostAdjustment] = []
+    # Sub cost centre -> cost driver (as named in cost_center) it allocates on instead
+    cost_drivers: Dict[str, str] = {}
+
+class ScenarioRequest(BaseModel):
+    month: Optional[str] = None
+    year: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    allocation_mode: Optional[str] = None
+    scenarios: List[Scenario]
+
+class ScenarioServiceDelta(BaseModel):
+    scenario: str
+    service_name: str
+    cm: float
+    ew: float
+    hr: float
+    cn: float
+    total_cost: float
+
+class ScenarioResponse(BaseModel):
+    scenarios: List[str]
+    data: List[ScenarioServiceDelta]
+    total_records: int
+    generated_at: datetime
+
+class ServiceCostTrendRecord(BaseModel):
+    month: str
+    service_name: str
+    cm: float
+    ew: float
+    hr: float
+    cn: float
+    total_cost: float
+
+class CostTrendResponse(BaseModel):
+    year: int
+    months: List[str]
+    data: List[ServiceCostTrendRecord]
+    total_records: int
+    generated_at: datetime
@@ -0,0 +1,21 @@
+"""
+Pydantic models for background jobs
+"""
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+class JobResponse(BaseModel):
+    id: str
+    # cost_analysis, or <table>_upload
+    kind: str
+    # queued, running, succeeded, failed or cancelled
+    status: str
+    # Fraction done, when the job can tell
+    progress: Optional[float] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
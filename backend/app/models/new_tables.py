@@ -175,6 +175,7 @@ class VariableCostBillWiseBase(BaseModel):
     doctor_name: Optional[str] = None
     service_name: Optional[str] = None
     payor_type: Optional[str] = None
+    external_id: Optional[str] = None
 
 class VariableCostBillWiseCreate(VariableCostBillWiseBase):
     pass
@@ -200,6 +201,7 @@ class VariableCostBillWiseUpdate(BaseModel):
     doctor_name: Optional[str] = None
     service_name: Optional[str] = None
     payor_type: Optional[str] = None
+    external_id: Optional[str] = None
 
 class VariableCostBillWiseResponse(VariableCostBillWiseBase):
     id: str
@@ -371,6 +373,7 @@ class OTRegisterBase(BaseModel):
     total_time: Optional[str] = None
     remarks: Optional[str] = None
     payor_type: Optional[str] = None
+    external_id: Optional[str] = None
 
 class OTRegisterCreate(OTRegisterBase):
     pass
@@ -400,6 +403,7 @@ class OTRegisterUpdate(BaseModel):
     total_time: Optional[str] = None
     remarks: Optional[str] = None
     payor_type: Optional[str] = None
+    external_id: Optional[str] = None
 
 class OTRegisterResponse(OTRegisterBase):
     id: str
@@ -465,6 +469,7 @@ class ConnectedLoadBase(BaseModel):
     hours: int = 0
     total_load_kg: Decimal = Decimal('0')
     remarks: Optional[str] = None
+    external_id: Optional[str] = None
 
 class ConnectedLoadCreate(ConnectedLoadBase):
     pass
@@ -480,6 +485,7 @@ class ConnectedLoadUpdate(BaseModel):
     hours: Optional[int] = None
     total_load_kg: Optional[Decimal] = None
     remarks: Optional[str] = None
+    external_id: Optional[str] = None
 
 class ConnectedLoadResponse(ConnectedLoadBase):
     id: str
@@ -497,6 +503,7 @@ class FixedAssetRegisterBase(BaseModel):
     furniture_fixture: Decimal = Decimal('0')
     others: Decimal = Decimal('0')
     remarks: Optional[str] = None
+    external_id: Optional[str] = None
 
 class FixedAssetRegisterCreate(FixedAssetRegisterBase):
     pass
@@ -510,6 +517,7 @@ class FixedAssetRegisterUpdate(BaseModel):
     furniture_fixture: Optional[Decimal] = None
     others: Optional[Decimal] = None
     remarks: Optional[str] = None
+    external_id: Optional[str] = None
 
 class FixedAssetRegisterResponse(FixedAssetRegisterBase):
     id: str
@@ -524,6 +532,7 @@ class TATDataBase(BaseModel):
     sub_cost_centre: str
     tat: str
     remarks: Optional[str] = None
+    external_id: Optional[str] = None
 
 class TATDataCreate(TATDataBase):
     pass
@@ -534,6 +543,7 @@ class TATDataUpdate(BaseModel):
     sub_cost_centre: Optional[str] = None
     tat: Optional[str] = None
     remarks: Optional[str] = None
+    external_id: Optional[str] = None
 
 class TATDataResponse(TATDataBase):
     id: str
@@ -652,6 +662,7 @@ class SecondaryCostDriverBase(BaseModel):
     actual_gas_utilization_standard_utilization_ratio: Decimal = Decimal('0')
     actual_vaccume_utilization_standard_utilization_ratio: Decimal = Decimal('0')
     civil: Optional[str] = None
+    external_id: Optional[str] = None
 
 class SecondaryCostDriverCreate(SecondaryCostDriverBase):
     pass
@@ -667,9 +678,30 @@ class SecondaryCostDriverUpdate(BaseModel):
     no_of_nursing_staff: Optional[int] = None
     ot_time_hours: Optional[Decimal] = None
     area_in_sq_meter: Optional[Decimal] = None
+    external_id: Optional[str] = None
 
 class SecondaryCostDriverResponse(SecondaryCostDriverBase):
     id: str
     user_id: str
     created_at: datetime
-    updated_at: Optional[datetime] = None
\ No newline at end of file
+    updated_at: Optional[datetime] = None
+
+# Bulk ingestion
+class BulkRowError(BaseModel):
+    # 0-based position of the row in the uploaded array or file (header line excluded);
+    # for sheet uploads, counted from the first data row
+    row: int
+    # None when the database rejected the row as a whole
+    field: Optional[str] = None
+    error: str
+
+class BulkInsertResponse(BaseModel):
+    table: str
+    received: int
+    inserted: int
+    failed: int
+    # Upserts only: rows left out because a later row of the same request (or sheet chunk) has their upsert key
+    superseded: int = 0
+    ignored_columns: List[str] = []
+    errors: List[BulkRowError] = []
+    errors_truncated: bool = False
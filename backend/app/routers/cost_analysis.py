@@ -2,54 +2,124 @@
 Simplified Cost Analysis API Router
 Single endpoint for cost analysis data
 """
-from fastapi import APIRouter, HTTPException, status, Depends, Query
-from typing import Optional, List
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Header
+from typing import Optional, List, Dict, Any
+from datetime import datetime, date
+import pandas as pd
 import logging
 
 from app.models.cost_analysis import (
     CostAnalysisFilters,
     CostAnalysisResponse,
-    ServiceCostRecord
+    CostAnalysisPage,
+    ServiceCostRecord,
+    ScenarioRequest,
+    ScenarioResponse,
+    ScenarioServiceDelta,
+    CostTrendResponse,
+    ServiceCostTrendRecord
+)
+from app.logic.cost_module import CostAnalysisModule, ALLOCATION_MODES, summarize_cost_frame, trend_months
+from app.core.frame_encoding import (
+    RECORDS, FRAME_FORMATS, EXPORT_FORMATS, resolve_format, frame_response, export_response
 )
-from app.logic.cost_module import CostAnalysisModule
 from app.routers.auth import get_current_user
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-@router.get("/", response_model=List[ServiceCostRecord])
-async def get_cost_analysis_data(
+def _record_frame(cost_df: pd.DataFrame) -> pd.DataFrame:
+    """The cost output with exactly the ServiceCostRecord columns, in order
+    
+    Absent columns default like the record path does ('' and 0.0); missing
+    values inside a column stay null instead of becoming 'nan'.
+    """
+    columns = {}
+    for name, field in ServiceCostRecord.model_fields.items():
+        if field.annotation is float:
+            columns[name] = (
+                pd.to_numeric(cost_df[name], errors='coerce').astype('float64')
+                if name in cost_df.columns else pd.Series(0.0, index=cost_df.index)
+            )
+        else:
+            columns[name] = (
+                cost_df[name].astype(object)
+                if name in cost_df.columns else pd.Series('', index=cost_df.index, dtype=object)
+            )
+    return pd.DataFrame(columns).reset_index(drop=True)
+
+# Numeric record columns; their row sum is the line's total cost
+COST_COLUMNS = [name for name, field in ServiceCostRecord.model_fields.items() if field.annotation is float]
+
+SORT_COLUMNS = (*ServiceCostRecord.model_fields, 'total_cost')
+
+def cost_analysis_filters(
     month: Optional[str] = Query(None, description="Filter by month"),
     year: Optional[int] = Query(None, description="Filter by year"),
     department: Optional[str] = Query(None, description="Filter by department"),
     service_name: Optional[str] = Query(None, description="Filter by service name"),
     patient_type: Optional[str] = Query(None, description="Filter by patient type"),
+    start_date: Optional[date] = Query(None, description="Only include services on or after this date"),
+    end_date: Optional[date] = Query(None, description="Only include services on or before this date"),
+) -> Dict[str, Any]:
+    """Filter query parameters shared by the cost analysis endpoints"""
+    filters = {}
+    if month:
+        filters['month'] = month
+    if year:
+        filters['year'] = year
+    if department:
+        filters['department'] = department
+    if service_name:
+        filters['service_name'] = service_name
+    if patient_type:
+        filters['patient_type'] = patient_type
+    if start_date:
+        filters['start_date'] = start_date.isoformat()
+    if end_date:
+        filters['end_date'] = end_date.isoformat()
+    return filters
+
+def allocation_mode_param(
+    allocation_mode: Optional[str] = Query(None, description="Allocation engine: topological, sparse or reciprocal")
+) -> Optional[str]:
+    if allocation_mode and allocation_mode not in ALLOCATION_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"allocation_mode must be one of: {', '.join(ALLOCATION_MODES)}"
+        )
+    return allocation_mode
+
+@router.get("/", response_model=List[ServiceCostRecord])
+async def get_cost_analysis_data(
+    filters: Dict[str, Any] = Depends(cost_analysis_filters),
+    allocation_mode: Optional[str] = Depends(allocation_mode_param),
+    response_format: Optional[str] = Query(
+        None, alias="format", description=f"Response format: {', '.join(FRAME_FORMATS)}; defaults from Accept"
+    ),
+    accept: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Get service-wise cost analysis data
-    Returns the cost output DataFrame as a list of records
+    Returns the cost output DataFrame as a list of records, or as columnar
+    JSON, an Arrow IPC stream or Parquet when requested by format or Accept
     """
     try:
-        cost_module = CostAnalysisModule(current_user["id"])
-        
-        # Build filters
-        filters = {}
-        if month:
-            filters['month'] = month
-        if year:
-            filters['year'] = year
-        if department:
-            filters['department'] = department
-        if service_name:
-            filters['service_name'] = service_name
-        if patient_type:
-            filters['patient_type'] = patient_type
+        response_format = resolve_format(response_format, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    try:
+        cost_module = CostAnalysisModule(current_user["id"], allocation_mode)
         
         # Generate cost analysis
         cost_df = await cost_module.generate_service_wise_cost_analysis(filters)
         
+        if response_format != RECORDS:
+            # Encoded straight from the frame; no per-row models
+            return frame_response(_record_frame(cost_df), response_format, filename="cost_analysis")
+        
         if cost_df.empty:
             return []
         
@@ -88,4 +158,216 @@ async def get_cost_analysis_data(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to generate cost analysis: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.get("/export")
+async def export_cost_analysis_data(
+    filters: Dict[str, Any] = Depends(cost_analysis_filters),
+    allocation_mode: Optional[str] = Depends(allocation_mode_param),
+    export_format: str = Query("ndjson", alias="format", description=f"Export format: {', '.join(EXPORT_FORMATS)}"),
+    compress: bool = Query(True, description="Gzip the export"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Download the service-wise cost output as NDJSON or CSV
+    The body is serialized and compressed chunk by chunk while it streams
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+        )
+    
+    try:
+        cost_module = CostAnalysisModule(current_user["id"], allocation_mode)
+        cost_df = await cost_module.generate_service_wise_cost_analysis(filters)
+        
+        return export_response(_record_frame(cost_df), export_format, compress, filename="cost_analysis")
+        
+    except Exception as e:
+        logger.error(f"Error exporting cost analysis: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to export cost analysis: {str(e)}"
+        )
+
+@router.get("/results", response_model=CostAnalysisPage)
+async def get_cost_analysis_page(
+    filters: Dict[str, Any] = Depends(cost_analysis_filters),
+    allocation_mode: Optional[str] = Depends(allocation_mode_param),
+    limit: int = Query(100, ge=1, le=10000, description="Rows per page"),
+    offset: int = Query(0, ge=0, description="Rows to skip"),
+    sort_by: Optional[str] = Query(None, description="Column to sort by, or total_cost"),
+    sort_desc: bool = Query(False, description="Sort descending"),
+    doctor_name: Optional[str] = Query(None, description="Filter by doctor name"),
+    min_total_cost: Optional[float] = Query(None, description="Only rows whose total cost is at least this"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Page through service-wise cost analysis data
+    Sorting and filtering run on the cached output frame, so paging never reruns the allocation
+    """
+    if sort_by and sort_by not in SORT_COLUMNS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"sort_by must be one of: {', '.join(SORT_COLUMNS)}"
+        )
+    
+    try:
+        cost_module = CostAnalysisModule(current_user["id"], allocation_mode)
+        cost_df = _record_frame(await cost_module.generate_service_wise_cost_analysis(filters))
+        
+        if doctor_name:
+            cost_df = cost_df[cost_df['doctor_name'] == doctor_name]
+        
+        if min_total_cost is not None or sort_by == 'total_cost':
+            total_cost = cost_df[COST_COLUMNS].fillna(0).sum(axis=1)
+            if min_total_cost is not None:
+                keep = total_cost >= min_total_cost
+                cost_df, total_cost = cost_df[keep], total_cost[keep]
+            if sort_by == 'total_cost':
+                cost_df = cost_df.assign(total_cost=total_cost)
+        
+        if sort_by:
+            cost_df = cost_df.sort_values(sort_by, ascending=not sort_desc, kind='stable', na_position='last')
+        
+        page = cost_df.iloc[offset:offset + limit]
+        string_columns = [name for name in ServiceCostRecord.model_fields if name not in COST_COLUMNS]
+        page = page[list(ServiceCostRecord.model_fields)].fillna(
+            {**{name: '' for name in string_columns}, **{name: 0.0 for name in COST_COLUMNS}}
+        )
+        
+        total_records = len(cost_df)
+        return CostAnalysisPage(
+            data=[ServiceCostRecord(**record) for record in page.to_dict('records')],
+            total_records=total_records,
+            generated_at=datetime.now(),
+            offset=offset,
+            limit=limit,
+            next_offset=offset + limit if offset + limit < total_records else None,
+            sort_by=sort_by,
+            sort_desc=sort_desc
+        )
+        
+    except Exception as e:
+        logger.error(f"Error paging cost analysis: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to page cost analysis: {str(e)}"
+        )
+
+@router.get("/summary")
+async def get_cost_analysis_summary(
+    filters: Dict[str, Any] = Depends(cost_analysis_filters),
+    allocation_mode: Optional[str] = Depends(allocation_mode_param),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get summary metrics of the service-wise cost analysis
+    Computed from the cached output frame when the inputs are unchanged
+    """
+    try:
+        cost_module = CostAnalysisModule(current_user["id"], allocation_mode)
+        cost_df = await cost_module.generate_service_wise_cost_analysis(filters)
+        return summarize_cost_frame(cost_df)
+        
+    except Exception as e:
+        logger.error(f"Error summarizing cost analysis: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to summarize cost analysis: {str(e)}"
+        )
+
+@router.get("/trend", response_model=CostTrendResponse)
+async def get_cost_trend(
+    year: int = Query(..., description="Year to break down by month"),
+    months: Optional[List[str]] = Query(None, description="Months to include; defaults to all twelve"),
+    allocation_mode: Optional[str] = Depends(allocation_mode_param),
+    response_format: Optional[str] = Query(
+        None, alias="format", description=f"Response format: {', '.join(FRAME_FORMATS)}; defaults from Accept"
+    ),
+    accept: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Per-service allocated costs of each month of a year
+    The year is loaded once and all months are allocated in one pass over a shared graph;
+    HR rows count in the month their period names, and expense, trial balance and
+    undated HR amounts are taken as annual, a twelfth to each month
+    """
+    try:
+        response_format = resolve_format(response_format, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    try:
+        months = trend_months(months)
+        cost_module = CostAnalysisModule(current_user["id"], allocation_mode)
+        trend_df = await cost_module.generate_cost_trend(year, months)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error generating cost trend: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate cost trend: {str(e)}"
+        )
+    
+    if response_format != RECORDS:
+        return frame_response(trend_df, response_format, filename=f"cost_trend_{year}")
+    
+    return CostTrendResponse(
+        year=year,
+        months=months,
+        data=[ServiceCostTrendRecord(**record) for record in trend_df.to_dict('records')],
+        total_records=len(trend_df),
+        generated_at=datetime.now()
+    )
+
+@router.post("/scenarios", response_model=ScenarioResponse)
+async def run_cost_scenarios(
+    request: ScenarioRequest,
+    response_format: Optional[str] = Query(
+        None, alias="format", description=f"Response format: {', '.join(FRAME_FORMATS)}; defaults from Accept"
+    ),
+    accept: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Per-service cost deltas of what-if scenarios against one period
+    All scenarios are propagated through the allocation graph together instead of one analysis run each
+    """
+    try:
+        response_format = resolve_format(response_format, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    allocation_mode = allocation_mode_param(request.allocation_mode)
+    
+    filters = request.model_dump(include={'month', 'year', 'start_date', 'end_date'}, exclude_none=True)
+    for key in ('start_date', 'end_date'):
+        if key in filters:
+            filters[key] = filters[key].isoformat()
+    
+    try:
+        cost_module = CostAnalysisModule(current_user["id"], allocation_mode)
+        deltas = await cost_module.run_scenarios(filters, [scenario.model_dump() for scenario in request.scenarios])
+        
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error running cost scenarios: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to run cost scenarios: {str(e)}"
+        )
+    
+    if response_format != RECORDS:
+        return frame_response(deltas, response_format, filename="scenarios")
+    
+    return ScenarioResponse(
+        scenarios=[scenario.name for scenario in request.scenarios],
+        data=[ScenarioServiceDelta(**record) for record in deltas.to_dict('records')],
+        total_records=len(deltas),
+        generated_at=datetime.now()
+    )
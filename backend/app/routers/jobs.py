@@ -0,0 +1,173 @@
+"""
+Background Jobs API Router
+Submit long-running sheet uploads and cost analysis runs, then poll their status and fetch their results
+"""
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Header, UploadFile, File
+from fastapi.responses import Response
+from typing import Optional, List, Dict, Any
+import asyncio
+import os
+import shutil
+import tempfile
+import pandas as pd
+import logging
+
+from app.models.jobs import JobResponse
+from app.logic.cost_module import CostAnalysisModule
+from app.core.job_queue import job_queue, JobContext, SUCCEEDED
+from app.core.database_layer import DatabaseLayer
+from app.core.result_cache import result_cache
+from app.core.sheet_ingest import ingest_sheet, read_sheet_chunks, sheet_format, SHEET_HEADER_ROW, SHEET_DATA_ROW
+from app.core.frame_encoding import RECORDS, FRAME_FORMATS, resolve_format, frame_response
+from app.routers.auth import get_current_user
+from app.routers.cost_analysis import cost_analysis_filters, allocation_mode_param, _record_frame
+from app.routers.new_tables import BULK_TABLES
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+async def _cost_analysis_job(job: JobContext, user_id: str, allocation_mode: Optional[str],
+                             filters: Dict[str, Any]) -> pd.DataFrame:
+    cost_module = CostAnalysisModule(user_id, allocation_mode)
+    cost_df = await cost_module.generate_service_wise_cost_analysis(
+        filters, progress=job.progress, raise_errors=True
+    )
+    return _record_frame(cost_df)
+
+async def _upload_job(job: JobContext, user_id: str, table: str, model, path: str, filename: str,
+                      sheet: Optional[str], header_row: int, data_row: int, upsert: bool) -> Dict[str, Any]:
+    try:
+        with open(path, "rb") as f:
+            chunks = read_sheet_chunks(f, filename, sheet, header_row, data_row)
+            result = await ingest_sheet(
+                DatabaseLayer(user_id), table, model, chunks, progress=job.progress, upsert=upsert
+            )
+    finally:
+        os.remove(path)
+
+    if result["inserted"]:
+        result_cache.invalidate(user_id, table)
+    return result
+
+def _spool(upload: UploadFile, suffix: str) -> str:
+    # The upload is closed once the request ends; the job reads its own copy
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as f:
+        shutil.copyfileobj(upload.file, f, 1024 * 1024)
+    return path
+
+@router.post("/cost-analysis", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_cost_analysis_job(
+    filters: Dict[str, Any] = Depends(cost_analysis_filters),
+    allocation_mode: Optional[str] = Depends(allocation_mode_param),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue a service-wise cost analysis run
+    The result holds the same records as GET /api/cost-analysis/ with the same filters
+    """
+    job = await job_queue.submit(
+        current_user["id"], "cost_analysis", _cost_analysis_job, current_user["id"], allocation_mode, filters
+    )
+    return JobResponse(**job)
+
+@router.post("/{table_slug}/upload", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_upload_job(
+    table_slug: str,
+    file: UploadFile = File(...),
+    sheet: Optional[str] = Query(None, description="Workbook sheet name; the first sheet by default"),
+    header_row: int = Query(SHEET_HEADER_ROW, ge=0, description="0-based row holding the column titles"),
+    data_row: int = Query(SHEET_DATA_ROW, ge=1, description="0-based row the data starts on"),
+    upsert: bool = Query(False, description="Update rows whose natural key already exists instead of adding them; tables without one match rows on external_id, which every row then needs"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue loading an .xlsx or .csv sheet into a table
+    Same as POST /api/new-tables/{table_slug}/upload, with the response as the job's result
+    """
+    if table_slug not in BULK_TABLES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown table: {table_slug}"
+        )
+    table, model = BULK_TABLES[table_slug]
+
+    try:
+        sheet_format(file.filename)
+        if header_row >= data_row:
+            raise ValueError("header_row must be below data_row")
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        path = await asyncio.to_thread(_spool, file, os.path.splitext(file.filename)[1])
+        job = await job_queue.submit(
+            current_user["id"], f"{table}_upload", _upload_job,
+            current_user["id"], table, model, path, file.filename, sheet, header_row, data_row, upsert
+        )
+        return JobResponse(**job)
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to queue {table_slug} upload: {str(e)}"
+        )
+
+@router.get("/", response_model=List[JobResponse])
+async def list_jobs(current_user: dict = Depends(get_current_user)):
+    """List the current user's jobs that haven't expired, oldest first"""
+    return [JobResponse(**job) for job in await job_queue.list(current_user["id"])]
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Get a job's status and progress"""
+    job = await job_queue.get(current_user["id"], job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return JobResponse(**job)
+
+@router.get("/{job_id}/result")
+async def get_job_result(
+    job_id: str,
+    response_format: Optional[str] = Query(
+        None, alias="format", description=f"Format of cost analysis results: {', '.join(FRAME_FORMATS)}; defaults from Accept"
+    ),
+    accept: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the result of a succeeded job
+    409 while the job is unfinished, and for jobs that failed or were cancelled
+    """
+    job = await job_queue.get(current_user["id"], job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is {job['status']}" + (f": {job['error']}" if job["error"] else "")
+        )
+
+    try:
+        response_format = resolve_format(response_format, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    result = await job_queue.result(current_user["id"], job_id)
+    if not isinstance(result, pd.DataFrame):
+        return result
+    if response_format != RECORDS:
+        return frame_response(result, response_format, filename=job["kind"])
+    # Records encoded straight from the frame, NaN as null
+    return Response(content=result.to_json(orient="records"), media_type="application/json")
+
+@router.post("/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Cancel a job
+    A queued job is cancelled at once, a running one as soon as it reaches a point where it can stop
+    """
+    job = await job_queue.cancel(current_user["id"], job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return JobResponse(**job)
@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List, Optional
+import asyncio
+import copy
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, UploadFile, File
+from typing import List, Optional, Tuple
 from app.models.new_tables import (
     # Service Register
     ServiceRegisterCreate, ServiceRegisterUpdate, ServiceRegisterResponse,
@@ -27,12 +29,92 @@ from app.models.new_tables import (
     CostCenterCreate, CostCenterUpdate, CostCenterResponse,
     # Secondary Cost Driver
     SecondaryCostDriverCreate, SecondaryCostDriverUpdate, SecondaryCostDriverResponse,
+    # Bulk ingestion
+    BulkInsertResponse,
 )
 from app.routers.auth import get_current_user
 from app.core.database import get_supabase_client
+from app.core.config import settings
+from app.core.result_cache import result_cache
+from app.core.database_layer import DatabaseLayer
+from app.core.bulk_ingest import ingest_rows, read_json_rows, read_csv_rows
+from app.core.sheet_ingest import ingest_sheet, read_sheet_chunks, SHEET_HEADER_ROW, SHEET_DATA_ROW
+from app.logic.incremental import apply_primary_cost_edit
 
 router = APIRouter()
 
+# Postgres error code PostgREST reports when a write repeats a unique key
+UNIQUE_VIOLATION = "23505"
+
+def _write_error_status(e: Exception) -> int:
+    """Status of a failed create or update: 409 when the row repeats a unique key of its table"""
+    if getattr(e, "code", None) == UNIQUE_VIOLATION:
+        return status.HTTP_409_CONFLICT
+    return status.HTTP_500_INTERNAL_SERVER_ERROR
+
+def _paginate(query, order_column: str, after_id: Optional[str], limit: Optional[int]) -> List[dict]:
+    """Rows of a list query: one keyset page on id when a cursor or limit is given
+    
+    Without either, the pages are walked here and all rows returned in the default
+    ordering, since a single select is cut short at PostgREST's max-rows. Blocking;
+    endpoints run it on a worker thread.
+    """
+    if after_id is not None or limit is not None:
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        return query.order("id").limit(limit or settings.db_page_size).execute().data
+    
+    rows = []
+    last_id = None
+    while True:
+        # Filters replace the builder's params rather than mutate them, so a copy starts each page
+        page = copy.copy(query)
+        if last_id is not None:
+            page = page.gt("id", last_id)
+        
+        data = page.order("id").limit(settings.db_page_size).execute().data
+        if not data:
+            break
+        
+        rows.extend(data)
+        last_id = data[-1]["id"]
+    
+    # Newest first with nulls leading, as ORDER BY ... DESC returned them
+    rows.sort(key=lambda row: (row.get(order_column) is None, row.get(order_column) or ""), reverse=True)
+    return rows
+
+def _patchable_row(table: str, record_id: str, user_id: str) -> Optional[dict]:
+    """The user's row before an edit, read only when cached results could be patched with it"""
+    if not result_cache.has_state(user_id, table):
+        return None
+    
+    existing = get_supabase_client().table(table).select("*").eq(
+        "id", record_id
+    ).eq("user_id", user_id).execute()
+    return existing.data[0] if existing.data else None
+
+def _update_patchable_row(table: str, record_id: str, user_id: str, update_data: dict,
+                          old_row: Optional[dict]) -> Tuple[Optional[dict], Optional[dict]]:
+    """Update a user's row, returning the new row and, when it is known exactly, the row it replaced
+    
+    With old_row read beforehand, the update only matches while the row still carries
+    old_row's updated_at, so a concurrent edit in between can't be mistaken for it.
+    If the row moved on, the update is made unconditionally and the old row reported
+    unknown, so the caller invalidates instead of patching with the wrong delta.
+    """
+    def update():
+        return get_supabase_client().table(table).update(update_data).eq(
+            "id", record_id
+        ).eq("user_id", user_id)
+    
+    if old_row is not None:
+        result = update().eq("updated_at", old_row["updated_at"]).execute()
+        if result.data:
+            return result.data[0], old_row
+    
+    result = update().execute()
+    return (result.data[0] if result.data else None), None
+
 # Service Register endpoints
 @router.post("/service-register/", response_model=ServiceRegisterResponse)
 async def create_service_register(
@@ -59,6 +141,7 @@ async def create_service_register(
                 record[field] = float(record[field])
         
         result = supabase.table("service_register").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "service_register")
         
         if not result.data:
             raise HTTPException(
@@ -72,7 +155,7 @@ async def create_service_register(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create service register entry: {str(e)}"
         )
 
@@ -81,6 +164,8 @@ async def get_service_register(
     month: Optional[str] = None,
     patient_type: Optional[str] = None,
     service_department: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get service register entries with optional filtering"""
@@ -96,8 +181,8 @@ async def get_service_register(
         if service_department:
             query = query.eq("service_department", service_department)
         
-        result = query.order("date_of_final_bill", desc=True).execute()
-        return [ServiceRegisterResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "date_of_final_bill", after_id, limit)
+        return [ServiceRegisterResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -115,17 +200,6 @@ async def update_service_register(
     supabase = get_supabase_client()
     
     try:
-        # Check if record exists and belongs to user
-        existing = supabase.table("service_register").select("*").eq(
-            "id", record_id
-        ).eq("user_id", current_user["id"]).execute()
-        
-        if not existing.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Service register entry not found"
-            )
-        
         # Update only provided fields
         update_data = {k: v for k, v in data.dict().items() if v is not None}
         
@@ -141,23 +215,25 @@ async def update_service_register(
         
         update_data["updated_at"] = "now()"
         
+        # Ownership is checked by the update itself; no row back means no such entry for this user
         result = supabase.table("service_register").update(update_data).eq(
             "id", record_id
         ).eq("user_id", current_user["id"]).execute()
         
         if not result.data:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update service register entry"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Service register entry not found"
             )
         
+        result_cache.invalidate(current_user["id"], "service_register")
         return ServiceRegisterResponse(**result.data[0])
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to update service register entry: {str(e)}"
         )
 
@@ -170,20 +246,18 @@ async def delete_service_register(
     supabase = get_supabase_client()
     
     try:
-        # Check if record exists and belongs to user
-        existing = supabase.table("service_register").select("*").eq(
+        # Delete only if the record belongs to the user; the deleted rows come back
+        result = supabase.table("service_register").delete().eq(
             "id", record_id
         ).eq("user_id", current_user["id"]).execute()
         
-        if not existing.data:
+        if not result.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Service register entry not found"
             )
         
-        # Delete record
-        result = supabase.table("service_register").delete().eq("id", record_id).execute()
-        
+        result_cache.invalidate(current_user["id"], "service_register")
         return {"message": "Service register entry deleted successfully"}
         
     except HTTPException:
@@ -215,6 +289,7 @@ async def create_trial_balance(
                 record[field] = float(record[field])
         
         result = supabase.table("trial_balance").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "trial_balance")
         
         if not result.data:
             raise HTTPException(
@@ -228,13 +303,15 @@ async def create_trial_balance(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create trial balance entry: {str(e)}"
         )
 
 @router.get("/trial-balance/", response_model=List[TrialBalanceResponse])
 async def get_trial_balance(
     category: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get trial balance entries with optional filtering"""
@@ -246,8 +323,8 @@ async def get_trial_balance(
         if category:
             query = query.eq("category", category)
         
-        result = query.order("created_at", desc=True).execute()
-        return [TrialBalanceResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "created_at", after_id, limit)
+        return [TrialBalanceResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -275,6 +352,7 @@ async def create_expense_wise(
             record["amount"] = float(record["amount"])
         
         result = supabase.table("expense_wise").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "expense_wise")
         
         if not result.data:
             raise HTTPException(
@@ -288,13 +366,15 @@ async def create_expense_wise(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create expense wise entry: {str(e)}"
         )
 
 @router.get("/expense-wise/", response_model=List[ExpenseWiseResponse])
 async def get_expense_wise(
     nature_of_data: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get expense wise entries with optional filtering"""
@@ -306,8 +386,8 @@ async def get_expense_wise(
         if nature_of_data:
             query = query.eq("nature_of_data", nature_of_data)
         
-        result = query.order("created_at", desc=True).execute()
-        return [ExpenseWiseResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "created_at", after_id, limit)
+        return [ExpenseWiseResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -315,6 +395,51 @@ async def get_expense_wise(
             detail=f"Failed to retrieve expense wise entries: {str(e)}"
         )
 
+@router.put("/expense-wise/{record_id}", response_model=ExpenseWiseResponse)
+async def update_expense_wise(
+    record_id: str,
+    data: ExpenseWiseUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Update expense wise entry"""
+    
+    try:
+        # The row as it was is only needed to patch cached results, so it's only read when there are some
+        old_row = _patchable_row("expense_wise", record_id, current_user["id"])
+        
+        update_data = {k: v for k, v in data.dict().items() if v is not None}
+        
+        # Convert decimal fields to float
+        if update_data.get("amount"):
+            update_data["amount"] = float(update_data["amount"])
+        
+        update_data["updated_at"] = "now()"
+        
+        # Ownership is checked by the update itself; no row back means no such entry for this user
+        new_row, old_row = _update_patchable_row("expense_wise", record_id, current_user["id"], update_data, old_row)
+        
+        if new_row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Expense wise entry not found"
+            )
+        
+        if old_row is not None:
+            # Cached results take the changed amount incrementally instead of being recomputed
+            await apply_primary_cost_edit(current_user["id"], "expense_wise", old_row, new_row)
+        else:
+            result_cache.invalidate(current_user["id"], "expense_wise")
+        
+        return ExpenseWiseResponse(**new_row)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=_write_error_status(e),
+            detail=f"Failed to update expense wise entry: {str(e)}"
+        )
+
 # Variable Cost Bill Wise endpoints
 @router.post("/variable-cost-bill-wise/", response_model=VariableCostBillWiseResponse)
 async def create_variable_cost_bill_wise(
@@ -346,6 +471,7 @@ async def create_variable_cost_bill_wise(
                 record[field] = float(record[field])
         
         result = supabase.table("variable_cost_bill_wise").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "variable_cost_bill_wise")
         
         if not result.data:
             raise HTTPException(
@@ -359,7 +485,7 @@ async def create_variable_cost_bill_wise(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create variable cost bill wise entry: {str(e)}"
         )
 
@@ -367,6 +493,8 @@ async def create_variable_cost_bill_wise(
 async def get_variable_cost_bill_wise(
     patient_type: Optional[str] = None,
     bill_no: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get variable cost bill wise entries with optional filtering"""
@@ -380,8 +508,8 @@ async def get_variable_cost_bill_wise(
         if bill_no:
             query = query.eq("bill_no", bill_no)
         
-        result = query.order("created_at", desc=True).execute()
-        return [VariableCostBillWiseResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "created_at", after_id, limit)
+        return [VariableCostBillWiseResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -421,6 +549,7 @@ async def create_hr_data(
                 record[field] = float(record[field])
         
         result = supabase.table("hr_data").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "hr_data")
         
         if not result.data:
             raise HTTPException(
@@ -434,7 +563,7 @@ async def create_hr_data(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create HR data entry: {str(e)}"
         )
 
@@ -442,6 +571,8 @@ async def create_hr_data(
 async def get_hr_data(
     department: Optional[str] = None,
     period: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get HR data entries with optional filtering"""
@@ -455,8 +586,8 @@ async def get_hr_data(
         if period:
             query = query.eq("period", period)
         
-        result = query.order("created_at", desc=True).execute()
-        return [HRDataResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "created_at", after_id, limit)
+        return [HRDataResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -464,6 +595,63 @@ async def get_hr_data(
             detail=f"Failed to retrieve HR data entries: {str(e)}"
         )
 
+@router.put("/hr-data/{record_id}", response_model=HRDataResponse)
+async def update_hr_data(
+    record_id: str,
+    data: HRDataUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Update HR data entry"""
+    
+    try:
+        # The row as it was is only needed to patch cached results, so it's only read when there are some
+        old_row = _patchable_row("hr_data", record_id, current_user["id"])
+        
+        update_data = {k: v for k, v in data.dict().items() if v is not None}
+        
+        # Convert date fields to string format
+        for field in ["date_of_joining", "date_of_resignation"]:
+            if update_data.get(field):
+                update_data[field] = update_data[field].isoformat()
+        
+        # Convert decimal fields to float
+        decimal_fields = [
+            "efforts_allocation", "efforts_sub_allocation", "utilization", "basic_pay",
+            "allowances", "other_benefits", "overtime", "bonus", "epf", "esic",
+            "any_other_contribution", "gross_total", "deduction", "net_salary"
+        ]
+        
+        for field in decimal_fields:
+            if update_data.get(field):
+                update_data[field] = float(update_data[field])
+        
+        update_data["updated_at"] = "now()"
+        
+        # Ownership is checked by the update itself; no row back means no such entry for this user
+        new_row, old_row = _update_patchable_row("hr_data", record_id, current_user["id"], update_data, old_row)
+        
+        if new_row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="HR data entry not found"
+            )
+        
+        if old_row is not None:
+            # Cached results take the changed salary incrementally instead of being recomputed
+            await apply_primary_cost_edit(current_user["id"], "hr_data", old_row, new_row)
+        else:
+            result_cache.invalidate(current_user["id"], "hr_data")
+        
+        return HRDataResponse(**new_row)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=_write_error_status(e),
+            detail=f"Failed to update HR data entry: {str(e)}"
+        )
+
 # Occupancy Register endpoints
 @router.post("/occupancy-register/", response_model=OccupancyRegisterResponse)
 async def create_occupancy_register(
@@ -490,6 +678,7 @@ async def create_occupancy_register(
                 record[field] = record[field].isoformat()
         
         result = supabase.table("occupancy_register").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "occupancy_register")
         
         if not result.data:
             raise HTTPException(
@@ -503,7 +692,7 @@ async def create_occupancy_register(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create occupancy register entry: {str(e)}"
         )
 
@@ -511,6 +700,8 @@ async def create_occupancy_register(
 async def get_occupancy_register(
     ward_code: Optional[str] = None,
     medical_record_number_or_registration_number_uhid: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get occupancy register entries with optional filtering"""
@@ -524,8 +715,8 @@ async def get_occupancy_register(
         if medical_record_number_or_registration_number_uhid:
             query = query.eq("medical_record_number_or_registration_number_uhid", medical_record_number_or_registration_number_uhid)
         
-        result = query.order("patient_admission_date", desc=True).execute()
-        return [OccupancyRegisterResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "patient_admission_date", after_id, limit)
+        return [OccupancyRegisterResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -559,6 +750,7 @@ async def create_ot_register(
                 record[field] = record[field].isoformat()
         
         result = supabase.table("ot_register").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "ot_register")
         
         if not result.data:
             raise HTTPException(
@@ -572,7 +764,7 @@ async def create_ot_register(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create OT register entry: {str(e)}"
         )
 
@@ -581,6 +773,8 @@ async def get_ot_register(
     performing_doctor_department: Optional[str] = None,
     performing_doctor_department_speciality_name: Optional[str] = None,
     nature_of_procedure: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get OT register entries with optional filtering"""
@@ -594,8 +788,8 @@ async def get_ot_register(
         if nature_of_procedure:
             query = query.eq("nature_of_procedure", nature_of_procedure)
         
-        result = query.order("service_date", desc=True).execute()
-        return [OTRegisterResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "service_date", after_id, limit)
+        return [OTRegisterResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -628,6 +822,7 @@ async def create_consumption_data(
                 record[field] = float(record[field])
         
         result = supabase.table("consumption_data").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "consumption_data")
         
         if not result.data:
             raise HTTPException(
@@ -641,13 +836,15 @@ async def create_consumption_data(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create consumption data entry: {str(e)}"
         )
 
 @router.get("/consumption-data/", response_model=List[ConsumptionDataResponse])
 async def get_consumption_data(
     cost_centre: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get consumption data entries with optional filtering"""
@@ -659,8 +856,8 @@ async def get_consumption_data(
         if cost_centre:
             query = query.eq("cost_centre", cost_centre)
         
-        result = query.order("transaction_date", desc=True).execute()
-        return [ConsumptionDataResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "transaction_date", after_id, limit)
+        return [ConsumptionDataResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -689,6 +886,7 @@ async def create_connected_load(
                 record[field] = float(record[field])
         
         result = supabase.table("connected_load").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "connected_load")
         
         if not result.data:
             raise HTTPException(
@@ -702,13 +900,15 @@ async def create_connected_load(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create connected load entry: {str(e)}"
         )
 
 @router.get("/connected-load/", response_model=List[ConnectedLoadResponse])
 async def get_connected_load(
     sub_cost_centre: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get connected load entries with optional filtering"""
@@ -720,8 +920,8 @@ async def get_connected_load(
         if sub_cost_centre:
             query = query.eq("sub_cost_centre", sub_cost_centre)
         
-        result = query.order("created_at", desc=True).execute()
-        return [ConnectedLoadResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "created_at", after_id, limit)
+        return [ConnectedLoadResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -750,6 +950,7 @@ async def create_fixed_asset_register(
                 record[field] = float(record[field])
         
         result = supabase.table("fixed_asset_register").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "fixed_asset_register")
         
         if not result.data:
             raise HTTPException(
@@ -763,13 +964,15 @@ async def create_fixed_asset_register(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create fixed asset register entry: {str(e)}"
         )
 
 @router.get("/fixed-asset-register/", response_model=List[FixedAssetRegisterResponse])
 async def get_fixed_asset_register(
     sub_cost_centre: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get fixed asset register entries with optional filtering"""
@@ -781,8 +984,8 @@ async def get_fixed_asset_register(
         if sub_cost_centre:
             query = query.eq("sub_cost_centre", sub_cost_centre)
         
-        result = query.order("created_at", desc=True).execute()
-        return [FixedAssetRegisterResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "created_at", after_id, limit)
+        return [FixedAssetRegisterResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -806,6 +1009,7 @@ async def create_tat_data(
         }
         
         result = supabase.table("tat_data").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "tat_data")
         
         if not result.data:
             raise HTTPException(
@@ -819,13 +1023,15 @@ async def create_tat_data(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create TAT data entry: {str(e)}"
         )
 
 @router.get("/tat-data/", response_model=List[TATDataResponse])
 async def get_tat_data(
     sub_cost_centre: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get TAT data entries with optional filtering"""
@@ -837,8 +1043,8 @@ async def get_tat_data(
         if sub_cost_centre:
             query = query.eq("sub_cost_centre", sub_cost_centre)
         
-        result = query.order("created_at", desc=True).execute()
-        return [TATDataResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "created_at", after_id, limit)
+        return [TATDataResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -862,6 +1068,7 @@ async def create_cost_center(
         }
         
         result = supabase.table("cost_center").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "cost_center")
         
         if not result.data:
             raise HTTPException(
@@ -875,7 +1082,7 @@ async def create_cost_center(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create cost center entry: {str(e)}"
         )
 
@@ -883,6 +1090,8 @@ async def create_cost_center(
 async def get_cost_center(
     cc_type: Optional[str] = None,
     cost_centre: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get cost center entries with optional filtering"""
@@ -896,8 +1105,8 @@ async def get_cost_center(
         if cost_centre:
             query = query.eq("cost_centre", cost_centre)
         
-        result = query.order("created_at", desc=True).execute()
-        return [CostCenterResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "created_at", after_id, limit)
+        return [CostCenterResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -936,6 +1145,7 @@ async def create_secondary_cost_driver(
                 record[field] = float(record[field])
         
         result = supabase.table("secondary_cost_driver").insert(record).execute()
+        result_cache.invalidate(current_user["id"], "secondary_cost_driver")
         
         if not result.data:
             raise HTTPException(
@@ -949,13 +1159,15 @@ async def create_secondary_cost_driver(
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to create secondary cost driver entry: {str(e)}"
         )
 
 @router.get("/secondary-cost-driver/", response_model=List[SecondaryCostDriverResponse])
 async def get_secondary_cost_driver(
     sub_cost_centre: Optional[str] = None,
+    after_id: Optional[str] = Query(None, description="Return rows after this id (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size for keyset pagination"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get secondary cost driver entries with optional filtering"""
@@ -967,8 +1179,8 @@ async def get_secondary_cost_driver(
         if sub_cost_centre:
             query = query.eq("sub_cost_centre", sub_cost_centre)
         
-        result = query.order("created_at", desc=True).execute()
-        return [SecondaryCostDriverResponse(**record) for record in result.data]
+        rows = await asyncio.to_thread(_paginate, query, "created_at", after_id, limit)
+        return [SecondaryCostDriverResponse(**record) for record in rows]
         
     except Exception as e:
         raise HTTPException(
@@ -987,16 +1199,6 @@ async def update_trial_balance(
     supabase = get_supabase_client()
     
     try:
-        existing = supabase.table("trial_balance").select("*").eq(
-            "id", record_id
-        ).eq("user_id", current_user["id"]).execute()
-        
-        if not existing.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Trial balance entry not found"
-            )
-        
         update_data = {k: v for k, v in data.dict().items() if v is not None}
         
         # Convert decimal fields to float
@@ -1006,23 +1208,25 @@ async def update_trial_balance(
         
         update_data["updated_at"] = "now()"
         
+        # Ownership is checked by the update itself; no row back means no such entry for this user
         result = supabase.table("trial_balance").update(update_data).eq(
             "id", record_id
         ).eq("user_id", current_user["id"]).execute()
         
         if not result.data:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update trial balance entry"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Trial balance entry not found"
             )
         
+        result_cache.invalidate(current_user["id"], "trial_balance")
         return TrialBalanceResponse(**result.data[0])
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=_write_error_status(e),
             detail=f"Failed to update trial balance entry: {str(e)}"
         )
 
@@ -1035,18 +1239,18 @@ async def delete_trial_balance(
     supabase = get_supabase_client()
     
     try:
-        existing = supabase.table("trial_balance").select("*").eq(
+        # Delete only if the record belongs to the user; the deleted rows come back
+        result = supabase.table("trial_balance").delete().eq(
             "id", record_id
         ).eq("user_id", current_user["id"]).execute()
         
-        if not existing.data:
+        if not result.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Trial balance entry not found"
             )
         
-        result = supabase.table("trial_balance").delete().eq("id", record_id).execute()
-        
+        result_cache.invalidate(current_user["id"], "trial_balance")
         return {"message": "Trial balance entry deleted successfully"}
         
     except HTTPException:
@@ -1055,4 +1259,113 @@ async def delete_trial_balance(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete trial balance entry: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+# Bulk ingestion endpoint
+# Tables by URL slug, with the model every uploaded row is validated against
+BULK_TABLES = {
+    "service-register": ("service_register", ServiceRegisterCreate),
+    "trial-balance": ("trial_balance", TrialBalanceCreate),
+    "expense-wise": ("expense_wise", ExpenseWiseCreate),
+    "variable-cost-bill-wise": ("variable_cost_bill_wise", VariableCostBillWiseCreate),
+    "hr-data": ("hr_data", HRDataCreate),
+    "occupancy-register": ("occupancy_register", OccupancyRegisterCreate),
+    "ot-register": ("ot_register", OTRegisterCreate),
+    "consumption-data": ("consumption_data", ConsumptionDataCreate),
+    "connected-load": ("connected_load", ConnectedLoadCreate),
+    "fixed-asset-register": ("fixed_asset_register", FixedAssetRegisterCreate),
+    "tat-data": ("tat_data", TATDataCreate),
+    "cost-center": ("cost_center", CostCenterCreate),
+    "secondary-cost-driver": ("secondary_cost_driver", SecondaryCostDriverCreate),
+}
+
+async def _read_bulk_rows(request: Request):
+    """Raw rows of a bulk request: a JSON array, a CSV body, or a CSV uploaded as the form field 'file'"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise ValueError("Expected a CSV upload in the form field 'file'")
+        return await asyncio.to_thread(read_csv_rows, await upload.read())
+    
+    body = await request.body()
+    if content_type in ("text/csv", "application/csv"):
+        return await asyncio.to_thread(read_csv_rows, body)
+    if content_type in ("", "application/json"):
+        return await asyncio.to_thread(read_json_rows, body)
+    raise ValueError(f"Unsupported content type: {content_type}")
+
+@router.post("/{table_slug}/bulk", response_model=BulkInsertResponse)
+async def bulk_insert(
+    table_slug: str,
+    request: Request,
+    upsert: bool = Query(False, description="Update rows whose natural key already exists instead of adding them; tables without one match rows on external_id, which every row then needs"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Validate and insert many rows of a table in one request
+    Valid rows are inserted in chunks; the rest come back as per-row errors
+    """
+    if table_slug not in BULK_TABLES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown table: {table_slug}"
+        )
+    table, model = BULK_TABLES[table_slug]
+    
+    try:
+        rows = await _read_bulk_rows(request)
+        result = await ingest_rows(DatabaseLayer(current_user["id"]), table, model, rows, upsert=upsert)
+        
+        if result["inserted"]:
+            result_cache.invalidate(current_user["id"], table)
+        
+        return BulkInsertResponse(**result)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to bulk insert {table_slug} rows: {str(e)}"
+        )
+
+@router.post("/{table_slug}/upload", response_model=BulkInsertResponse)
+async def upload_sheet(
+    table_slug: str,
+    file: UploadFile = File(...),
+    sheet: Optional[str] = Query(None, description="Workbook sheet name; the first sheet by default"),
+    header_row: int = Query(SHEET_HEADER_ROW, ge=0, description="0-based row holding the column titles"),
+    data_row: int = Query(SHEET_DATA_ROW, ge=1, description="0-based row the data starts on"),
+    upsert: bool = Query(False, description="Update rows whose natural key already exists instead of adding them; tables without one match rows on external_id, which every row then needs"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Load an .xlsx or .csv sheet in the source workbook layout into a table
+    Column titles are mapped to table columns and rows are streamed in chunks, never the whole file at once
+    """
+    if table_slug not in BULK_TABLES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown table: {table_slug}"
+        )
+    table, model = BULK_TABLES[table_slug]
+    
+    try:
+        chunks = read_sheet_chunks(file.file, file.filename, sheet, header_row, data_row)
+        result = await ingest_sheet(DatabaseLayer(current_user["id"]), table, model, chunks, upsert=upsert)
+        
+        if result["inserted"]:
+            result_cache.invalidate(current_user["id"], table)
+        
+        return BulkInsertResponse(**result)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload {table_slug} sheet: {str(e)}"
+        )
@@ -24,6 +24,49 @@ export interface ServiceCostRecord {
   doctor_name: string;
 }
 
+export interface CostAnalysisPage {
+  data: ServiceCostRecord[];
+  total_records: number;
+  generated_at: string;
+  offset: number;
+  limit: number;
+  next_offset: number | null;
+  sort_by: string | null;
+  sort_desc: boolean;
+}
+
+export interface CostAnalysisPageQuery {
+  month?: string;
+  year?: number;
+  department?: string;
+  service_name?: string;
+  patient_type?: string;
+  limit?: number;
+  offset?: number;
+  sort_by?: keyof ServiceCostRecord | 'total_cost';
+  sort_desc?: boolean;
+  doctor_name?: string;
+  min_total_cost?: number;
+}
+
+export interface ServiceCostTrendRecord {
+  month: string;
+  service_name: string;
+  cm: number;
+  ew: number;
+  hr: number;
+  cn: number;
+  total_cost: number;
+}
+
+export interface CostTrend {
+  year: number;
+  months: string[];
+  data: ServiceCostTrendRecord[];
+  total_records: number;
+  generated_at: string;
+}
+
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
 export function useCostAnalysis() {
@@ -74,6 +117,62 @@ export function useCostAnalysis() {
     }
   };
 
+  // Sorting, filtering and paging happen server-side against the cached result
+  const fetchCostAnalysisPage = async (query: CostAnalysisPageQuery = {}): Promise<CostAnalysisPage | null> => {
+    setIsLoading(true);
+    setError(null);
+    try {
+      const params = new URLSearchParams();
+      Object.entries(query).forEach(([key, value]) => {
+        if (value !== undefined && value !== null && value !== '') params.append(key, String(value));
+      });
+
+      const response = await fetch(`${API_BASE_URL}/api/cost-analysis/results?${params}`, {
+        headers: getHeaders()
+      });
+
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({ detail: 'Failed to fetch cost analysis' }));
+        throw new Error(errorData.detail || `HTTP ${response.status}`);
+      }
+
+      const page: CostAnalysisPage = await response.json();
+      setCostAnalysisData(page.data);
+      return page;
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'Failed to fetch cost analysis');
+      return null;
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
+  // Month x service costs of a year in one request, instead of one analysis run per month
+  const fetchCostTrend = async (year: number, months?: string[]): Promise<CostTrend | null> => {
+    setIsLoading(true);
+    setError(null);
+    try {
+      const params = new URLSearchParams({ year: year.toString() });
+      months?.forEach((month) => params.append('months', month));
+
+      const response = await fetch(`${API_BASE_URL}/api/cost-analysis/trend?${params}`, {
+        headers: getHeaders()
+      });
+
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({ detail: 'Failed to fetch cost trend' }));
+        throw new Error(errorData.detail || `HTTP ${response.status}`);
+      }
+
+      return await response.json();
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'Failed to fetch cost trend');
+      return null;
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   useEffect(() => {
     fetchCostAnalysis();
   }, []);
@@ -82,6 +181,8 @@ export function useCostAnalysis() {
     costAnalysisData,
     isLoading,
     error,
-    fetchCostAnalysis
+    fetchCostAnalysis,
+    fetchCostAnalysisPage,
+    fetchCostTrend
   };
 }
\ No newline at end of file
@@ -0,0 +1,22 @@
+/*
+  # Keyset Pagination Indexes
+
+  1. Indexes
+    - Add composite (user_id, id) indexes on every tenant table
+    - Backs the keyset reader in the backend database layer, which pages through
+      each table with `user_id = ? AND id > ? ORDER BY id LIMIT ?`
+*/
+
+CREATE INDEX IF NOT EXISTS idx_service_register_user_id_id ON service_register(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_trial_balance_user_id_id ON trial_balance(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_expense_wise_user_id_id ON expense_wise(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_variable_cost_bill_wise_user_id_id ON variable_cost_bill_wise(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_hr_data_user_id_id ON hr_data(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_occupancy_register_user_id_id ON occupancy_register(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_ot_register_user_id_id ON ot_register(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_consumption_data_user_id_id ON consumption_data(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_connected_load_user_id_id ON connected_load(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_fixed_asset_register_user_id_id ON fixed_asset_register(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_tat_data_user_id_id ON tat_data(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_cost_center_user_id_id ON cost_center(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_secondary_cost_driver_user_id_id ON secondary_cost_driver(user_id, id);
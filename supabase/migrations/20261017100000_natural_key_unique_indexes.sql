@@ -0,0 +1,102 @@
+/*
+  # Upsert Key Unique Indexes
+
+  1. Natural keys
+    - Add a unique index on the natural key of the tables that hold one row per key:
+      service_register, trial_balance, expense_wise, hr_data, occupancy_register,
+      consumption_data, cost_center
+    - Backs the batch upserts of the backend bulk and sheet upload endpoints, which
+      write `INSERT ... ON CONFLICT (<natural key>) DO UPDATE` one chunk at a time
+    - NULLS NOT DISTINCT, so rows missing an optional key column still match each other
+    - No rows are removed: where a table already repeats a key, its index is skipped
+      with a notice, and upserts into it fail until the duplicates are resolved and
+      this migration is re-run
+
+  2. External ids
+    - The other tables can legitimately repeat any combination of their columns, so
+      they get a nullable `external_id` column (the id of the row in the source system)
+      and a unique index on (user_id, external_id)
+    - Upserts into them match on external_id, and the backend refuses upserted rows
+      without one; plain inserts and existing rows are unaffected
+*/
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM service_register GROUP BY user_id, bill_no, service_name, service_date HAVING count(*) > 1) THEN
+    RAISE NOTICE 'Skipping idx_service_register_natural_key: service_register has rows repeating a natural key';
+  ELSE
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_service_register_natural_key ON service_register(user_id, bill_no, service_name, service_date) NULLS NOT DISTINCT;
+  END IF;
+END $$;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM trial_balance GROUP BY user_id, category_code, grouping_code, ledger_code HAVING count(*) > 1) THEN
+    RAISE NOTICE 'Skipping idx_trial_balance_natural_key: trial_balance has rows repeating a natural key';
+  ELSE
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_trial_balance_natural_key ON trial_balance(user_id, category_code, grouping_code, ledger_code) NULLS NOT DISTINCT;
+  END IF;
+END $$;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM expense_wise GROUP BY user_id, nature_of_data, ledger_code, sub_cost_centre_code HAVING count(*) > 1) THEN
+    RAISE NOTICE 'Skipping idx_expense_wise_natural_key: expense_wise has rows repeating a natural key';
+  ELSE
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_expense_wise_natural_key ON expense_wise(user_id, nature_of_data, ledger_code, sub_cost_centre_code) NULLS NOT DISTINCT;
+  END IF;
+END $$;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM hr_data GROUP BY user_id, associate_code, period, sub_cost_centre_code HAVING count(*) > 1) THEN
+    RAISE NOTICE 'Skipping idx_hr_data_natural_key: hr_data has rows repeating a natural key';
+  ELSE
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_hr_data_natural_key ON hr_data(user_id, associate_code, period, sub_cost_centre_code) NULLS NOT DISTINCT;
+  END IF;
+END $$;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM occupancy_register GROUP BY user_id, medical_record_number_or_registration_number_uhid, patient_admission_date, bed_number, the_date_time_at_which_patient_was_transferred_to_this_bed HAVING count(*) > 1) THEN
+    RAISE NOTICE 'Skipping idx_occupancy_register_natural_key: occupancy_register has rows repeating a natural key';
+  ELSE
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_occupancy_register_natural_key ON occupancy_register(user_id, medical_record_number_or_registration_number_uhid, patient_admission_date, bed_number, the_date_time_at_which_patient_was_transferred_to_this_bed) NULLS NOT DISTINCT;
+  END IF;
+END $$;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM consumption_data GROUP BY user_id, transaction_date, s_no HAVING count(*) > 1) THEN
+    RAISE NOTICE 'Skipping idx_consumption_data_natural_key: consumption_data has rows repeating a natural key';
+  ELSE
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_consumption_data_natural_key ON consumption_data(user_id, transaction_date, s_no) NULLS NOT DISTINCT;
+  END IF;
+END $$;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM cost_center GROUP BY user_id, cost_centre_code, sub_cost_centre_code HAVING count(*) > 1) THEN
+    RAISE NOTICE 'Skipping idx_cost_center_natural_key: cost_center has rows repeating a natural key';
+  ELSE
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_cost_center_natural_key ON cost_center(user_id, cost_centre_code, sub_cost_centre_code) NULLS NOT DISTINCT;
+  END IF;
+END $$;
+
+ALTER TABLE variable_cost_bill_wise ADD COLUMN IF NOT EXISTS external_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_variable_cost_bill_wise_external_id ON variable_cost_bill_wise(user_id, external_id);
+
+ALTER TABLE ot_register ADD COLUMN IF NOT EXISTS external_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ot_register_external_id ON ot_register(user_id, external_id);
+
+ALTER TABLE connected_load ADD COLUMN IF NOT EXISTS external_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_connected_load_external_id ON connected_load(user_id, external_id);
+
+ALTER TABLE fixed_asset_register ADD COLUMN IF NOT EXISTS external_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_fixed_asset_register_external_id ON fixed_asset_register(user_id, external_id);
+
+ALTER TABLE tat_data ADD COLUMN IF NOT EXISTS external_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tat_data_external_id ON tat_data(user_id, external_id);
+
+ALTER TABLE secondary_cost_driver ADD COLUMN IF NOT EXISTS external_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_secondary_cost_driver_external_id ON secondary_cost_driver(user_id, external_id);
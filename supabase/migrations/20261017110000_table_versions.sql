@@ -0,0 +1,169 @@
+/*
+  # Table Versions
+
+  1. New Tables
+    - `table_versions`: a change counter per user and tenant table
+    - Read by the backend result cache, which keys cached cost analyses on the
+      counters of their input tables, all of them in one small query
+
+  2. Triggers
+    - Statement-level triggers on every tenant table bump the counter of each user
+      whose rows an INSERT, UPDATE or DELETE touched, once per statement, so bulk
+      chunks cost one counter write rather than one per row
+    - Statements that touch no rows leave the counters as they are
+
+  3. Security
+    - Users can read their own counters; only the trigger function writes them
+*/
+
+CREATE TABLE IF NOT EXISTS table_versions (
+    user_id UUID NOT NULL,
+    table_name TEXT NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, table_name)
+);
+
+ALTER TABLE table_versions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own table versions" ON table_versions
+    FOR SELECT USING (user_id = auth.uid()::uuid);
+
+CREATE OR REPLACE FUNCTION bump_table_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO table_versions (user_id, table_name, version)
+    SELECT DISTINCT user_id, TG_TABLE_NAME, 1 FROM changed_rows
+    ON CONFLICT (user_id, table_name) DO UPDATE SET version = table_versions.version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS bump_service_register_version_on_insert ON service_register;
+CREATE TRIGGER bump_service_register_version_on_insert AFTER INSERT ON service_register
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_service_register_version_on_update ON service_register;
+CREATE TRIGGER bump_service_register_version_on_update AFTER UPDATE ON service_register
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_service_register_version_on_delete ON service_register;
+CREATE TRIGGER bump_service_register_version_on_delete AFTER DELETE ON service_register
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_trial_balance_version_on_insert ON trial_balance;
+CREATE TRIGGER bump_trial_balance_version_on_insert AFTER INSERT ON trial_balance
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_trial_balance_version_on_update ON trial_balance;
+CREATE TRIGGER bump_trial_balance_version_on_update AFTER UPDATE ON trial_balance
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_trial_balance_version_on_delete ON trial_balance;
+CREATE TRIGGER bump_trial_balance_version_on_delete AFTER DELETE ON trial_balance
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_expense_wise_version_on_insert ON expense_wise;
+CREATE TRIGGER bump_expense_wise_version_on_insert AFTER INSERT ON expense_wise
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_expense_wise_version_on_update ON expense_wise;
+CREATE TRIGGER bump_expense_wise_version_on_update AFTER UPDATE ON expense_wise
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_expense_wise_version_on_delete ON expense_wise;
+CREATE TRIGGER bump_expense_wise_version_on_delete AFTER DELETE ON expense_wise
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_variable_cost_bill_wise_version_on_insert ON variable_cost_bill_wise;
+CREATE TRIGGER bump_variable_cost_bill_wise_version_on_insert AFTER INSERT ON variable_cost_bill_wise
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_variable_cost_bill_wise_version_on_update ON variable_cost_bill_wise;
+CREATE TRIGGER bump_variable_cost_bill_wise_version_on_update AFTER UPDATE ON variable_cost_bill_wise
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_variable_cost_bill_wise_version_on_delete ON variable_cost_bill_wise;
+CREATE TRIGGER bump_variable_cost_bill_wise_version_on_delete AFTER DELETE ON variable_cost_bill_wise
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_hr_data_version_on_insert ON hr_data;
+CREATE TRIGGER bump_hr_data_version_on_insert AFTER INSERT ON hr_data
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_hr_data_version_on_update ON hr_data;
+CREATE TRIGGER bump_hr_data_version_on_update AFTER UPDATE ON hr_data
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_hr_data_version_on_delete ON hr_data;
+CREATE TRIGGER bump_hr_data_version_on_delete AFTER DELETE ON hr_data
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_occupancy_register_version_on_insert ON occupancy_register;
+CREATE TRIGGER bump_occupancy_register_version_on_insert AFTER INSERT ON occupancy_register
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_occupancy_register_version_on_update ON occupancy_register;
+CREATE TRIGGER bump_occupancy_register_version_on_update AFTER UPDATE ON occupancy_register
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_occupancy_register_version_on_delete ON occupancy_register;
+CREATE TRIGGER bump_occupancy_register_version_on_delete AFTER DELETE ON occupancy_register
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_ot_register_version_on_insert ON ot_register;
+CREATE TRIGGER bump_ot_register_version_on_insert AFTER INSERT ON ot_register
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_ot_register_version_on_update ON ot_register;
+CREATE TRIGGER bump_ot_register_version_on_update AFTER UPDATE ON ot_register
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_ot_register_version_on_delete ON ot_register;
+CREATE TRIGGER bump_ot_register_version_on_delete AFTER DELETE ON ot_register
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_consumption_data_version_on_insert ON consumption_data;
+CREATE TRIGGER bump_consumption_data_version_on_insert AFTER INSERT ON consumption_data
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_consumption_data_version_on_update ON consumption_data;
+CREATE TRIGGER bump_consumption_data_version_on_update AFTER UPDATE ON consumption_data
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_consumption_data_version_on_delete ON consumption_data;
+CREATE TRIGGER bump_consumption_data_version_on_delete AFTER DELETE ON consumption_data
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_connected_load_version_on_insert ON connected_load;
+CREATE TRIGGER bump_connected_load_version_on_insert AFTER INSERT ON connected_load
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_connected_load_version_on_update ON connected_load;
+CREATE TRIGGER bump_connected_load_version_on_update AFTER UPDATE ON connected_load
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_connected_load_version_on_delete ON connected_load;
+CREATE TRIGGER bump_connected_load_version_on_delete AFTER DELETE ON connected_load
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_fixed_asset_register_version_on_insert ON fixed_asset_register;
+CREATE TRIGGER bump_fixed_asset_register_version_on_insert AFTER INSERT ON fixed_asset_register
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_fixed_asset_register_version_on_update ON fixed_asset_register;
+CREATE TRIGGER bump_fixed_asset_register_version_on_update AFTER UPDATE ON fixed_asset_register
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_fixed_asset_register_version_on_delete ON fixed_asset_register;
+CREATE TRIGGER bump_fixed_asset_register_version_on_delete AFTER DELETE ON fixed_asset_register
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_tat_data_version_on_insert ON tat_data;
+CREATE TRIGGER bump_tat_data_version_on_insert AFTER INSERT ON tat_data
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_tat_data_version_on_update ON tat_data;
+CREATE TRIGGER bump_tat_data_version_on_update AFTER UPDATE ON tat_data
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_tat_data_version_on_delete ON tat_data;
+CREATE TRIGGER bump_tat_data_version_on_delete AFTER DELETE ON tat_data
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_cost_center_version_on_insert ON cost_center;
+CREATE TRIGGER bump_cost_center_version_on_insert AFTER INSERT ON cost_center
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_cost_center_version_on_update ON cost_center;
+CREATE TRIGGER bump_cost_center_version_on_update AFTER UPDATE ON cost_center
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_cost_center_version_on_delete ON cost_center;
+CREATE TRIGGER bump_cost_center_version_on_delete AFTER DELETE ON cost_center
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS bump_secondary_cost_driver_version_on_insert ON secondary_cost_driver;
+CREATE TRIGGER bump_secondary_cost_driver_version_on_insert AFTER INSERT ON secondary_cost_driver
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_secondary_cost_driver_version_on_update ON secondary_cost_driver;
+CREATE TRIGGER bump_secondary_cost_driver_version_on_update AFTER UPDATE ON secondary_cost_driver
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS bump_secondary_cost_driver_version_on_delete ON secondary_cost_driver;
+CREATE TRIGGER bump_secondary_cost_driver_version_on_delete AFTER DELETE ON secondary_cost_driver
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();